@@ -33,7 +33,13 @@ from   pyflyby._interactive     import (disable_auto_importer,
                                         unload_ipython_extension)
 from   pyflyby._livepatch       import livepatch, xreload
 from   pyflyby._log             import logger
-from   pyflyby._modules         import rebuild_import_cache
+from   pyflyby._modules         import (enable_import_profiling,
+                                        get_import_profiles,
+                                        import_cache_stats,
+                                        invalidate_import_cache,
+                                        rebuild_import_cache,
+                                        reset_import_cache_stats,
+                                        start_import_cache_warmer)
 from   pyflyby._parse           import PythonBlock, PythonStatement
 from   pyflyby._saveframe       import saveframe
 from   pyflyby._saveframe_reader \
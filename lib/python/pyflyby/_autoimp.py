@@ -8,12 +8,14 @@ from __future__ import annotations, print_function
 
 import ast
 import builtins
+from   collections              import OrderedDict
 from   collections.abc          import Sequence
 import contextlib
 import copy
 from   dataclasses              import field
 
 import logging
+import opcode
 from   pyflyby._file            import FileText, Filename
 from   pyflyby._flags           import CompilerFlags
 from   pyflyby._idents          import (BadDottedIdentifierError,
@@ -21,16 +23,23 @@ from   pyflyby._idents          import (BadDottedIdentifierError,
 from   pyflyby._importdb        import ImportDB
 from   pyflyby._importstmt      import Import
 from   pyflyby._log             import logger
-from   pyflyby._modules         import ModuleHandle
+from   pyflyby._modules         import (ModuleHandle,
+                                        clear_missing_modules_cache,
+                                        is_known_missing_module,
+                                        parallel_prefetch_enabled,
+                                        prefetch_modules, profile_import,
+                                        record_missing_module)
 from   pyflyby._parse           import (PythonBlock, _is_ast_str,
                                         infer_compile_mode)
 from   pyflyby._util            import _has_ignore_pragma
 
+import re
 import sys
 import types
 from   types                    import EllipsisType, NoneType
-from   typing                   import (Any, Callable, Dict, Iterator, List,
-                                        Optional, Set, Tuple, Union)
+from   typing                   import (Any, Callable, Dict, FrozenSet,
+                                        Iterator, List, Optional, Set, Tuple,
+                                        Union)
 
 
 if sys.version_info >= (3, 13):
@@ -74,6 +83,10 @@ class ScopeStack(Sequence):
     Ordered from most-global to most-local.
     Builtins are always included.
     Duplicates are removed.
+
+    A ``ScopeStack`` is never modified once built; entering a scope makes a
+    new ``ScopeStack`` that shares the namespaces of the old one.  The
+    namespaces themselves are mutable.
     """
 
     _cached_has_star_import = False
@@ -96,9 +109,14 @@ class ScopeStack(Sequence):
         :rtype:
           ``ScopeStack``
         """
+        if _class_delayed is None:
+            _class_delayed = {}
         if isinstance(arg, ScopeStack):
-            scopes = list(arg._tup)
-        elif isinstance(arg, dict):
+            # Already checked and deduplicated.
+            self._tup = arg._tup
+            self._class_delayed = _class_delayed
+            return
+        if isinstance(arg, dict):
             scopes = [arg]
         elif isinstance(arg, (tuple, list)):
             scopes = list(arg)
@@ -125,20 +143,38 @@ class ScopeStack(Sequence):
 
         # class name definitions scope may need to be delayed.
         # so we store them separately, and if they are present in methods def, we can readd them
-        if _class_delayed is None:
-            _class_delayed = {}
         self._class_delayed = _class_delayed
 
+    @classmethod
+    def _from_tuple(
+        cls, tup: Tuple[Dict[str, Any], ...], _class_delayed: Dict[str, Any]
+    ) -> ScopeStack:
+        """
+        Construct a ``ScopeStack`` from a tuple of namespaces that already
+        starts with the builtins and has no duplicates, without checking it
+        again.
+        """
+        self = object.__new__(cls)
+        self._tup = tup
+        self._class_delayed = _class_delayed
+        return self
+
     def __contains__(self, item: object) -> bool:
         if isinstance(item, DottedIdentifier):
             item = item.name
         if isinstance(item, str):
-            for sub in self:
-                if item in sub.keys():
+            for sub in self._tup:
+                if item in sub:
                     return True
 
         return False
 
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        return iter(self._tup)
+
+    def __reversed__(self) -> Iterator[Dict[str, Any]]:
+        return reversed(self._tup)
+
     def __getitem__(self, item: Union[int, slice]) -> Any:
         if isinstance(item, slice):
             return self.__class__(self._tup[item])
@@ -166,30 +202,41 @@ class ScopeStack(Sequence):
         :rtype:
           ``ScopeStack``
         """
-        if include_class_scopes:
-            scopes = tuple(self)
-        else:
-            scopes = tuple(s for s in self if not isinstance(s, _ClassScope))
+        scopes = self._tup
+        if not include_class_scopes:
+            scopes = tuple(s for s in scopes if not isinstance(s, _ClassScope))
         new_scope: Union[_ClassScope, Dict[str, Any]]
         if new_class_scope:
             new_scope = _ClassScope()
         else:
             new_scope = {}
-        cls = type(self)
-        if unhide_classdef and self._class_delayed:
-            scopes = tuple([self._class_delayed]) + scopes
-        result = cls(scopes + (new_scope,), _class_delayed=self._class_delayed)
-        return result
+        class_delayed = self._class_delayed
+        if unhide_classdef and class_delayed:
+            # Class names go right after the builtins.
+            scopes = scopes[:2] + (class_delayed,) + tuple(
+                s for s in scopes[2:] if s is not class_delayed)
+        return self._from_tuple(scopes + (new_scope,), class_delayed)
 
     def clone_top(self) -> ScopeStack:
         """
         Return a new ``ScopeStack`` referencing the same namespaces as ``self``,
         but cloning the topmost namespace (and aliasing the others).
         """
-        scopes = list(self)
-        scopes[-1] = copy.copy(scopes[-1])
-        cls = type(self)
-        return cls(scopes)
+        return self._from_tuple(
+            self._tup[:-1] + (copy.copy(self._tup[-1]),), {})
+
+    def _clone_top_after_miss(self) -> ScopeStack:
+        """
+        Like `clone_top`, for deferring a lookup that just found nothing in
+        the topmost namespace.
+
+        Names stored in the topmost namespace later must not satisfy the
+        deferred lookup, and the names stored there so far didn't.  So instead
+        of copying the topmost namespace, replace it with an empty one, only
+        keeping a star import, which still suppresses the lookup.
+        """
+        top: Dict[str, Any] = {"*": None} if "*" in self._tup[-1] else {}
+        return self._from_tuple(self._tup[:-1] + (top,), {})
 
     def merged_to_two(self) -> Tuple[Dict[str, Any], Dict[str, Any]]:
         """
@@ -213,7 +260,7 @@ class ScopeStack(Sequence):
         if len(self) == 2:
             return tuple(self)
         d = {}
-        for scope in self[:-1]:
+        for scope in self._tup[:-1]:
             d.update(scope)
         # Return as a 2-tuple.  We don't cast the result to ScopeStack because
         # it may add __builtins__ again, creating something of length 3.
@@ -227,7 +274,7 @@ class ScopeStack(Sequence):
         """
         if self._cached_has_star_import:
             return True
-        if any('*' in scope for scope in self):
+        if any('*' in scope for scope in self._tup):
             # There was a star import.  Cache that fact before returning.  We
             # can cache a positive result because a star import can't be undone.
             self._cached_has_star_import = True
@@ -288,20 +335,23 @@ def symbol_needs_import(
     :return:
       ``True`` if ``fullname`` needs import, else ``False``
     """
-    namespaces = ScopeStack(namespaces)
+    if not isinstance(namespaces, ScopeStack):
+        namespaces = ScopeStack(namespaces)
     fullname = DottedIdentifier(fullname)
-    partial_names = fullname.prefixes[::-1]
+    partial_names = [(p, p.name) for p in reversed(fullname.prefixes)]
+    scopes = namespaces._tup
     # Iterate over local scopes.
-    for ns_idx, ns in reversed(list(enumerate(namespaces))):
+    for ns_idx in range(len(scopes) - 1, -1, -1):
+        ns = scopes[ns_idx]
         # Iterate over partial names: "foo.bar.baz.quux", "foo.bar.baz", ...
-        for partial_name in partial_names:
+        for partial_name, pname in partial_names:
             # Check if this partial name was imported/assigned in this
             # scope.  In the common case, there will only be one namespace
-            # in the namespace stack, i.e. the user globals.
-            try:
-                var = ns[str(partial_name)]
-            except KeyError:
+            # in the namespace stack, i.e. the user globals.  Most lookups
+            # miss, so test membership first rather than catch KeyError.
+            if pname not in ns:
                 continue
+            var = ns[pname]
             # If we're doing static analysis where we also care about which
             # imports are unused, then mark the used ones now.
             if isinstance(var, _UseChecker):
@@ -313,7 +363,6 @@ def symbol_needs_import(
             # globally).  Let's check if foo.bar already has a "baz".
             prefix_len = len(partial_name.parts)
             suffix_parts = fullname.parts[prefix_len:]
-            pname = str(partial_name)
             for part in suffix_parts:
                 # Check if the var so far is a module -- in fact that it's
                 # *the* module of a given name.  That is, for var ==
@@ -405,6 +454,134 @@ class _UseChecker:
         return f"<{type(self).__name__}: name:{self.name!r} source:{self.source!r} lineno:{self.lineno} used:{self.used} scope_name:{self.scope_name!r} used_in_scopes:{self.used_in_scopes!r}>"
 
 
+# States of a name in a module-level scope, as observed by `_RecordingScope`.
+_ABSENT, _ASSIGNED, _UNUSED_IMPORT, _USED_IMPORT = range(4)
+
+
+def _scope_state(scope: Dict[str, Any], key: str) -> int:
+    if not dict.__contains__(scope, key):
+        return _ABSENT
+    value = dict.__getitem__(scope, key)
+    if not isinstance(value, _UseChecker):
+        return _ASSIGNED
+    return _USED_IMPORT if value.used else _UNUSED_IMPORT
+
+
+class _RecordingScope(dict):
+    """
+    A module-level scope that logs every lookup and store made through it.
+
+    Used by `_MissingImportFinder._scan_module_incrementally` to record how a
+    top-level statement interacts with the module globals (``tag="g"``) and
+    with the delayed class names (``tag="c"``), so that the statement's
+    effects can later be replayed without visiting it again.
+    """
+
+    def __init__(self, tag: str, finder: "_MissingImportFinder") -> None:
+        super().__init__()
+        self.tag = tag
+        self.finder = finder
+        self.events: Optional[List[Tuple[Any, ...]]] = None
+
+    def __getitem__(self, key: str) -> Any:
+        events = self.events
+        if events is None:
+            return super().__getitem__(key)
+        try:
+            value = super().__getitem__(key)
+        except KeyError:
+            events.append(("get", self.tag, key, False, None))
+            raise
+        stack = self.finder._scope_name_stack
+        events.append(("get", self.tag, key, True, stack[-1] if stack else None))
+        return value
+
+    def get(self, key: str, default: Any = None) -> Any:
+        if self.events is not None:
+            self.events.append(("peek", self.tag, key, _scope_state(self, key)))
+        return super().get(key, default)
+
+    def __contains__(self, key: object) -> bool:
+        result = super().__contains__(key)
+        if self.events is not None:
+            self.events.append(("has", self.tag, key, result))
+        return result
+
+    def __setitem__(self, key: str, value: Any) -> None:
+        if self.events is not None:
+            self.events.append(("set", self.tag, key, value))
+        super().__setitem__(key, value)
+
+    def __delitem__(self, key: str) -> None:
+        if self.events is not None:
+            self.events.append(("del", self.tag, key))
+        super().__delitem__(key)
+
+
+_RelativeLineno = Union[None, int, Tuple[int]]
+"""
+A line number as stored in a `_StatementSummary`; see `_relative_lineno`.
+"""
+
+
+class _StatementSummary:
+    """
+    The recorded effect of one top-level statement on a module scan.
+
+    Line numbers are relative to the first line of the statement, so that a
+    summary stays valid when lines are inserted or removed above it.
+    """
+
+    __slots__ = ("events", "unused_imports", "deferred_loads")
+
+    def __init__(
+        self,
+        events: List[Tuple[Any, ...]],
+        unused_imports: List[Tuple[_RelativeLineno, Any, Optional[str]]],
+        deferred_loads: List[Tuple[str, _RelativeLineno, Optional[str], bool]],
+    ) -> None:
+        self.events = events
+        self.unused_imports = unused_imports
+        self.deferred_loads = deferred_loads
+
+
+_STATEMENT_SUMMARY_CACHE_SIZE = 8192
+
+_statement_summaries: OrderedDict[Tuple[Any, ...], _StatementSummary] = OrderedDict()
+"""
+LRU cache of `_StatementSummary` by top-level statement source, used by
+``scan_for_import_issues(..., incremental=True)``.
+"""
+
+
+def _relative_lineno(
+    lineno: Optional[int], firstline: int, lastline: int
+) -> _RelativeLineno:
+    """
+    Make ``lineno`` relative to a statement spanning ``firstline`` to
+    ``lastline``.  Line numbers outside the statement (e.g. from parsed type
+    comments) are kept as is, wrapped in a 1-tuple.
+    """
+    if lineno is None:
+        return None
+    if firstline <= lineno <= lastline:
+        return lineno - firstline
+    return (lineno,)
+
+
+def _absolute_lineno(
+    lineno: _RelativeLineno, firstline: int
+) -> Optional[int]:
+    """
+    Inverse of `_relative_lineno`.
+    """
+    if lineno is None:
+        return None
+    if isinstance(lineno, tuple):
+        return lineno[0]
+    return lineno + firstline
+
+
 class _MissingImportFinder:
     """
     A helper class to be used only by `_find_missing_imports_in_ast`.
@@ -497,6 +674,9 @@ class _MissingImportFinder:
         self._scope_name_stack: List[str] = []
         # Source lines for pragma checking (set by scan_for_import_issues)
         self._source_lines: Optional[list[str]] = None
+        # Event log of the top-level statement being recorded, in incremental
+        # mode.  See `_scan_module_incrementally`.
+        self._events: Optional[List[Tuple[Any, ...]]] = None
 
     def find_missing_imports(self, node: ast.AST) -> List[DottedIdentifier]:
         self._scan_node(node)
@@ -513,9 +693,202 @@ class _MissingImportFinder:
         finally:
             self.scopestack = oldscopestack
 
+    def _scan_module_incrementally(self, node: ast.Module) -> None:
+        """
+        Like `_scan_node`, but reuse what was recorded for top-level
+        statements that were scanned before.
+
+        Each top-level statement is visited with the module globals wrapped in
+        a `_RecordingScope`, and the result is kept as a `_StatementSummary`
+        keyed by the statement's source.  On a later scan, a statement whose
+        source is unchanged, and whose recorded lookups still observe the same
+        module scope, is replayed from its summary instead of being visited.
+        Loads from function bodies that could not be resolved locally are
+        always re-checked against the final module scope, so defining or
+        removing a global also updates the functions that reference it.
+        """
+        source_lines = self._source_lines
+        if not isinstance(node, ast.Module) or source_lines is None:
+            self._scan_node(node)
+            return
+        oldscopestack = self.scopestack
+        myglobals = _RecordingScope("g", self)
+        class_delayed = _RecordingScope("c", self)
+        self.scopestack = ScopeStack(list(oldscopestack)[:-1] + [myglobals],
+                                     _class_delayed=class_delayed)
+        outer_scopes = set(map(id, self.scopestack)) | {id(class_delayed)}
+        deferred_loads: List[Tuple[str, Optional[int], Optional[str], bool]] = []
+        for stmt in node.body:
+            firstline = min([stmt.lineno] + [
+                d.lineno for d in getattr(stmt, "decorator_list", [])])
+            key = ("\n".join(source_lines[firstline - 1:stmt.end_lineno]),
+                   stmt.col_offset, stmt.end_col_offset,
+                   bool(self.find_unused_imports))
+            summary = _statement_summaries.get(key)
+            if summary is not None and self._replay_statement(summary, firstline):
+                _statement_summaries.move_to_end(key)
+            else:
+                summary = self._record_statement(stmt, firstline, outer_scopes,
+                                                 myglobals, class_delayed)
+                _statement_summaries[key] = summary
+                if len(_statement_summaries) > _STATEMENT_SUMMARY_CACHE_SIZE:
+                    _statement_summaries.popitem(last=False)
+            deferred_loads.extend(
+                (fullname, _absolute_lineno(lineno, firstline), scope_name, classes)
+                for fullname, lineno, scope_name, classes in summary.deferred_loads)
+        if dict.__contains__(myglobals, "*"):
+            # A star import hides every missing import after it, which the
+            # recorded lookups don't capture.  Rescan from scratch.
+            logger.debug("incremental scan: star import; rescanning")
+            self.scopestack = oldscopestack
+            self.missing_imports = []
+            self.unused_imports = []
+            self._scan_node(node)
+            return
+        self._check_deferred_loads(deferred_loads, class_delayed)
+
+    def _record_statement(
+        self,
+        stmt: ast.stmt,
+        firstline: int,
+        outer_scopes: Set[int],
+        myglobals: _RecordingScope,
+        class_delayed: _RecordingScope,
+    ) -> _StatementSummary:
+        """
+        Visit a top-level statement and record its effect on the module scan.
+        Helper for `_scan_module_incrementally`, which passes the recording
+        module and delayed-class scopes it put on the scope stack.
+        """
+        events: List[Tuple[Any, ...]] = []
+        num_unused = len(self.unused_imports)
+        self._events = myglobals.events = class_delayed.events = events
+        try:
+            self.visit(stmt)
+        finally:
+            self._events = myglobals.events = class_delayed.events = None
+        lastline = stmt.end_lineno or firstline
+        for i, event in enumerate(events):
+            if event[0] == "set" and isinstance(event[3], _UseChecker):
+                checker = event[3]
+                events[i] = event[:3] + ((
+                    checker.name, checker.source,
+                    _relative_lineno(checker.lineno, firstline, lastline), checker.scope_name),)
+            elif event[0] == "missing":
+                events[i] = ("missing", _relative_lineno(event[1], firstline, lastline)) + event[2:]
+        # Unused imports in function and class scopes are final once the
+        # statement is visited.  Redefined module-level imports are not
+        # recorded here: replaying the store finds them again.
+        unused_imports: List[Tuple[_RelativeLineno, Any, Optional[str]]] = [
+            (_relative_lineno(lineno, firstline, lastline), source, scope_name)
+            for lineno, source, scope_name in self.unused_imports[num_unused:]
+            if scope_name is not None]
+        # Resolve deferred loads against the statement's own local scopes,
+        # which are complete now.  A name defined there, or a star import
+        # there, settles the check.  What is left only depends on the module
+        # scope, and gets checked once every statement has been scanned.
+        deferred_loads: List[Tuple[str, _RelativeLineno, Optional[str],
+                                   bool]] = []
+        for fullname, scopestack, lineno, scope_name in self._deferred_load_checks:
+            local_scopes = [s for s in scopestack if id(s) not in outer_scopes]
+            prefixes = [str(p) for p in DottedIdentifier(fullname).prefixes]
+            prefixes.append("*")
+            if any(p in scope for scope in local_scopes for p in prefixes):
+                continue
+            deferred_loads.append((
+                fullname, _relative_lineno(lineno, firstline, lastline), scope_name,
+                any(s is class_delayed for s in scopestack)))
+        self._deferred_load_checks = []
+        return _StatementSummary(events, unused_imports, deferred_loads)
+
+    def _replay_statement(self, summary: _StatementSummary, firstline: int) -> bool:
+        """
+        Apply a recorded `_StatementSummary` at line ``firstline``.
+
+        Return ``False``, without changing anything, if the module scope no
+        longer looks the way it did when the statement was recorded.
+        """
+        scopes = {"g": self.scopestack[-1], "c": self.scopestack._class_delayed}
+        # Check every lookup first, simulating the statement's own stores.
+        overlay: Dict[Tuple[str, str], int] = {}
+        for event in summary.events:
+            kind = event[0]
+            if kind in ("missing", "unmiss"):
+                continue
+            tag, name = event[1], event[2]
+            state = overlay.get((tag, name))
+            if state is None:
+                state = _scope_state(scopes[tag], name)
+            if kind == "get" or kind == "has":
+                if (state != _ABSENT) != event[3]:
+                    return False
+                if kind == "get" and state == _UNUSED_IMPORT:
+                    overlay[tag, name] = _USED_IMPORT
+            elif kind == "peek":
+                if state != event[3]:
+                    return False
+            elif kind == "set":
+                overlay[tag, name] = _ASSIGNED if event[3] is None else _UNUSED_IMPORT
+            else:
+                overlay[tag, name] = _ABSENT
+        for event in summary.events:
+            kind = event[0]
+            if kind == "get":
+                _, tag, name, found, scope_name = event
+                value = dict.get(scopes[tag], name) if found else None
+                if isinstance(value, _UseChecker):
+                    value.used = True
+                    value.mark_used_in_scope(scope_name)
+            elif kind == "set":
+                _, tag, name, value = event
+                scope = scopes[tag]
+                if tag == "g" and self.find_unused_imports:
+                    oldvalue = dict.get(scope, name)
+                    if isinstance(oldvalue, _UseChecker) and not oldvalue.used:
+                        self.unused_imports.append(
+                            (oldvalue.lineno, oldvalue.source, oldvalue.scope_name))
+                if value is not None:
+                    checker_name, source, lineno, scope_name = value
+                    value = _UseChecker(checker_name, source,
+                                        _absolute_lineno(lineno, firstline),
+                                        scope_name=scope_name)
+                dict.__setitem__(scope, name, value)
+            elif kind == "del":
+                dict.__delitem__(scopes[event[1]], event[2])
+            elif kind == "missing":
+                _, lineno, fullname, in_class_scope, in_class_def = event
+                self._add_missing_import(
+                    _absolute_lineno(lineno, firstline),
+                    DottedIdentifier(fullname, scope_info={
+                        "in_class_scope": in_class_scope,
+                        "_in_class_def": in_class_def}))
+            elif kind == "unmiss":
+                self._remove_from_missing_imports(event[1])
+        self.unused_imports.extend(
+            (_absolute_lineno(lineno, firstline), source, scope_name)
+            for lineno, source, scope_name in summary.unused_imports)
+        return True
+
+    def _check_deferred_loads(
+        self,
+        deferred_loads: List[Tuple[str, Optional[int], Optional[str], bool]],
+        class_delayed: Dict[str, Any],
+    ) -> None:
+        """
+        Check loads recorded by `_record_statement` against the final module
+        scope.  Equivalent to `_finish_deferred_load_checks`.
+        """
+        scopestack = self.scopestack
+        with_classes = ScopeStack([class_delayed] + list(scopestack))
+        old_scope_stack = self._scope_name_stack
+        for fullname, lineno, scope_name, classes in deferred_loads:
+            self._scope_name_stack = [scope_name] if scope_name else []
+            self._check_load(fullname, with_classes if classes else scopestack,
+                             lineno)
+        self._scope_name_stack = old_scope_stack
 
     def scan_for_import_issues(
-        self, codeblock: PythonBlock
+        self, codeblock: PythonBlock, incremental: bool = False
     ) -> Tuple[
         List[Tuple[Optional[int], DottedIdentifier]],
         List[Tuple[Optional[int], Any, Optional[str]]],
@@ -526,7 +899,10 @@ class _MissingImportFinder:
             codeblock = PythonBlock(codeblock)
         self._source_lines = str(codeblock.text).split("\n")
         node = codeblock.ast_node
-        self._scan_node(node)
+        if incremental:
+            self._scan_module_incrementally(node)
+        else:
+            self._scan_node(node)
         # Get missing imports now, before handling docstrings.  We don't want
         # references in doctests to be noted as missing-imports.  For now we
         # just let the code accumulate into self.missing_imports and ignore
@@ -1162,14 +1538,12 @@ class _MissingImportFinder:
                     if symbol_needs_import(
                         ancestor, self.scopestack, using_scope_name=current_scope
                     ):
-                        m = (
+                        self._add_missing_import(
                             self._lineno,
                             DottedIdentifier(
                                 fullname, scope_info=self._get_scope_info()
                             ),
                         )
-                        if m not in self.missing_imports:
-                            self.missing_imports.append(m)
             # If we're redefining something, and it has not been used, then
             # record it as unused.
             oldvalue = scope.get(fullname)
@@ -1180,6 +1554,8 @@ class _MissingImportFinder:
         scope[fullname] = value
 
     def _remove_from_missing_imports(self, fullname: str) -> None:
+        if self._events is not None:
+            self._events.append(("unmiss", fullname))
         for missing_import in list(self.missing_imports):
             # If it was defined inside a class method, then it wouldn't have been added to
             # the missing imports anyways (except in that case of annotations)
@@ -1190,8 +1566,7 @@ class _MissingImportFinder:
             missing_ident = missing_import[1]
             if not missing_ident.startswith(fullname):
                 continue
-            scopestack = missing_ident.scope_info['scopestack']  # type: ignore[index]
-            in_class_scope = isinstance(scopestack[-1], _ClassScope)
+            in_class_scope = missing_ident.scope_info['in_class_scope']  # type: ignore[index]
             inside_class = missing_ident.scope_info.get('_in_class_def')  # type: ignore[union-attr]
             # Remove if it's in class scope or not inside a class definition
             # Also remove if it's a simple identifier (forward reference in type annotation)
@@ -1203,7 +1578,7 @@ class _MissingImportFinder:
 
     def _get_scope_info(self) -> Dict[str, Any]:
         return {
-            "scopestack": self.scopestack,
+            "in_class_scope": isinstance(self.scopestack[-1], _ClassScope),
             "_in_class_def": self._in_class_def,
         }
 
@@ -1251,7 +1626,8 @@ class _MissingImportFinder:
         if symbol_needs_import(
             fullname, self.scopestack, using_scope_name=current_scope
         ):
-            data = (fullname, self.scopestack.clone_top(), self._lineno, current_scope)
+            data = (fullname, self.scopestack._clone_top_after_miss(),
+                    self._lineno, current_scope)
             self._deferred_load_checks.append(data)
 
     def _visit_Load_immediate(self, fullname: str) -> None:
@@ -1311,8 +1687,18 @@ class _MissingImportFinder:
             symbol_needs_import(fullname, scopestack, using_scope_name=current_scope)
             and not scopestack.has_star_import()
         ):
-            if (lineno, fullname) not in self.missing_imports:
-                self.missing_imports.append((lineno, fullname))
+            self._add_missing_import(lineno, fullname)
+
+    def _add_missing_import(
+        self, lineno: Optional[int], fullname: DottedIdentifier
+    ) -> None:
+        if self._events is not None:
+            info = fullname.scope_info or {}
+            self._events.append(
+                ("missing", lineno, fullname.name,
+                 info.get("in_class_scope", False), info.get("_in_class_def", 0)))
+        if (lineno, fullname) not in self.missing_imports:
+            self.missing_imports.append((lineno, fullname))
 
     def _finish_deferred_load_checks(self) -> None:
         for item in self._deferred_load_checks:
@@ -1411,6 +1797,7 @@ def scan_for_import_issues(
     codeblock: Union[PythonBlock, str, FileText, Filename],
     find_unused_imports: bool = True,
     parse_docstrings: bool = False,
+    incremental: bool = False,
 ) -> Tuple[
     List[Tuple[Optional[int], DottedIdentifier]],
     List[Tuple[Optional[int], Any, Optional[str]]],
@@ -1440,6 +1827,13 @@ def scan_for_import_issues(
         >>> scan_for_import_issues("import foo as bar, baz\\n'{bar}'\\n", parse_docstrings=True)
         ([], [(1, Import('import baz'), None)])
 
+    :param incremental:
+      Whether to reuse the analysis of top-level statements that were already
+      scanned, e.g. in a previous version of the same file.  Unchanged
+      statements are replayed rather than re-walked, so rescanning a large
+      module after a small edit costs roughly the size of the edit.  The
+      result is the same as without ``incremental``.
+
     """
     logger.debug("global scan_for_import_issues()")
     if not isinstance(codeblock, PythonBlock):
@@ -1448,7 +1842,7 @@ def scan_for_import_issues(
     finder = _MissingImportFinder(namespaces,
                                   find_unused_imports=find_unused_imports,
                                   parse_docstrings=parse_docstrings)
-    return finder.scan_for_import_issues(codeblock)
+    return finder.scan_for_import_issues(codeblock, incremental=incremental)
 
 
 def _find_missing_imports_in_ast(
@@ -1480,6 +1874,63 @@ def _find_missing_imports_in_ast(
                  find_unused_imports=False,
                  parse_docstrings=False).find_missing_imports(node)
 
+_MISSING_IMPORTS_CACHE_SIZE = 1024
+
+_missing_imports_by_source: OrderedDict[Tuple[Any, ...], Tuple[DottedIdentifier, ...]] = OrderedDict()
+"""
+LRU cache of the names that `_find_missing_imports_in_ast` finds in a piece of
+code against an empty namespace, keyed by the source text, `PythonBlock`, or
+AST dump of the code.  Used by `find_missing_imports` so that re-running the
+same code (e.g. an IPython cell, or ``%timeit``) doesn't repeat the analysis.
+"""
+
+
+def _find_missing_imports_in_source(
+    key: Tuple[Any, ...],
+    get_node: Callable[[], ast.AST],
+    namespaces: ScopeStack,
+) -> List[DottedIdentifier]:
+    """
+    Find missing imports in the code identified by ``key``, using
+    `_missing_imports_by_source`.
+    Helper function to `find_missing_imports`.
+
+    The cached candidates are the names that would need import if nothing but
+    builtins were defined.  The analysis only ever adds names to its own
+    scopes, so a name is missing given ``namespaces`` exactly when it is a
+    candidate and `symbol_needs_import` says so.  A star import in
+    ``namespaces`` hides every name, so that case bypasses the cache.
+
+      >>> key = ("str", "numpy.arange(x) + arange(y)")
+      >>> get_node = lambda: ast.parse(key[1])
+      >>> [str(m) for m in _find_missing_imports_in_source(key, get_node, ScopeStack([{"y": 3}]))]
+      ['arange', 'numpy.arange', 'x']
+      >>> [str(m) for m in _find_missing_imports_in_source(key, get_node, ScopeStack([{"x": 3}]))]
+      ['arange', 'numpy.arange', 'y']
+
+    :param key:
+      Hashable description of the code: its kind and its source.
+    :param get_node:
+      Callable returning the parsed code, called on a cache miss.
+    :rtype:
+      ``list`` of ``DottedIdentifier``
+    """
+    if namespaces.has_star_import():
+        return _find_missing_imports_in_ast(get_node(), namespaces)
+    candidates = _missing_imports_by_source.get(key)
+    if candidates is None:
+        candidates = tuple(_find_missing_imports_in_ast(get_node(), [{}]))
+        _missing_imports_by_source[key] = candidates
+        if len(_missing_imports_by_source) > _MISSING_IMPORTS_CACHE_SIZE:
+            _missing_imports_by_source.popitem(last=False)
+    else:
+        try:
+            _missing_imports_by_source.move_to_end(key)
+        except KeyError:
+            pass
+    return [fullname for fullname in candidates
+            if symbol_needs_import(fullname, namespaces)]
+
 # TODO: maybe we should replace _find_missing_imports_in_ast with
 # _find_missing_imports_in_code(compile(node)).  The method of parsing opcodes
 # is simpler, because Python takes care of the scoping issue for us and we
@@ -1524,7 +1975,7 @@ def _find_loads_without_stores_in_code(
 ) -> None:
     """
     Find global LOADs without corresponding STOREs, by disassembling code.
-    Recursive helper for `_find_missing_imports_in_code`.
+    Helper for `_find_missing_imports_in_code`.
 
     :type co:
       ``types.CodeType``
@@ -1541,33 +1992,68 @@ def _find_loads_without_stores_in_code(
         raise TypeError(
             "_find_loads_without_stores_in_code(): expected a CodeType; got a %s"
             % (type(co).__name__,))
-    # Initialize local constants for fast access.
-    from opcode import EXTENDED_ARG, opmap
-
-    LOAD_ATTR    = opmap['LOAD_ATTR']
-    # LOAD_METHOD is _supposed_ to be removed in 3.12 but still present in opmap
-    # it was actually removed in 3.14
-    if sys.version_info < (3, 12):
-        LOAD_METHOD = opmap["LOAD_METHOD"]
-    else:
-        # Just delete any ref to LOAD_METHOD once we drop <3.12
-        LOAD_METHOD = None
-    LOAD_GLOBAL = opmap["LOAD_GLOBAL"]
-    LOAD_NAME = opmap["LOAD_NAME"]
-    STORE_ATTR = opmap["STORE_ATTR"]
-    STORE_GLOBAL = opmap["STORE_GLOBAL"]
-    STORE_NAME = opmap["STORE_NAME"]
-
-    if sys.version_info > (3, 11):
-        CACHE = opmap["CACHE"]
-    else:
-        CACHE = object()
-    # Keep track of the partial name so far that started with a LOAD_GLOBAL.
-    # If ``pending`` is not None, then it is a list representing the name
-    # components we've seen so far.
-    pending = None
-    # Disassemble the code.  Look for LOADs and STOREs.  This code is based on
-    # ``dis.disassemble``.
+    loads_without_stores.update(_code_loads_without_stores(co))
+
+
+_CODE_SCAN_CACHE_SIZE = 4096
+
+_code_scan_results: OrderedDict[types.CodeType, FrozenSet[str]] = OrderedDict()
+"""
+LRU cache of the loads without stores in a code object and the code objects
+nested in it, by code object.  Code objects compare equal (and hash) by their
+bytecode, names and constants, which is all the result depends on.
+"""
+
+
+def _code_loads_without_stores(co: types.CodeType) -> FrozenSet[str]:
+    """
+    Return the global loads without stores in ``co`` and the code objects
+    nested in it, using `_code_scan_results`.
+    """
+    result = _code_scan_results.get(co)
+    if result is not None:
+        try:
+            _code_scan_results.move_to_end(co)
+        except KeyError:
+            pass
+        return result
+    found = _scan_code_for_loads_without_stores(co)
+    # Recurse on inner function definitions, lambdas, generators, etc.
+    for arg in co.co_consts:
+        if isinstance(arg, types.CodeType):
+            found |= _code_loads_without_stores(arg)
+    result = frozenset(found)
+    _code_scan_results[co] = result
+    if len(_code_scan_results) > _CODE_SCAN_CACHE_SIZE:
+        _code_scan_results.popitem(last=False)
+    return result
+
+
+def _extended_oparg(ops: bytes, args: bytes, k: int) -> int:
+    """
+    Return the argument of instruction ``k``, including the EXTENDED_ARG
+    prefixes before it.
+    """
+    oparg = args[k]
+    shift = 8
+    k -= 1
+    while k >= 0 and ops[k] == _EXTENDED_ARG:
+        oparg |= args[k] << shift
+        shift += 8
+        k -= 1
+    return oparg
+
+
+def _scan_code_for_loads_without_stores(co: types.CodeType) -> Set[str]:
+    """
+    Find global LOADs without corresponding STOREs in the bytecode of ``co``
+    itself, not including nested code objects.
+    """
+    # Disassemble the code.  Look for LOADs and STOREs.  Rather than decoding
+    # every instruction in Python, we split the bytecode into opcodes and
+    # arguments, classify all opcodes at once with ``bytes.translate``, and
+    # only visit the LOAD_GLOBAL, LOAD_NAME, STORE_GLOBAL and STORE_NAME
+    # instructions, each followed by any chain of LOAD_ATTRs.
     #
     # Scenarios:
     #
@@ -1641,102 +2127,71 @@ def _find_loads_without_stores_in_code(
     #         f: STORE_DEREF, LOAD_CLOSURE, MAKE_CLOSURE
     #         g = f(): LOAD_DEREF
     bytecode = co.co_code
-    n = len(bytecode)
-    i = 0
-    extended_arg = 0
+    names = co.co_names
+    ops = bytecode[0::2]
+    args = bytecode[1::2]
+    nops = len(ops)
+    kinds = ops.translate(_SCAN_OPCODE_KINDS)
+    search = _SCANNED_OPCODE.search
     stores = set()
     loads_after_label = set()
     loads_before_label_without_stores = set()
     # Find the earliest target of a backward jump.
     earliest_backjump_label = _find_earliest_backjump_label(bytecode)
-    # Loop through bytecode.
-    while i < n:
-        op = bytecode[i]
-        i += 1
-        if op == CACHE:
+    m = search(kinds)
+    while m is not None:
+        k = m.start()
+        kind = kinds[k]
+        oparg = args[k]
+        if k and ops[k-1] == _EXTENDED_ARG:
+            oparg = _extended_oparg(ops, args, k)
+        if kind == _SCAN_STORE:
+            stores.add(names[oparg])
+            m = search(kinds, k+1)
             continue
-        if take_arg(op):
-            oparg = bytecode[i] | extended_arg
-            extended_arg = 0
-            if op == EXTENDED_ARG:
-                extended_arg = (oparg << 8)
+        # Keep track of the partial name so far that started with a
+        # LOAD_GLOBAL or LOAD_NAME.
+        # Starting with 3.11, the low bit of LOAD_GLOBAL's argument is used to
+        # tell whether to push an extra null on the stack, so we need to >> 1.
+        pending = [names[oparg >> LOAD_SHIFT if kind == _SCAN_LOAD_GLOBAL
+                         else oparg]]
+        k += 1
+        while True:
+            # The code should always end with a RETURN_VALUE opcode and
+            # therefore not in a LOAD_ATTR.
+            assert k < nops
+            op = ops[k]
+            if op == _CACHE or op == _EXTENDED_ARG:
+                k += 1
                 continue
-            i += 1
-
-        if pending is not None:
-            if op == STORE_ATTR:
-                # {LOAD_GLOBAL|LOAD_NAME} {LOAD_ATTR}* {STORE_ATTR}
-                pending.append(co.co_names[oparg])
-                fullname = ".".join(pending)
-                pending = None
-                stores.add(fullname)
-                continue
-            if op in {LOAD_ATTR, LOAD_METHOD}:
-                if sys.version_info >= (3,12):
-                    # from the docs:
-                    #
-                    # If the low bit of namei is not set, this replaces
-                    # STACK[-1] with getattr(STACK[-1], co_names[namei>>1]).
-                    #
-                    # If the low bit of namei is set, this will attempt to load
-                    # a method named co_names[namei>>1] from the STACK[-1]
-                    # object. STACK[-1] is popped. This bytecode distinguishes
-                    # two cases: if STACK[-1] has a method with the correct
-                    # name, the bytecode pushes the unbound method and
-                    # STACK[-1]. STACK[-1] will be used as the first argument
-                    # (self) by CALL when calling the unbound method. Otherwise,
-                    # NULL and the object returned by the attribute lookup are
-                    # pushed.
-                    #
-                    # Changed in version 3.12: If the low bit of namei is set,
-                    # then a NULL or self is pushed to the stack before the
-                    # attribute or unbound method respectively.
-                    #
-                    # Implication for Pyflyby
-                    #
-                    # In our case I think it means we are always looking at
-                    # oparg>>1 as the name of the names we need to load,
-                    # Though we don't keep track of the stack, and so we may get
-                    # wrong results ?
-                    #
-                    # In any case this seem to match what load_method was doing
-                    # before.
-                    pending.append(co.co_names[oparg>>1])
-                else:
-                    # {LOAD_GLOBAL|LOAD_NAME} {LOAD_ATTR}* so far;
-                    # possibly more LOAD_ATTR/STORE_ATTR will follow
-                    pending.append(co.co_names[oparg])
+            if op == _STORE_ATTR or op in _LOAD_ATTRS:
+                oparg = args[k]
+                if ops[k-1] == _EXTENDED_ARG:
+                    oparg = _extended_oparg(ops, args, k)
+                k += 1
+                if op == _STORE_ATTR:
+                    # {LOAD_GLOBAL|LOAD_NAME} {LOAD_ATTR}* {STORE_ATTR}
+                    pending.append(names[oparg])
+                    stores.add(".".join(pending))
+                    break
+                # {LOAD_GLOBAL|LOAD_NAME} {LOAD_ATTR}* so far; possibly more
+                # LOAD_ATTR/STORE_ATTR will follow.  From 3.12, the low bit of
+                # LOAD_ATTR's argument says whether to load a method.
+                pending.append(names[oparg >> _LOAD_ATTR_SHIFT])
                 continue
             # {LOAD_GLOBAL|LOAD_NAME} {LOAD_ATTR}* (and no more
-            # LOAD_ATTR/STORE_ATTR)
+            # LOAD_ATTR/STORE_ATTR).  This instruction may itself be a load or
+            # store, which the next search finds again.
             fullname = ".".join(pending)
-            pending = None
-            if i >= earliest_backjump_label:
+            # Compare the offset just after the opcode (and its argument, if
+            # it takes one) to the label, as `_find_earliest_backjump_label`
+            # counts them.
+            if 2*k + 1 + _TAKES_ARG[op] >= earliest_backjump_label:
                 loads_after_label.add(fullname)
             elif fullname not in stores:
                 loads_before_label_without_stores.add(fullname)
-            # Fall through.
-
-        if op is LOAD_GLOBAL:
-            # Starting with 3.11, the low bit is used to tell whether to
-            # push an extra null on the stack, so we need to >> 1
-            # >> 0 does nothing
-            pending = [co.co_names[oparg >> LOAD_SHIFT]]
-            continue
-        if op is LOAD_NAME:
-            pending = [co.co_names[oparg]]
-            continue
-
-        if op in [STORE_GLOBAL, STORE_NAME]:
-            stores.add(co.co_names[oparg])
-            continue
-
-        # We don't need to worry about: LOAD_FAST, STORE_FAST, LOAD_CLOSURE,
-        # LOAD_DEREF, STORE_DEREF.  LOAD_FAST and STORE_FAST refer to local
-        # variables; LOAD_CLOSURE, LOAD_DEREF, and STORE_DEREF relate to
-        # closure variables.  In both cases we know these are not missing
-        # imports.  It's convenient that these are separate opcodes, because
-        # then we don't need to deal with them manually.
+            break
+        m = search(kinds, k)
 
     # Record which variables we saw that were loaded in this module without a
     # corresponding store.  We handle two cases.
@@ -1779,18 +2234,7 @@ def _find_loads_without_stores_in_code(
     #         before a preceding store is definitely too early.
     # Case 2: If we have seen a label, then we consider any preceding
     #         or subsequent store to potentially match the load.
-    loads_without_stores.update( loads_before_label_without_stores ) # case 1
-    loads_without_stores.update( loads_after_label - stores )        # case 2
-
-    # The ``pending`` variable should have been reset at this point, because a
-    # function should always end with a RETURN_VALUE opcode and therefore not
-    # end in a LOAD_ATTR.
-    assert pending is None
-
-    # Recurse on inner function definitions, lambdas, generators, etc.
-    for arg in co.co_consts:
-        if isinstance(arg, types.CodeType):
-            _find_loads_without_stores_in_code(arg, loads_without_stores)
+    return loads_before_label_without_stores | (loads_after_label - stores)
 
 if sys.version_info >= (3,12):
     from dis import hasarg
@@ -1801,6 +2245,45 @@ else:
         from opcode import HAVE_ARGUMENT
         return op >= HAVE_ARGUMENT
 
+def _opcode_table(values: Dict[int, int]) -> bytes:
+    """
+    Return a ``bytes.translate`` table mapping each opcode to its value in
+    ``values``, or to 0.
+    """
+    return bytes(values.get(op, 0) for op in range(256))
+
+
+_TAKES_ARG = _opcode_table({op: 1 for op in range(256) if take_arg(op)})
+
+_SCAN_LOAD_GLOBAL, _SCAN_LOAD_NAME, _SCAN_STORE = 1, 2, 3
+
+_SCAN_OPCODE_KINDS = _opcode_table({
+    opcode.opmap["LOAD_GLOBAL"] : _SCAN_LOAD_GLOBAL,
+    opcode.opmap["LOAD_NAME"]   : _SCAN_LOAD_NAME,
+    opcode.opmap["STORE_GLOBAL"]: _SCAN_STORE,
+    opcode.opmap["STORE_NAME"]  : _SCAN_STORE,
+})
+"""
+Translation of opcodes to the kinds of instruction that start a load or store
+in `_scan_code_for_loads_without_stores`.
+"""
+
+_SCANNED_OPCODE = re.compile(b"[^\\x00]")
+
+_EXTENDED_ARG = opcode.EXTENDED_ARG
+_STORE_ATTR = opcode.opmap["STORE_ATTR"]
+# LOAD_METHOD is _supposed_ to be removed in 3.12 but still present in opmap
+# it was actually removed in 3.14
+_LOAD_ATTRS = frozenset(
+    [opcode.opmap["LOAD_ATTR"]] +
+    ([opcode.opmap["LOAD_METHOD"]] if sys.version_info < (3, 12) else []))
+_LOAD_ATTR_SHIFT = 1 if sys.version_info >= (3, 12) else 0
+# Inline cache entries (3.11+); no opcode equals -1.
+_CACHE = opcode.opmap.get("CACHE", -1) if sys.version_info > (3, 11) else -1
+_HASJREL = frozenset(opcode.hasjrel)
+_HASJABS = frozenset(opcode.hasjabs)
+
+
 def _find_earliest_backjump_label(bytecode: bytes) -> int:
     """
     Find the earliest target of a backward jump.
@@ -1841,25 +2324,29 @@ def _find_earliest_backjump_label(bytecode: bytes) -> int:
       The earliest target of a backward jump, as an offset into the bytecode.
     """
     # Code based on dis.findlabels().
-    from opcode import hasjrel, hasjabs
     if not isinstance(bytecode, bytes):
         raise TypeError
     n = len(bytecode)
     earliest_backjump_label = n
+    if not _HASJABS:
+        # A relative jump's label is never before ``i`` below, so only
+        # absolute jumps (which Python 3.11+ doesn't have) count as backward.
+        return earliest_backjump_label
+    takes_arg = _TAKES_ARG
     i = 0
     while i < n:
         op = bytecode[i]
         i += 1
-        if not take_arg(op):
+        if not takes_arg[op]:
             continue
-        if i+1 >= len(bytecode):
+        if i+1 >= n:
             break
         oparg = bytecode[i] + bytecode[i+1]*256
         i += 2
         label = None
-        if op in hasjrel:
+        if op in _HASJREL:
             label = i+oparg
-        elif op in hasjabs:
+        elif op in _HASJABS:
             label = oparg
         else:
             # No label
@@ -1975,14 +2462,21 @@ def find_missing_imports(
                 return [arg]
             else:
                 return []
-        # Parse the string into an AST.
-        node = ast.parse(arg, type_comments=True) # may raise SyntaxError
-        # Get missing imports from AST.
-        return _find_missing_imports_in_ast(node, namespaces)
+        # Get missing imports from the source, parsing it into an AST only if
+        # we haven't seen it before.
+        source = arg
+        return _find_missing_imports_in_source(
+            ("str", source),
+            lambda: ast.parse(source, type_comments=True), # may raise SyntaxError
+            namespaces)
     elif isinstance(arg, PythonBlock):
-        return _find_missing_imports_in_ast(arg.ast_node, namespaces)
+        block = arg
+        return _find_missing_imports_in_source(
+            ("block", block), lambda: block.ast_node, namespaces)
     elif isinstance(arg, ast.AST):
-        return _find_missing_imports_in_ast(arg, namespaces)
+        node = arg
+        return _find_missing_imports_in_source(
+            ("ast", ast.dump(node)), lambda: node, namespaces)
     elif isinstance(arg, types.CodeType):
         return _find_missing_imports_in_code(arg, namespaces)
     elif callable(arg):
@@ -2029,14 +2523,12 @@ def get_known_import(
     # accessed "foo.bar.baz".  If we have an auto-import for "foo.bar",
     # then import that.  (Presumably, the auto-import for "foo", if it
     # exists, refers to the same foo.)
-    for partial_name in fullname.prefixes[::-1]:
-        try:
-            result = db.by_fullname_or_import_as[str(partial_name)]
-            logger.debug("get_known_import(%r): found %r", fullname, result)
-            return result
-        except KeyError:
-            logger.debug("get_known_import(%r): no known import for %r", fullname, partial_name)
-            pass
+    found = db.known_imports_trie.get_deepest(fullname.parts)
+    if found is not None:
+        partial_name, result = found
+        logger.debug("get_known_import(%r): found %r for %r",
+                     fullname, result, partial_name)
+        return result
     logger.debug("get_known_import(%r): found nothing", fullname)
     return None
 
@@ -2049,12 +2541,14 @@ Set of imports we've already attempted and failed.
 
 def clear_failed_imports_cache() -> None:
     """
-    Clear the cache of previously failed imports.
+    Clear the cache of previously failed imports, and of modules known not to
+    exist.
     """
     if _IMPORT_FAILED:
         logger.debug("Clearing all %d entries from cache of failed imports",
                      len(_IMPORT_FAILED))
         _IMPORT_FAILED.clear()
+    clear_missing_modules_cache()
 
 
 def _try_import(imp: Union[Import, str], namespace: Dict[str, Any]) -> bool:
@@ -2085,6 +2579,11 @@ def _try_import(imp: Union[Import, str], namespace: Dict[str, Any]) -> bool:
     if imp in _IMPORT_FAILED:
         logger.debug("Not attempting previously failed %r", imp)
         return False
+    split = imp.split
+    module_name = split.module_name or split.member_name
+    if not module_name.startswith(".") and is_known_missing_module(module_name):
+        logger.debug("Not attempting %r: %s doesn't exist", imp, module_name)
+        return False
     impas = imp.import_as
     name0 = impas.split(".", 1)[0]
     stmt = str(imp)
@@ -2101,12 +2600,15 @@ def _try_import(imp: Union[Import, str], namespace: Dict[str, Any]) -> bool:
     # then (3) copy into the user's namespace if it didn't already exist.
     scratch_namespace: Dict[str, Any] = {}
     try:
-        exec(stmt, scratch_namespace)
+        with profile_import(stmt):
+            exec(stmt, scratch_namespace)
         imported = scratch_namespace[name0]
     except Exception as e:
         logger.warning("Error attempting to %r: %s: %s", stmt, type(e).__name__, e,
                        exc_info=True)
         _IMPORT_FAILED.add(imp)
+        if isinstance(e, ModuleNotFoundError) and e.name:
+            record_missing_module(e.name)
         return False
     try:
         preexisting = namespace[name0]
@@ -2172,6 +2674,28 @@ def auto_import_symbol(
         logger.debug("auto_import_symbol(%r): already attempted", fullname)
         return False
     db = ImportDB.interpret_arg(db, target_filename=".")
+    return _auto_import_symbol(fullname, namespaces, db, autoimported,
+                               post_import_hook, None)
+
+
+def _auto_import_symbol(
+    fullname: Union[str, DottedIdentifier],
+    namespaces: ScopeStack,
+    db: ImportDB,
+    autoimported: Dict[DottedIdentifier, bool],
+    post_import_hook: Optional[Callable[[Import], Any]],
+    forgotten: Optional[Set[Import]],
+) -> bool:
+    """
+    Implementation of `auto_import_symbol` for a name that is known to need
+    importing and that hasn't been attempted yet.
+
+    :param db:
+      Already-interpreted import database.
+    :param forgotten:
+      ``set`` of the imports in ``db.forget_imports``, or ``None`` to compute
+      it here if needed.  `auto_import` computes it once per batch.
+    """
     # See whether there's a known import for this name.  This is mainly
     # important for things like "from numpy import arange".  Imports such as
     # "import sqlalchemy.orm" will also be handled by this, although it's less
@@ -2227,7 +2751,8 @@ def auto_import_symbol(
     # "foo.bar.baz", and the known imports database only knew about "import
     # foo.bar").  For each component that may need importing, check if the
     # loader thinks it should be importable, and if so import it.
-    forgotten = set(db.forget_imports.imports)
+    if forgotten is None:
+        forgotten = set(db.forget_imports.imports)
     for pmodule in ModuleHandle(fullname).ancestors:
         if not symbol_needs_import(pmodule.name, namespaces):
             continue
@@ -2265,6 +2790,31 @@ def auto_import_symbol(
     return True
 
 
+def _prefetch_candidates(
+    fullnames: List[DottedIdentifier],
+    namespaces: ScopeStack,
+    db: ImportDB,
+    autoimported: Dict[DottedIdentifier, bool],
+) -> List[str]:
+    """
+    Return the names of the modules that `_auto_import_symbol` may import for
+    ``fullnames``: the module of the known import for each name, or else the
+    name itself (whose prefixes are the modules tried).  Each is prefixed by
+    its parent packages when `prefetch_modules` looks it up.
+    """
+    result = []
+    for fullname in fullnames:
+        if (DottedIdentifier(fullname) in autoimported
+                or not symbol_needs_import(fullname, namespaces)):
+            continue
+        imports = get_known_import(fullname, db=db)
+        if imports is not None and len(imports) == 1:
+            result.append(imports[0].fullname)
+        else:
+            result.append(str(fullname))
+    return result
+
+
 def auto_import(
     arg: Any,
     namespaces: Union[ScopeStack, Dict[str, Any], List[Dict[str, Any]]],
@@ -2330,9 +2880,25 @@ def auto_import(
     db = ImportDB.interpret_arg(db, target_filename=filename)
     if extra_db:
         db = db|extra_db
+    # Resolve all the missing names as one batch against the same scope stack,
+    # database and forget set, rather than setting each of them up again per
+    # name.  Names sharing an ancestor (e.g. "os.path" and "os.sep") are
+    # handled by the shared ``autoimported`` dict and namespace: once an
+    # ancestor is imported (or has failed), later names skip it.
+    forgotten = set(db.forget_imports.imports)
+    if parallel_prefetch_enabled():
+        prefetch_modules(_prefetch_candidates(fullnames, namespaces, db,
+                                              autoimported))
     ok = True
     for fullname in fullnames:
-        ok &= auto_import_symbol(fullname, namespaces, db, autoimported, post_import_hook=post_import_hook)
+        if not symbol_needs_import(fullname, namespaces):
+            continue
+        if DottedIdentifier(fullname) in autoimported:
+            logger.debug("auto_import(%r): already attempted", fullname)
+            ok = False
+            continue
+        ok &= _auto_import_symbol(fullname, namespaces, db, autoimported,
+                                  post_import_hook, forgotten)
     return ok
 
 
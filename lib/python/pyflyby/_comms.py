@@ -156,7 +156,7 @@ def run_tidy_imports(code: str) -> str:
     return str(
         reformat_import_statements(
             fix_unused_and_missing_imports(
-                replace_star_imports(code)
+                replace_star_imports(code), incremental=True
             )
         )
     )
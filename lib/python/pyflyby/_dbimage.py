@@ -0,0 +1,221 @@
+# pyflyby/_dbimage.py.
+# License: MIT http://opensource.org/licenses/MIT
+
+"""
+Read-only, memory-mapped images of an import database's lookup index.
+
+An image contains the same mapping as `ImportDB.by_fullname_or_import_as`,
+plus the database's ``__forget_imports__``, in a flat file with sorted keys.
+Processes that open the same image share its pages through the OS page cache
+instead of each building the index in their own memory.
+
+Images are only shared between processes on one host, so integers are
+``uint32`` in native byte order, and the offset tables are used in place
+through a ``memoryview``.  Layout::
+
+  magic, version, number of keys, length of forget data
+  signature digest (32 bytes)
+  key offsets    (number of keys + 1 entries)
+  value offsets  (number of keys + 1 entries)
+  forget data
+  keys           (sorted by their UTF-8 encoding)
+  values
+
+Each value, and the forget data, is a sequence of ``fullname\\timport_as\\n``
+lines, or ``fullname\\timport_as\\tcomment\\n`` for imports with a comment.
+"""
+
+from __future__ import annotations, print_function
+
+import mmap
+import os
+from   pathlib                  import Path
+import struct
+from   typing                   import (Dict, Iterable, Iterator,
+                                        Optional, Sequence, Tuple, Union)
+
+from   pyflyby._importstmt      import Import
+from   pyflyby._log             import logger
+
+
+_MAGIC = 0x50594644 # "PYFD"
+_VERSION = 2
+_HEADER = struct.Struct("=IIII32s")
+
+
+def _encode_imports(imports: Iterable[Import]) -> bytes:
+    return "".join(
+        "%s\t%s\n" % (imp.fullname, imp.import_as) if imp.comment is None else
+        "%s\t%s\t%s\n" % (imp.fullname, imp.import_as, imp.comment)
+        for imp in imports).encode("utf-8")
+
+
+def _decode_imports(data: bytes) -> Tuple[Import, ...]:
+    # Comments may contain tabs and other characters that ``splitlines``
+    # would split on, but not newlines.
+    return tuple(Import.from_parts(*line.split("\t", 2))
+                 for line in data.decode("utf-8").split("\n")[:-1])
+
+
+def write_image(
+    filename: Path,
+    items: Iterable[Tuple[str, Sequence[Import]]],
+    forget_imports: Iterable[Import],
+    digest: bytes,
+) -> None:
+    """
+    Write an image for the given ``(name, imports)`` items.
+
+    The file is written to a temporary name and atomically renamed, so that
+    readers never see a partial image, and processes that already mapped an
+    older image keep their (unlinked) copy.
+
+    :param digest:
+      32-byte digest identifying the database contents; `ImportDBImage.open`
+      only accepts the image if it's given the same digest.
+    """
+    assert len(digest) == 32
+    encoded = sorted((name.encode("utf-8"), _encode_imports(imports))
+                     for name, imports in items)
+    forget_data = _encode_imports(forget_imports)
+    key_offsets = [0]
+    value_offsets = [0]
+    for key, value in encoded:
+        key_offsets.append(key_offsets[-1] + len(key))
+        value_offsets.append(value_offsets[-1] + len(value))
+    n = len(encoded)
+    offsets = struct.Struct("=%dI" % (n + 1,))
+    tmp_filename = filename.with_name("%s.%d.tmp" % (filename.name, os.getpid()))
+    filename.parent.mkdir(parents=True, exist_ok=True)
+    try:
+        with open(tmp_filename, "wb") as fp:
+            fp.write(_HEADER.pack(_MAGIC, _VERSION, n, len(forget_data), digest))
+            fp.write(offsets.pack(*key_offsets))
+            fp.write(offsets.pack(*value_offsets))
+            fp.write(forget_data)
+            for key, _ in encoded:
+                fp.write(key)
+            for _, value in encoded:
+                fp.write(value)
+        os.replace(tmp_filename, filename)
+    except BaseException:
+        try:
+            os.unlink(tmp_filename)
+        except OSError:
+            pass
+        raise
+
+
+class ImportDBImage:
+    """
+    A memory-mapped image written by `write_image`.
+
+    This supports the lookup methods of the in-memory trie index
+    (``get``, ``get_deepest``, ``iter_names``, ``items``), so it can be used
+    in its place.
+    """
+
+    def __init__(self, data: Union[mmap.mmap, bytes]) -> None:
+        self._data = data
+        magic, version, n, forget_len, self.digest = _HEADER.unpack_from(data, 0)
+        if magic != _MAGIC or version != _VERSION:
+            raise ValueError("Not a pyflyby import database image")
+        self._n = n
+        pos = _HEADER.size
+        size = 4 * (n + 1)
+        if pos + 2 * size + forget_len > len(data):
+            raise ValueError("Truncated pyflyby import database image")
+        view = memoryview(data)
+        self._key_offsets = view[pos:pos + size].cast("I")
+        pos += size
+        self._value_offsets = view[pos:pos + size].cast("I")
+        pos += size
+        self.forget_imports = _decode_imports(data[pos:pos + forget_len])
+        pos += forget_len
+        self._keys_start = pos
+        self._values_start = pos + self._key_offsets[-1]
+        if self._values_start + self._value_offsets[-1] > len(data):
+            raise ValueError("Truncated pyflyby import database image")
+        self._decoded: Dict[int, Tuple[Import, ...]] = {}
+
+    @classmethod
+    def open(cls, filename: Path, digest: bytes) -> Optional[ImportDBImage]:
+        """
+        Map the image at ``filename``, if it exists and matches ``digest``.
+        """
+        try:
+            with open(filename, "rb") as fp:
+                data = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            # ValueError: empty file.
+            return None
+        try:
+            if _HEADER.unpack_from(data, 0)[4] != digest:
+                data.close()
+                return None
+            return cls(data)
+        except (ValueError, struct.error) as e:
+            logger.debug("Ignoring invalid image %s: %s", filename, e)
+            return None
+
+    def _key(self, i: int) -> bytes:
+        start = self._keys_start
+        return self._data[start + self._key_offsets[i]:
+                          start + self._key_offsets[i + 1]]
+
+    def _value(self, i: int) -> Tuple[Import, ...]:
+        try:
+            return self._decoded[i]
+        except KeyError:
+            pass
+        start = self._values_start
+        result = self._decoded[i] = _decode_imports(
+            self._data[start + self._value_offsets[i]:
+                       start + self._value_offsets[i + 1]])
+        return result
+
+    def _bisect(self, key: bytes) -> int:
+        lo, hi = 0, self._n
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._key(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def get(self, name: str) -> Optional[Tuple[Import, ...]]:
+        key = name.encode("utf-8")
+        i = self._bisect(key)
+        if i < self._n and self._key(i) == key:
+            return self._value(i)
+        return None
+
+    def get_deepest(
+        self, name: Union[str, Sequence[str]]
+    ) -> Optional[Tuple[str, Tuple[Import, ...]]]:
+        parts = name.split(".") if isinstance(name, str) else name
+        for depth in range(len(parts), 0, -1):
+            prefix = ".".join(parts[:depth])
+            result = self.get(prefix)
+            if result is not None:
+                return prefix, result
+        return None
+
+    def _iter_indexes(self, prefix: str) -> Iterator[int]:
+        key = prefix.encode("utf-8")
+        for i in range(self._bisect(key), self._n):
+            if not self._key(i).startswith(key):
+                break
+            yield i
+
+    def iter_names(self, prefix: str = "") -> Iterator[str]:
+        for i in self._iter_indexes(prefix):
+            yield self._key(i).decode("utf-8")
+
+    def items(self) -> Iterator[Tuple[str, Tuple[Import, ...]]]:
+        for i in range(self._n):
+            yield self._key(i).decode("utf-8"), self._value(i)
+
+    def __len__(self) -> int:
+        return self._n
@@ -5,7 +5,7 @@ using C++ with pybind11.
 """
 
 import importlib.machinery
-from   typing                   import Generator, List
+from   typing                   import Generator, List, Tuple
 
 def _iter_file_finder_modules(
     importer: importlib.machinery.FileFinder,
@@ -26,3 +26,32 @@ def _iter_file_finder_modules(
         Tuples of (module_name, is_package).
     """
     ...
+
+def _scan_directories(
+    paths: List[str],
+    suffixes: List[str],
+    max_workers: int = 0,
+) -> List[Tuple[int, List[Tuple[str, bool]]]]:
+    """List the modules in each of several directories, concurrently.
+
+    The directories are scanned by a bounded pool of threads, without holding
+    the GIL.
+
+    Parameters
+    ----------
+    paths : List[str]
+        Directories to scan.
+    suffixes : List[str]
+        List of valid module suffixes (e.g., ['.py', '.pyd', '.so']).
+    max_workers : int
+        Maximum number of threads; ``0`` means the number of CPUs, up to 8.
+
+    Returns
+    -------
+    List[Tuple[int, List[Tuple[str, bool]]]]
+        One ``(mtime_ns, modules)`` tuple per entry of ``paths``, in the same
+        order.  ``mtime_ns`` is the directory's ``st_mtime_ns`` taken before
+        listing it, or ``-1`` if it can't be stat'ed, and ``modules`` is as
+        returned by `_iter_file_finder_modules`.
+    """
+    ...
@@ -6,19 +6,29 @@ from __future__ import annotations, print_function
 
 
 
-from   collections              import defaultdict
+from   collections              import namedtuple
+from   concurrent.futures       import ProcessPoolExecutor
+import hashlib
+import keyword
 import logging
+import marshal
 import os
+import platformdirs
 import re
+import stat
+import sys
+import time
 
 from   pathlib                  import Path
 
-from   typing                   import (Any, Dict, List, Optional, Sequence,
+from   typing                   import (Any, Dict, FrozenSet, Iterable,
+                                        Iterator, List, Optional, Sequence,
                                         Tuple, Union)
 
-from   pyflyby._file            import (Filename, UnsafeFilenameError,
-                                        expand_py_files_from_args)
-from   pyflyby._idents          import dotted_prefixes
+from   pyflyby._dbimage         import ImportDBImage, write_image
+from   pyflyby._file            import (FileText, Filename,
+                                        UnsafeFilenameError,
+                                        expand_py_files_from_args, read_file)
 from   pyflyby._importclns      import ImportMap, ImportSet
 from   pyflyby._importstmt      import Import, ImportStatement
 from   pyflyby._log             import logger
@@ -62,7 +72,10 @@ def _get_env_var(env_var_name: str, default: Sequence[str]) -> Sequence[str]:
 
 
 def _get_python_path(
-    env_var_name: str, default_path: Sequence[str], target_dirname: Filename
+    env_var_name: str,
+    default_path: Sequence[str],
+    target_dirname: Filename,
+    candidates: Optional[List[Filename]] = None,
 ) -> Tuple[Filename, ...]:
     '''
     Expand an environment variable specifying pyflyby input config files.
@@ -73,6 +86,10 @@ def _get_python_path(
       - Expand triple dots.
       - Recursively traverse directories.
 
+    :param candidates:
+      If not ``None``, a list to which the paths that were considered, after
+      expanding triple dots, are appended.  This includes paths that don't
+      exist.
     :rtype:
       ``tuple`` of ``Filename`` s
     '''
@@ -91,18 +108,100 @@ def _get_python_path(
             "want to use the current directory."
             .format(env_var_name=env_var_name, p=p))
     pathnames = [os.path.expanduser(p) for p in pathnames]
-    pathnames = _expand_tripledots(pathnames, target_dirname)  # type: ignore[assignment]
-    for fn in pathnames:
+    expanded: List[Filename] = _expand_tripledots(pathnames, target_dirname)
+    for fn in expanded:
         assert isinstance(fn, Filename)
-    pathnames = stable_unique(pathnames)
-    for p in pathnames:
-        assert isinstance(p, Filename)
-    pathnames = expand_py_files_from_args(pathnames)  # type: ignore[arg-type, assignment]
-    if not pathnames:
+    expanded = stable_unique(expanded)
+    if candidates is not None:
+        candidates.extend(expanded)
+    filenames = expand_py_files_from_args(expanded)
+    if not filenames:
         logger.warning(
             "No import libraries found (%s=%r, default=%r)"
             % (env_var_name, os.environ.get(env_var_name), default_path))
-    return tuple(pathnames)  # type: ignore[arg-type]
+    return tuple(filenames)
+
+
+_IMPORTDB_CACHE_VERSION = 3
+"""
+Version of the on-disk format written by `ImportDB._save_to_cache`.  Bump this
+whenever the layout of the cached data changes.
+"""
+
+
+def _importdb_cache_dir() -> Path:
+    """
+    Return the directory holding compiled `ImportDB` snapshots.
+    """
+    return Path(
+        platformdirs.user_cache_dir(appname='pyflyby', appauthor=False)
+    ) / "importdb"
+
+
+def _importdb_cache_disabled() -> bool:
+    return os.environ.get("PYFLYBY_DISABLE_CACHE", "0") == "1"
+
+
+def _get_revalidate_interval() -> Optional[float]:
+    """
+    Return the value of ``$PYFLYBY_IMPORTDB_REVALIDATE_INTERVAL`` in seconds,
+    or ``None`` if revalidation of cached databases is disabled.
+    """
+    value = os.environ.get("PYFLYBY_IMPORTDB_REVALIDATE_INTERVAL", "")
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        logger.warning(
+            "Ignoring invalid PYFLYBY_IMPORTDB_REVALIDATE_INTERVAL=%r", value)
+        return None
+
+
+def _importdb_image_enabled() -> bool:
+    return os.environ.get("PYFLYBY_IMPORTDB_IMAGE") == "1"
+
+
+def _get_parse_processes() -> int:
+    """
+    Return the value of ``$PYFLYBY_IMPORTDB_PARSE_PROCESSES``, the number of
+    processes to use for parsing database files.  ``0`` means one per CPU;
+    the default, ``1``, parses in the current process.
+    """
+    value = os.environ.get("PYFLYBY_IMPORTDB_PARSE_PROCESSES", "")
+    if not value:
+        return 1
+    try:
+        processes = int(value)
+    except ValueError:
+        logger.warning(
+            "Ignoring invalid PYFLYBY_IMPORTDB_PARSE_PROCESSES=%r", value)
+        return 1
+    if processes == 0:
+        processes = os.cpu_count() or 1
+    return processes
+
+
+def _stat_signature(
+    filenames: Sequence[Filename],
+) -> Optional[Tuple[Tuple[str, int, int, int, int], ...]]:
+    """
+    Return a signature of the given files that changes whenever any of them
+    is modified, replaced, or removed.
+
+    :return:
+      ``tuple`` of ``(filename, st_dev, st_ino, st_mtime_ns, st_size)``, or
+      ``None`` if any of the files can't be stat'ed.
+    """
+    result = []
+    for filename in filenames:
+        try:
+            st = os.stat(str(filename))
+        except OSError:
+            return None
+        result.append((str(filename), st.st_dev, st.st_ino,
+                       st.st_mtime_ns, st.st_size))
+    return tuple(result)
 
 
 # TODO: stop memoizing here after using StatCache.  Actually just inline into
@@ -185,6 +284,482 @@ def _expand_tripledots(
     return result
 
 
+def _path_state(pathname: str) -> Optional[Tuple[int, int]]:
+    """
+    Return ``(file type, mtime)`` of ``pathname``, or ``None`` if it doesn't
+    exist.  The mtime is only included for directories, where it changes when
+    entries are added or removed.
+    """
+    try:
+        st = os.stat(pathname)
+    except OSError:
+        return None
+    if stat.S_ISDIR(st.st_mode):
+        return (stat.S_IFDIR, st.st_mtime_ns)
+    return (stat.S_IFMT(st.st_mode), 0)
+
+
+def _resolution_watched_paths(candidates: Sequence[Filename]) -> List[str]:
+    """
+    Return the paths whose state determines the result of `_get_python_path`
+    for the given candidates: the candidates themselves, and the directories
+    that `expand_py_files_from_args` would traverse below them.
+    """
+    result = [str(c) for c in candidates]
+    stack = [str(c) for c in candidates]
+    while stack:
+        try:
+            entries = list(os.scandir(stack.pop()))
+        except OSError:
+            continue
+        for entry in entries:
+            if entry.name.startswith("."):
+                continue
+            try:
+                is_dir = entry.is_dir()
+            except OSError:
+                continue
+            if is_dir:
+                result.append(entry.path)
+                stack.append(entry.path)
+    return result
+
+
+def _resolution_cache_filename(key: Tuple[Any, ...]) -> Path:
+    digest = hashlib.sha256(repr(key).encode("utf-8", "surrogateescape")).hexdigest()
+    return _importdb_cache_dir() / ("%s.paths" % (digest,))
+
+
+def _load_resolution(
+    cache_file: Path, key: Tuple[Any, ...]
+) -> Optional[Tuple[Filename, ...]]:
+    """
+    Return the database filenames saved by `_save_resolution` for ``key``, if
+    none of the watched paths changed since.
+    """
+    try:
+        with open(cache_file, "rb") as fp:
+            data = marshal.load(fp)
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        logger.debug("ImportDB: ignoring unreadable cache %s: %s: %s",
+                     cache_file, type(e).__name__, e)
+        return None
+    if not (isinstance(data, tuple) and len(data) == 4
+            and data[0] == _IMPORTDB_CACHE_VERSION and data[1] == key):
+        return None
+    for pathname, state in data[3]:
+        if _path_state(pathname) != state:
+            logger.debug("ImportDB: %s changed; resolving PYFLYBY_PATH again",
+                         pathname)
+            return None
+    return tuple(Filename(f) for f in data[2])
+
+
+def _save_resolution(
+    cache_file: Path,
+    key: Tuple[Any, ...],
+    filenames: Sequence[Filename],
+    watched: Sequence[str],
+) -> None:
+    data = (_IMPORTDB_CACHE_VERSION, key, tuple(str(f) for f in filenames),
+            tuple((p, _path_state(p)) for p in watched))
+    tmp_file = cache_file.with_name("%s.%d.tmp" % (cache_file.name, os.getpid()))
+    try:
+        cache_file.parent.mkdir(parents=True, exist_ok=True)
+        with open(tmp_file, "wb") as fp:
+            marshal.dump(data, fp)
+        os.replace(tmp_file, cache_file)
+    except OSError as e:
+        logger.debug("ImportDB: failed to write cache %s: %s", cache_file, e)
+        try:
+            os.unlink(tmp_file)
+        except OSError:
+            pass
+
+
+_ImportDBFragment = namedtuple(
+    "_ImportDBFragment",
+    "known_imports mandatory_imports canonical_imports forget_imports")
+"""
+The contents of a single import database file, before ``__forget_imports__``
+from the other files are applied.
+"""
+
+
+def _importset_to_cache_data(
+    importset: ImportSet,
+) -> Tuple[Tuple[str, str, Optional[str]], ...]:
+    return tuple((imp.fullname, imp.import_as, imp.comment)
+                 for imp in importset.imports)
+
+
+def _importset_from_cache_data(
+    data: Sequence[Tuple[str, str, Optional[str]]],
+) -> ImportSet:
+    return ImportSet._from_imports([Import.from_parts(*imp) for imp in data])
+
+
+def _fragment_to_cache_data(fragment: _ImportDBFragment) -> Tuple[Any, ...]:
+    return (_importset_to_cache_data(fragment.known_imports),
+            _importset_to_cache_data(fragment.mandatory_imports),
+            dict(fragment.canonical_imports.items()),
+            _importset_to_cache_data(fragment.forget_imports))
+
+
+def _fragment_from_cache_data(data: Tuple[Any, ...]) -> _ImportDBFragment:
+    known, mandatory, canonical, forget = data
+    return _ImportDBFragment(_importset_from_cache_data(known),
+                             _importset_from_cache_data(mandatory),
+                             ImportMap(canonical),
+                             _importset_from_cache_data(forget))
+
+
+_IDENTIFIER_RE = r"[A-Za-z_][A-Za-z0-9_]*"
+_DOTTED_RE = r"%s(?:\.%s)*" % (_IDENTIFIER_RE, _IDENTIFIER_RE)
+_ALIAS_RE = r"%s(?:\s+as\s+%s)?" % (_DOTTED_RE, _IDENTIFIER_RE)
+_SIMPLE_IMPORT_RE = re.compile(
+    r"(?:from[ \t]+(%s)[ \t]+import[ \t]+(?:\(\s*(%s(?:\s*,\s*%s)*\s*,?)\s*\)|"
+    r"(%s(?:[ \t]*,[ \t]*%s)*))|import[ \t]+(%s(?:[ \t]*,[ \t]*%s)*))[ \t]*$"
+    % ((_DOTTED_RE,) + (_ALIAS_RE,) * 6))
+"""
+Matches an ``import`` or ``from ... import`` statement without comments,
+relative imports, or star imports.  Only ``from ... import (...)`` may span
+multiple lines.
+"""
+
+_KEYWORDS = frozenset(keyword.kwlist)
+
+_STRING_OR_COMMENT_RE = re.compile(
+    r"""'(?:[^'\\\n]|\\.)*'|"(?:[^"\\\n]|\\.)*"|#.*""")
+
+
+def _parse_simple_import(code: str) -> Optional[List[Import]]:
+    """
+    Parse a simple import statement.
+
+      >>> _parse_simple_import("from aa.bb import cc as dd, ee")
+      [Import('from aa.bb import cc as dd'), Import('from aa.bb import ee')]
+
+      >>> _parse_simple_import("from aa import (bb,\\n    cc)")
+      [Import('from aa import bb'), Import('from aa import cc')]
+
+      >>> _parse_simple_import("from aa import bb # comment") is None
+      True
+
+    :return:
+      ``list`` of `Import` s, or ``None`` if ``code`` isn't a simple import
+      statement and needs the full parser.
+    """
+    m = _SIMPLE_IMPORT_RE.match(code)
+    if m is None:
+        return None
+    fromname, parenthesized, unparenthesized, plain = m.groups()
+    if fromname is None:
+        aliases = plain
+    else:
+        aliases = parenthesized or unparenthesized
+        if not _KEYWORDS.isdisjoint(fromname.split(".")):
+            return None
+    result = []
+    for alias in aliases.split(","):
+        parts = alias.split()
+        if not parts:
+            # Trailing comma inside parentheses.
+            continue
+        if len(parts) == 1:
+            name = import_as = parts[0]
+        else:
+            name, _, import_as = parts
+        if import_as in _KEYWORDS or not _KEYWORDS.isdisjoint(name.split(".")):
+            return None
+        if fromname is None:
+            fullname = name
+        elif "." in name:
+            return None
+        else:
+            fullname = "%s.%s" % (fromname, name)
+        result.append(Import.from_parts(fullname, import_as))
+    return result
+
+
+def _parse_fragment_data(filename: str) -> Tuple[Any, ...]:
+    """
+    Parse a database file and return its fragment as plain data.
+
+    This runs in worker processes (see `ImportDB._get_fragments`); `Import`
+    objects don't pickle, so we send back the ``marshal``-able form.
+    """
+    fragment = ImportDB._parse_fragment_file(Filename(filename))
+    return _fragment_to_cache_data(fragment)
+
+
+def _read_importdb_cache(cache_file: Path) -> Optional[Tuple[Any, ...]]:
+    """
+    Read a file written by `ImportDB._save_to_cache`.
+
+    :return:
+      ``(signature, merged_data, fragments_data)``, or ``None`` if there is no
+      usable cache file.
+    """
+    try:
+        with open(cache_file, "rb") as fp:
+            data = marshal.load(fp)
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        logger.debug("ImportDB: ignoring unreadable cache %s: %s: %s",
+                     cache_file, type(e).__name__, e)
+        return None
+    if not (isinstance(data, tuple) and len(data) == 4
+            and data[0] == _IMPORTDB_CACHE_VERSION):
+        return None
+    return data[1:]
+
+
+class _DottedNameTrieNode:
+    __slots__ = ("children", "imports", "is_prefix", "resolved")
+
+    def __init__(self) -> None:
+        self.children: Optional[Dict[str, _DottedNameTrieNode]] = None
+        # Imports whose ``import_as`` ends at this node.
+        self.imports: Tuple[Import, ...] = ()
+        # Whether this node is a proper prefix of some import's ``fullname``,
+        # i.e. whether "import <this name>" is implied.
+        self.is_prefix = False
+        # Lazily computed result for this node; see `_DottedNameTrie._resolve`.
+        self.resolved: Optional[Tuple[Import, ...]] = None
+
+
+def _top_name(name: str) -> str:
+    """
+    Return the first component of a dotted name, as `dotted_prefixes` would.
+    """
+    return name.split(".", 1)[0] or "."
+
+
+def _group_by_top_name(imports: Iterable[Import]) -> Dict[str, List[Import]]:
+    """
+    Group imports by the first component of their ``import_as`` and of their
+    ``fullname``.  An import appears in both groups if they differ.
+    """
+    result: Dict[str, List[Import]] = {}
+    for imp in imports:
+        top_as = _top_name(imp.import_as)
+        result.setdefault(top_as, []).append(imp)
+        top_full = _top_name(imp.fullname)
+        if top_full != top_as:
+            result.setdefault(top_full, []).append(imp)
+    return result
+
+
+class _DottedNameTrie:
+    """
+    Trie of dotted names, mapping each name to the imports that define it.
+
+    This answers the same questions as `ImportDB.by_fullname_or_import_as`,
+    but the "import foo.bar" entries implied by "from foo.bar import quux"
+    are only recorded as a flag on the node, and the corresponding `Import`
+    is created the first time that node is looked up.
+
+    The subtree for each top-level name is only built when it's first
+    needed, so looking up "numpy.linalg" doesn't pay for indexing the rest
+    of the database.
+
+      >>> trie = ImportDB('from aa.bb import cc as dd').known_imports_trie
+      >>> trie.get_deepest("aa.bb.xx")
+      ('aa.bb', (Import('import aa.bb'),))
+      >>> sorted(trie.iter_names("a"))
+      ['aa', 'aa.bb']
+    """
+
+    def __init__(
+        self,
+        imports_by_top_name: Dict[str, List[Import]],
+        forget_imports: Iterable[Import] = (),
+    ) -> None:
+        """
+        :param imports_by_top_name:
+          Imports grouped by `_group_by_top_name`.
+        """
+        self._root = _DottedNameTrieNode()
+        self._pending = dict(imports_by_top_name)
+        forget = frozenset(forget_imports)
+        self._pending_forget: Dict[str, List[str]] = {}
+        for imp in forget:
+            if imp.fullname == imp.import_as:
+                self._pending_forget.setdefault(
+                    _top_name(imp.fullname), []).append(imp.fullname)
+        if forget:
+            self._forget = forget
+
+    _forget: FrozenSet[Import] = frozenset()
+
+    def _build_shard(self, top: str) -> Optional[_DottedNameTrieNode]:
+        """
+        Build the subtree for the top-level name ``top``, if there is one.
+        """
+        imports = self._pending.pop(top, None)
+        if imports is None:
+            return None
+        shard = self._child(self._root, top)
+        for imp in imports:
+            # Given an import like "from foo.bar import quux as QUUX", record
+            # "QUUX" => the import itself, and mark "foo" and "foo.bar" as
+            # prefixes (i.e. "import foo", "import foo.bar").  We don't
+            # include an entry for "quux" because the user has implied he
+            # doesn't want to pollute the global namespace with "quux", only
+            # "QUUX".
+            parts = imp.import_as.split(".")
+            if (parts[0] or ".") == top:
+                node = shard
+                for part in parts[1:]:
+                    node = self._child(node, part)
+                node.imports += (imp,)
+            parts = imp.fullname.split(".")
+            if (parts[0] or ".") == top:
+                node = shard
+                node.is_prefix = len(parts) > 1 or node.is_prefix
+                for part in parts[1:-1]:
+                    node = self._child(node, part)
+                    node.is_prefix = True
+        for name in self._pending_forget.pop(top, ()):
+            forgotten = self._find(name.split("."))
+            if forgotten is not None:
+                forgotten.is_prefix = False
+        return shard
+
+    def _build_all_shards(self, prefix: str = "") -> None:
+        """
+        Build the subtrees for all top-level names starting with ``prefix``.
+        """
+        for top in [t for t in self._pending if t.startswith(prefix)]:
+            self._build_shard(top)
+
+    @staticmethod
+    def _child(node: _DottedNameTrieNode, part: str) -> _DottedNameTrieNode:
+        children = node.children
+        if children is None:
+            children = node.children = {}
+        try:
+            return children[part]
+        except KeyError:
+            child = children[part] = _DottedNameTrieNode()
+            return child
+
+    def _get_shard(self, top: str) -> Optional[_DottedNameTrieNode]:
+        children = self._root.children
+        if children is not None:
+            node = children.get(top)
+            if node is not None:
+                return node
+        return self._build_shard(top)
+
+    def _find(self, parts: Sequence[str]) -> Optional[_DottedNameTrieNode]:
+        if not parts:
+            return self._root
+        node = self._get_shard(parts[0])
+        for part in parts[1:]:
+            if node is None:
+                return None
+            children = node.children
+            if children is None:
+                return None
+            node = children.get(part)
+        return node
+
+    def _resolve(self, node: _DottedNameTrieNode, name: str) -> Tuple[Import, ...]:
+        result = node.resolved
+        if result is None:
+            imports = set(node.imports)
+            if node.is_prefix:
+                imports.add(Import.from_parts(name, name))
+            result = node.resolved = tuple(sorted(imports - self._forget))
+        return result
+
+    def get(self, name: str) -> Optional[Tuple[Import, ...]]:
+        """
+        Return the imports for exactly ``name``, or ``None``.
+        """
+        node = self._find(name.split("."))
+        if node is None:
+            return None
+        return self._resolve(node, name) or None
+
+    def get_deepest(
+        self, name: Union[str, Sequence[str]]
+    ) -> Optional[Tuple[str, Tuple[Import, ...]]]:
+        """
+        Return ``(prefix, imports)`` for the longest prefix of ``name`` that
+        has known imports, or ``None``.
+
+        :type name:
+          ``str`` or sequence of name parts
+        """
+        parts = name.split(".") if isinstance(name, str) else name
+        # Walk down once, remembering every node on the path that has an
+        # entry.
+        candidates = []
+        node: Optional[_DottedNameTrieNode] = self._get_shard(parts[0])
+        for depth, part in enumerate(parts, 1):
+            if depth > 1:
+                children = node.children # type: ignore[union-attr]
+                if children is None:
+                    break
+                node = children.get(part)
+            if node is None:
+                break
+            if node.imports or node.is_prefix:
+                candidates.append((depth, node))
+        for depth, node in reversed(candidates):
+            prefix = ".".join(parts[:depth])
+            result = self._resolve(node, prefix)
+            if result:
+                return prefix, result
+        return None
+
+    def _iter_nodes(
+        self, prefix: str
+    ) -> Iterator[Tuple[str, Tuple[Import, ...]]]:
+        *parents, last = prefix.split(".")
+        if not parents:
+            self._build_all_shards(last)
+        node = self._find(parents)
+        if node is None or node.children is None:
+            return
+        base = "".join(p + "." for p in parents)
+        stack = [(base + part, child)
+                 for part, child in node.children.items()
+                 if part.startswith(last)]
+        while stack:
+            name, node = stack.pop()
+            if node.imports or node.is_prefix:
+                result = self._resolve(node, name)
+                if result:
+                    yield name, result
+            if node.children:
+                stack.extend((name + "." + part, child)
+                             for part, child in node.children.items())
+
+    def iter_names(self, prefix: str = "") -> Iterator[str]:
+        """
+        Yield all known names that start with the string ``prefix``.
+
+        The last component of ``prefix`` may be partial, so that this can be
+        used for tab completion: ``iter_names("os.pa")`` yields
+        ``"os.path"``, ``"os.path.join"``, etc.
+        """
+        for name, _ in self._iter_nodes(prefix):
+            yield name
+
+    def items(self) -> Iterator[Tuple[str, Tuple[Import, ...]]]:
+        """
+        Yield ``(name, imports)`` for every known name.
+        """
+        return self._iter_nodes("")
+
+
 class ImportDB:
     """
     A database of known, mandatory, canonical imports.
@@ -207,6 +782,23 @@ class ImportDB:
 
     _default_cache: Dict[Any, Any] = {}
 
+    _source_filenames: Tuple[Filename, ...] = ()
+    """
+    For databases returned by `get_default`, the files they were loaded from.
+    """
+
+    _source_signature: Optional[Tuple[Any, ...]] = None
+    """
+    For databases returned by `get_default`, the `_stat_signature` of
+    ``_source_filenames`` at load time.
+    """
+
+    _validated_at: float = 0.0
+    """
+    ``time.monotonic()`` of the last time `_revalidated` checked
+    ``_source_signature``.
+    """
+
     def __new__(cls, *args: Any) -> "ImportDB":
         if len(args) != 1:
             raise TypeError
@@ -242,6 +834,54 @@ class ImportDB:
             nfiles = len(allpyfiles)
             logger.debug("ImportDB: Clearing default cache of %d files", nfiles)
         cls._default_cache.clear()
+        cls._fragment_cache.clear()
+
+    @classmethod
+    def _revalidated(cls, db: "ImportDB") -> Optional["ImportDB"]:
+        """
+        Check whether a cached default database is still up to date.
+
+        This is a no-op unless ``$PYFLYBY_IMPORTDB_REVALIDATE_INTERVAL`` is
+        set to a number of seconds.  If it is, then the files that ``db`` was
+        loaded from are re-stat'ed at most once per interval.  If any of them
+        changed, the database is reloaded and every `_default_cache` entry
+        pointing to ``db`` is updated.
+
+        :return:
+          The up-to-date `ImportDB`, or ``None`` if one of the files
+          disappeared, in which case the cache entries for ``db`` are dropped
+          and the caller should redo the discovery of database files.
+        """
+        interval = _get_revalidate_interval()
+        if interval is None:
+            return db
+        now = time.monotonic()
+        if now - db._validated_at < interval:
+            return db
+        db._validated_at = now
+        signature = _stat_signature(db._source_filenames)
+        if signature is not None and signature == db._source_signature:
+            return db
+        stale_keys = [k for k, v in cls._default_cache.items() if v is db]
+        if signature is None:
+            logger.debug("ImportDB: database files went away; rediscovering")
+            for k in stale_keys:
+                del cls._default_cache[k]
+            return None
+        logger.debug("ImportDB: database files changed; reloading")
+        result = cls._from_filenames(db._source_filenames)
+        result._validated_at = now
+        for k in stale_keys:
+            cls._default_cache[k] = result
+        return result
+
+    @classmethod
+    def _get_cached_default(cls, key: Tuple[Any, ...]) -> Optional["ImportDB"]:
+        try:
+            result = cls._default_cache[key]
+        except KeyError:
+            return None
+        return cls._revalidated(result)
 
     @classmethod
     def get_default(cls, target_filename: Optional[Union[Filename, str]], /) -> "ImportDB":
@@ -251,7 +891,11 @@ class ImportDB:
         This will read various .../.pyflyby files as specified by
         $PYFLYBY_PATH.
 
-        Memoized.
+        Memoized.  By default the result is never refreshed; use
+        `clear_default_cache` to force a reload.  Alternatively, set
+        ``$PYFLYBY_IMPORTDB_REVALIDATE_INTERVAL`` to a number of seconds, and
+        the database files will be checked for modifications at most that
+        often (see `_revalidated`).
 
         :param target_filename:
           The target filename for which to get the import database.  Note that
@@ -266,9 +910,6 @@ class ImportDB:
         # checking incrementally since the steps involve syscalls.  Since this
         # is going to potentially be executed inside the IPython interactive
         # loop, we cache as much as possible.
-        # TODO: Consider refreshing periodically.  Check if files have
-        # been touched, and if so, return new data.  Check file timestamps at
-        # most once every 60 seconds.
         cache_keys:List[Tuple[Any,...]] = []
         if target_filename is None:
             target_filename = "."
@@ -281,6 +922,37 @@ class ImportDB:
             type(target_filename),
         )
 
+        # First, check the raw argument, so that the common case of repeated
+        # calls with the same argument is just a dict lookup.  A relative
+        # filename is only meaningful together with the current directory.
+        pyflyby_path = os.getenv("PYFLYBY_PATH")
+        if os.path.isabs(target_filename):
+            cache_keys.append((0, target_filename, pyflyby_path))
+        else:
+            try:
+                cwd = os.getcwd()
+            except OSError:
+                pass
+            else:
+                cache_keys.append((0, target_filename, cwd, pyflyby_path))
+        if cache_keys:
+            result = cls._get_cached_default(cache_keys[-1])
+            if result is not None:
+                return result
+
+        # Next, check whether a previous process already resolved the same
+        # target and $PYFLYBY_PATH to a list of files.  This lets short-lived
+        # processes skip the discovery walk below; the saved list is checked
+        # against the state of every path that was considered.
+        resolution_key: Optional[Tuple[Any, ...]] = None
+        resolution_file: Optional[Path] = None
+        if cache_keys and not _importdb_cache_disabled():
+            resolution_key = cache_keys[-1] + (os.getenv("HOME"), __file__)
+            resolution_file = _resolution_cache_filename(resolution_key)
+            filenames = _load_resolution(resolution_file, resolution_key)
+            if filenames is not None:
+                return cls._get_default_for_filenames(cache_keys, filenames)
+
         target_path = Path(target_filename).resolve()
 
         parents: List[Path]
@@ -312,11 +984,14 @@ class ImportDB:
             key = (
                 1,
                 target_dirname,
-                os.getenv("PYFLYBY_PATH"),
+                pyflyby_path,
             )
             cache_keys.append(key)
-            if key in cls._default_cache:
-                return cls._default_cache[key]
+            result = cls._get_cached_default(key)
+            if result is not None:
+                for k in cache_keys:
+                    cls._default_cache[k] = result
+                return result
             if target_dirname.isdir:
                 break
             target_dirname = target_dirname.dir
@@ -324,14 +999,15 @@ class ImportDB:
             target_dirname = target_dirname.real
         except UnsafeFilenameError:
             pass
-        if target_dirname != cache_keys[-1][0]:
+        if target_dirname != cache_keys[-1][1]:
             cache_keys.append((1,
                                target_dirname,
-                               os.getenv("PYFLYBY_PATH")))
-            try:
-                return cls._default_cache[cache_keys[-1]]
-            except KeyError:
-                pass
+                               pyflyby_path))
+            result = cls._get_cached_default(cache_keys[-1])
+            if result is not None:
+                for k in cache_keys:
+                    cls._default_cache[k] = result
+                return result
         DEFAULT_PYFLYBY_PATH = []
         DEFAULT_PYFLYBY_PATH += [str(p) for p in _find_etc_dirs()]
         DEFAULT_PYFLYBY_PATH += [
@@ -339,14 +1015,33 @@ class ImportDB:
             "~/.pyflyby",
             ]
         logger.debug("DEFAULT_PYFLYBY_PATH=%s", DEFAULT_PYFLYBY_PATH)
+        candidates: List[Filename] = []
         filenames = _get_python_path("PYFLYBY_PATH", DEFAULT_PYFLYBY_PATH,
-                                     target_dirname)
+                                     target_dirname, candidates)
+        if resolution_file is not None:
+            assert resolution_key is not None
+            # Also watch the target itself (whose type determines where we
+            # start looking) and the global config directory (which is only
+            # a candidate if it exists).
+            watched = [target_filename, "/etc/pyflyby"]
+            watched += _resolution_watched_paths(candidates)
+            _save_resolution(resolution_file, resolution_key, filenames,
+                             watched)
+        return cls._get_default_for_filenames(cache_keys, filenames)
+
+    @classmethod
+    def _get_default_for_filenames(
+        cls, cache_keys: List[Tuple[Any, ...]], filenames: Tuple[Filename, ...]
+    ) -> "ImportDB":
+        """
+        Return the `ImportDB` for ``filenames``, and memoize it under
+        ``cache_keys`` as well.
+        """
         cache_keys.append((2, filenames))
-        try:
-            return cls._default_cache[cache_keys[-1]]
-        except KeyError:
-            pass
-        result = cls._from_code(filenames)
+        result = cls._get_cached_default(cache_keys[-1])
+        if result is None:
+            result = cls._from_filenames(filenames)
+            result._validated_at = time.monotonic()
         for k in cache_keys:
             cls._default_cache[k] = result
         return result
@@ -418,39 +1113,335 @@ class ImportDB:
         """
         if not isinstance(blocks, (tuple, list)):
             blocks = [blocks]
+        return cls._from_fragments(
+            [cls._parse_fragment_file(b) if isinstance(b, Filename)
+             else cls._parse_fragment(PythonBlock(b))
+             for b in blocks])
+
+    @classmethod
+    def _parse_fragment_file(cls, filename: Filename) -> _ImportDBFragment:
+        """
+        Parse an import database file.
+
+        Plain import statements, which make up nearly all of a typical
+        database file, are parsed directly with `_parse_simple_import`.
+        Everything else (statements with comments, ``__mandatory_imports__``
+        etc.) is parsed with `_parse_fragment`.  If the file has constructs we
+        can't reliably split into statements by looking at lines
+        (triple-quoted strings, backslash continuations), the whole file goes
+        through `_parse_fragment`.
+
+        :rtype:
+          `_ImportDBFragment`
+        """
+        text = read_file(filename)
+        lines = text.lines
+        simple_imports: List[Import] = []
+        other_lines: List[str] = []
+        has_other = False
+        depth = 0
+        i = 0
+        while i < len(lines):
+            line = lines[i]
+            i += 1
+            if depth == 0 and line.startswith(("from", "import")):
+                start = i - 1
+                if line.rstrip().endswith("(") or (
+                        "(" in line and ")" not in line):
+                    # Parenthesized import continued on following lines.
+                    while i < len(lines) and ")" not in lines[i-1]:
+                        i += 1
+                imports = _parse_simple_import("\n".join(lines[start:i]))
+                if imports is not None:
+                    simple_imports.extend(imports)
+                    # Keep line numbers intact for error messages.
+                    other_lines.extend([""] * (i - start))
+                    continue
+                i = start + 1
+            other_lines.append(line)
+            stripped = _STRING_OR_COMMENT_RE.sub("", line)
+            if not stripped or stripped.isspace():
+                continue
+            has_other = True
+            if ("'" in stripped or '"' in stripped
+                    or stripped.rstrip().endswith("\\")):
+                # Triple-quoted string, or something else we don't
+                # understand line-by-line.
+                return cls._parse_fragment(PythonBlock(text))
+            for c in stripped:
+                if c in "([{":
+                    depth += 1
+                elif c in ")]}":
+                    depth -= 1
+        if not has_other:
+            return _ImportDBFragment(ImportSet._from_imports(simple_imports),
+                                     ImportSet(()), ImportMap({}),
+                                     ImportSet(()))
+        fragment = cls._parse_fragment(PythonBlock(
+            FileText("\n".join(other_lines), filename=filename)))
+        if simple_imports:
+            fragment = fragment._replace(known_imports=ImportSet._from_imports(
+                simple_imports + list(fragment.known_imports.imports)))
+        return fragment
+
+    @classmethod
+    def _parse_fragment(cls, block: PythonBlock) -> _ImportDBFragment:
+        """
+        Parse a single block of import database code.
+
+        :rtype:
+          `_ImportDBFragment`
+        """
         known_imports: List[Import]          = []
         mandatory_imports: List[ImportSet]   = []
         canonical_imports: List[ImportMap]   = []
         forget_imports: List[ImportSet]      = []
-        blocks = [PythonBlock(b) for b in blocks]
-        for block in blocks:
-            for statement in block.statements:
-                if statement.is_comment_or_blank:
-                    continue
-                if statement.is_import:
-                    known_imports.extend(ImportStatement(statement).imports)
-                    continue
-                try:
-                    name, value = statement.get_assignment_literal_value()
-                    if name == "__mandatory_imports__":
-                        mandatory_imports.append(cls._parse_import_set(value))
-                    elif name == "__canonical_imports__":
-                        canonical_imports.append(cls._parse_import_map(value))
-                    elif name == "__forget_imports__":
-                        forget_imports.append(cls._parse_import_set(value))
-                    else:
-                        raise ValueError(
-                            "Unknown assignment to %r (expected one of "
-                            "__mandatory_imports__, __canonical_imports__, "
-                            "__forget_imports__)" % (name,))
-                except ValueError as e:
+        for statement in block.statements:
+            if statement.is_comment_or_blank:
+                continue
+            if statement.is_import:
+                known_imports.extend(ImportStatement(statement).imports)
+                continue
+            try:
+                name, value = statement.get_assignment_literal_value()
+                if name == "__mandatory_imports__":
+                    mandatory_imports.append(cls._parse_import_set(value))
+                elif name == "__canonical_imports__":
+                    canonical_imports.append(cls._parse_import_map(value))
+                elif name == "__forget_imports__":
+                    forget_imports.append(cls._parse_import_set(value))
+                else:
                     raise ValueError(
-                        "While parsing %s: error in %r: %s"
-                        % (block.filename, statement, e))
-        return cls._from_data(known_imports,
-                              mandatory_imports,
-                              canonical_imports,
-                              forget_imports)
+                        "Unknown assignment to %r (expected one of "
+                        "__mandatory_imports__, __canonical_imports__, "
+                        "__forget_imports__)" % (name,))
+            except ValueError as e:
+                raise ValueError(
+                    "While parsing %s: error in %r: %s"
+                    % (block.filename, statement, e))
+        return _ImportDBFragment(ImportSet(known_imports),
+                                 ImportSet(mandatory_imports),
+                                 ImportMap(canonical_imports),
+                                 ImportSet(forget_imports))
+
+    @classmethod
+    def _from_fragments(cls, fragments: Sequence[_ImportDBFragment]) -> "ImportDB":
+        """
+        Merge parsed fragments into an `ImportDB`.
+
+        ``__forget_imports__`` from any fragment applies to all fragments.
+        """
+        return cls._from_data([f.known_imports     for f in fragments],
+                              [f.mandatory_imports for f in fragments],
+                              [f.canonical_imports for f in fragments],
+                              [f.forget_imports    for f in fragments])
+
+    _fragment_cache: Dict[str, Tuple[Tuple[Any, ...], _ImportDBFragment]] = {}
+    """
+    Map from filename to (`_stat_signature` entry, `_ImportDBFragment`) for
+    every database file loaded so far.  Databases for different target
+    directories that share files also share these fragments.
+    """
+
+    @classmethod
+    def _get_fragments(
+        cls,
+        filenames: Sequence[Filename],
+        signature: Sequence[Tuple[Any, ...]],
+        cached_fragments: Dict[Tuple[Any, ...], Tuple[Any, ...]],
+    ) -> List[_ImportDBFragment]:
+        """
+        Return the fragments for ``filenames``, parsing only the files for
+        which we don't already have a fragment with the same signature, either
+        in memory or in ``cached_fragments``.
+
+        If ``$PYFLYBY_IMPORTDB_PARSE_PROCESSES`` is set to more than 1 and
+        several files need parsing, they are parsed in a process pool.
+
+        :param signature:
+          `_stat_signature` of ``filenames``.
+        :param cached_fragments:
+          Map from per-file signature to fragment data from the on-disk cache
+          (see `_fragment_to_cache_data`).
+        """
+        fragments: List[Optional[_ImportDBFragment]] = []
+        to_parse: List[int] = []
+        for i, (filename, file_signature) in enumerate(zip(filenames, signature)):
+            fragment = None
+            try:
+                old_signature, old_fragment = cls._fragment_cache[str(filename)]
+            except KeyError:
+                pass
+            else:
+                if old_signature == file_signature:
+                    fragment = old_fragment
+            if fragment is None:
+                cache_data = cached_fragments.get(file_signature)
+                if cache_data is not None:
+                    fragment = _fragment_from_cache_data(cache_data)
+                    cls._fragment_cache[str(filename)] = (file_signature, fragment)
+                else:
+                    to_parse.append(i)
+            fragments.append(fragment)
+        processes = _get_parse_processes()
+        if processes > 1 and len(to_parse) > 1:
+            parse_filenames = [str(filenames[i]) for i in to_parse]
+            logger.debug("ImportDB: parsing %d files in %d processes",
+                         len(parse_filenames), processes)
+            with ProcessPoolExecutor(
+                    max_workers=min(processes, len(parse_filenames))) as pool:
+                parsed = [_fragment_from_cache_data(data) for data in
+                          pool.map(_parse_fragment_data, parse_filenames)]
+        else:
+            parsed = []
+            for i in to_parse:
+                logger.debug("ImportDB: parsing %s", filenames[i])
+                parsed.append(cls._parse_fragment_file(filenames[i]))
+        for i, fragment in zip(to_parse, parsed):
+            cls._fragment_cache[str(filenames[i])] = (signature[i], fragment)
+            fragments[i] = fragment
+        return fragments # type: ignore[return-value]
+
+    @classmethod
+    def _from_filenames(cls, filenames: Tuple[Filename, ...]) -> "ImportDB":
+        """
+        Load an import database from the given files, using the on-disk cache
+        of compiled databases if possible.
+
+        The cache is keyed on the list of files, and validated against each
+        file's ``(st_dev, st_ino, st_mtime_ns, st_size)``, so that a warm
+        start only needs to stat the files and read a single blob.  If only
+        some of the files changed, only those are re-parsed; the others are
+        taken from memory or from the cache, and the fragments are merged
+        again.
+
+        If ``$PYFLYBY_IMPORTDB_IMAGE`` is ``1``, the lookup index is also
+        published as a memory-mapped image (see `pyflyby._dbimage`), and
+        other processes that load the same files map that image instead of
+        building their own index.
+
+        :type filenames:
+          ``tuple`` of `Filename` s
+        :rtype:
+          `ImportDB`
+        """
+        signature = _stat_signature(filenames)
+        if signature is None:
+            # One of the files disappeared between discovery and now.  Let
+            # the parser report the problem.
+            result = cls._from_code(filenames)
+        elif _importdb_image_enabled() and not _importdb_cache_disabled():
+            image_file = cls._cache_filename(filenames).with_suffix(".image")
+            digest = hashlib.sha256(marshal.dumps(
+                (_IMPORTDB_CACHE_VERSION, signature))).digest()
+            image = ImportDBImage.open(image_file, digest)
+            if image is not None:
+                logger.debug("ImportDB: mapped image %s", image_file)
+                result = _MappedImportDB._from_image(image)
+            else:
+                result = cls._load_filenames(filenames, signature)
+                try:
+                    write_image(image_file,
+                                result.by_fullname_or_import_as.items(),
+                                result.forget_imports.imports, digest)
+                except OSError as e:
+                    logger.debug("ImportDB: failed to write image %s: %s",
+                                 image_file, e)
+        else:
+            result = cls._load_filenames(filenames, signature)
+        result._source_filenames = filenames
+        result._source_signature = signature
+        return result
+
+    @classmethod
+    def _load_filenames(
+        cls, filenames: Tuple[Filename, ...], signature: Tuple[Any, ...]
+    ) -> "ImportDB":
+        """
+        Load an import database from the given files, whose `_stat_signature`
+        is ``signature``.  See `_from_filenames`.
+        """
+        cache_file: Optional[Path] = None
+        cached = None
+        if not _importdb_cache_disabled():
+            cache_file = cls._cache_filename(filenames)
+            cached = _read_importdb_cache(cache_file)
+        if cached is not None and cached[0] == signature:
+            logger.debug("ImportDB: loaded %d files from cache %s",
+                         len(filenames), cache_file)
+            return cls._from_cache_data(cached[1])
+        cached_fragments: Dict[Tuple[Any, ...], Tuple[Any, ...]] = {}
+        if cached is not None:
+            cached_fragments = dict(zip(cached[0], cached[2]))
+        fragments = cls._get_fragments(filenames, signature, cached_fragments)
+        result = cls._from_fragments(fragments)
+        if cache_file is not None:
+            result._save_to_cache(cache_file, signature, fragments)
+        return result
+
+    @staticmethod
+    def _cache_filename(filenames: Sequence[Filename]) -> Path:
+        key = "\0".join(str(f) for f in filenames)
+        digest = hashlib.sha256(key.encode("utf-8", "surrogateescape")).hexdigest()
+        return _importdb_cache_dir() / (
+            "%s.%s" % (digest, sys.implementation.cache_tag))
+
+    def _save_to_cache(
+        self,
+        cache_file: Path,
+        signature: Tuple[Any, ...],
+        fragments: Sequence[_ImportDBFragment],
+    ) -> None:
+        """
+        Write this `ImportDB`, and the per-file fragments it was merged from,
+        to ``cache_file``.  Failures are logged and otherwise ignored, since
+        the cache is only an optimization.
+        """
+        data = (_IMPORTDB_CACHE_VERSION, signature, self._to_cache_data(),
+                tuple(_fragment_to_cache_data(f) for f in fragments))
+        tmp_file = cache_file.with_name("%s.%d.tmp" % (cache_file.name, os.getpid()))
+        try:
+            cache_file.parent.mkdir(parents=True, exist_ok=True)
+            with open(tmp_file, "wb") as fp:
+                marshal.dump(data, fp)
+            # Atomically replace, so that concurrent readers never see a
+            # partially-written file.
+            os.replace(tmp_file, cache_file)
+        except OSError as e:
+            logger.debug("ImportDB: failed to write cache %s: %s",
+                         cache_file, e)
+            try:
+                os.unlink(tmp_file)
+            except OSError:
+                pass
+
+    def _to_cache_data(self) -> Tuple[Any, ...]:
+        """
+        Return the contents of this `ImportDB` as plain ``marshal``-able data.
+
+        The name index isn't included: `known_imports_trie` rebuilds it
+        lazily, one top-level package at a time, from ``known_imports``.
+        """
+        return (_importset_to_cache_data(self.known_imports),
+                _importset_to_cache_data(self.mandatory_imports),
+                dict(self.canonical_imports.items()),
+                _importset_to_cache_data(self.forget_imports))
+
+    @classmethod
+    def _from_cache_data(cls, data: Tuple[Any, ...]) -> "ImportDB":
+        """
+        Reconstruct an `ImportDB` from the output of `_to_cache_data`.
+
+        The cached sets already have ``__forget_imports__`` applied, so unlike
+        `_from_data` we don't filter them again.
+        """
+        known, mandatory, canonical, forget = data
+        self = object.__new__(cls)
+        self.known_imports     = _importset_from_cache_data(known)
+        self.mandatory_imports = _importset_from_cache_data(mandatory)
+        self.canonical_imports = ImportMap(canonical)
+        self.forget_imports    = _importset_from_cache_data(forget)
+        return self
 
     @classmethod
     def _parse_import_set(cls, arg: Any) -> ImportSet:
@@ -494,32 +1485,71 @@ class ImportDB:
         :rtype:
           ``dict`` mapping from ``str`` to tuple of `Import` s
         """
+        return dict(self.known_imports_trie.items())
+
+    @cached_attribute
+    def known_imports_trie(self) -> _DottedNameTrie:
+        """
+        Trie index of the names in `by_fullname_or_import_as`, supporting
+        deepest-prefix lookup and prefix enumeration.
+
+        :rtype:
+          `_DottedNameTrie`
+        """
         # Note: ``self.known_imports`` already has ``forget_imports`` removed
-        # (see `_from_data`).  We still subtract ``forget_imports`` again below
-        # because the prefix entries synthesized here (e.g. the "import foo.bar"
-        # implied by "from foo.bar import quux") are not present verbatim in
+        # (see `_from_data`).  We still pass ``forget_imports`` because the
+        # prefix entries implied here (e.g. the "import foo.bar" implied by
+        # "from foo.bar import quux") are not present verbatim in
         # ``known_imports`` and therefore aren't covered by that removal.
-        d = defaultdict(set)
-        for imp in self.known_imports.imports:
-            # Given an import like "from foo.bar import quux as QUUX", add the
-            # following entries:
-            #   - "QUUX"         => "from foo.bar import quux as QUUX"
-            #   - "foo.bar"      => "import foo.bar"
-            #   - "foo"          => "import foo"
-            # We don't include an entry labeled "quux" because the user has
-            # implied he doesn't want to pollute the global namespace with
-            # "quux", only "QUUX".
-            d[imp.import_as].add(imp)
-            for prefix in dotted_prefixes(imp.fullname)[:-1]:
-                d[prefix].add(Import.from_parts(prefix, prefix))
-        forget = set(self.forget_imports.imports)
-        # Drop entries that become empty after removing forgotten imports; an
-        # empty tuple here would otherwise trip up callers such as
-        # `get_known_import`, which assume every key maps to >= 1 import.
-        return dict( (k, tuple(sorted(remaining)))
-                     for k, v in d.items()
-                     for remaining in [v - forget]
-                     if remaining )
+        return _DottedNameTrie(self._imports_by_top_name,
+                               self.forget_imports.imports)
+
+    @cached_attribute
+    def _imports_by_top_name(self) -> Dict[str, List[Import]]:
+        return _group_by_top_name(self.known_imports.imports)
+
+    def get_member_names(self, parent: str) -> Tuple[str, ...]:
+        """
+        Return the known member names of module/package ``parent``, or the
+        known top-level names if ``parent`` is ``""``.
+
+        This is equivalent to ``self.known_imports.member_names.get(parent,
+        ())``, but only looks at the imports under the top-level package of
+        ``parent``.
+
+          >>> db = ImportDB("import numpy.linalg.info\nfrom sys import exit as EXIT")
+          >>> db.get_member_names("numpy")
+          ('linalg',)
+          >>> db.get_member_names("")
+          ('EXIT', 'numpy', 'sys')
+
+        :rtype:
+          ``tuple`` of ``str``
+        """
+        try:
+            return self._member_names_cache[parent]
+        except KeyError:
+            pass
+        if parent == "":
+            names = set()
+            for top, imports in self._imports_by_top_name.items():
+                for imp in imports:
+                    if _top_name(imp.fullname) == top or imp.import_as == top:
+                        names.add(top)
+                        break
+        else:
+            names = set()
+            imports = self._imports_by_top_name.get(_top_name(parent), [])
+            start = parent + "."
+            for imp in imports:
+                if imp.fullname.startswith(start):
+                    names.add(imp.fullname[len(start):].split(".", 1)[0])
+        result = self._member_names_cache[parent] = tuple(sorted(names))
+        return result
+
+    @cached_attribute
+    def _member_names_cache(self) -> Dict[str, Tuple[str, ...]]:
+        return {}
 
     def __repr__(self) -> str:
         printed = self.pretty_print()
@@ -544,3 +1574,46 @@ class ImportDB:
                 s += "  '%s',\n" % imp
             s += "]\n"
         return s
+
+
+class _MappedImportDB(ImportDB):
+    """
+    An `ImportDB` whose lookup index is a memory-mapped `ImportDBImage`.
+
+    `get_known_import` and ``forget_imports`` are served from the image.  The
+    other attributes load the full database the first time they're used.
+    """
+
+    _image: ImportDBImage
+
+    @classmethod
+    def _from_image(cls, image: ImportDBImage) -> "_MappedImportDB":
+        self = object.__new__(cls)
+        self._image = image
+        return self
+
+    @cached_attribute
+    def _full(self) -> ImportDB:
+        assert self._source_signature is not None
+        return ImportDB._load_filenames(self._source_filenames,
+                                        self._source_signature)
+
+    @cached_attribute
+    def known_imports(self) -> ImportSet: # type: ignore[override]
+        return self._full.known_imports
+
+    @cached_attribute
+    def mandatory_imports(self) -> ImportSet: # type: ignore[override]
+        return self._full.mandatory_imports
+
+    @cached_attribute
+    def canonical_imports(self) -> ImportMap: # type: ignore[override]
+        return self._full.canonical_imports
+
+    @cached_attribute
+    def forget_imports(self) -> ImportSet: # type: ignore[override]
+        return ImportSet._from_imports(list(self._image.forget_imports))
+
+    @cached_attribute
+    def known_imports_trie(self) -> ImportDBImage: # type: ignore[override]
+        return self._image
@@ -965,6 +965,7 @@ def fix_unused_and_missing_imports(
     db: Optional[ImportDB] = None,
     params: Any = None,
     tidy_local_imports: bool = False,
+    incremental: bool = False,
 ) -> PythonBlock:
     r"""
     Check for unused and missing imports, and fix them automatically.
@@ -1000,6 +1001,10 @@ def fix_unused_and_missing_imports(
     :param tidy_local_imports:
       If ``True``, also tidy imports within function and class bodies.
       Defaults to ``False``.
+    :param incremental:
+      If ``True``, reuse the analysis of top-level statements that are
+      unchanged since a previous call in this process.  See
+      `scan_for_import_issues`.
     :rtype:
       `PythonBlock`
     """
@@ -1037,7 +1042,8 @@ def fix_unused_and_missing_imports(
     finally:
         SourceToSourceFileImportsTransformation.tidy_local_imports = original_tidy_local
     missing_imports, unused_imports = scan_for_import_issues(
-        _codeblock, find_unused_imports=remove_unused, parse_docstrings=True
+        _codeblock, find_unused_imports=remove_unused, parse_docstrings=True,
+        incremental=incremental,
     )
     logger.debug("missing_imports = %r", missing_imports)
     logger.debug("unused_imports = %r", unused_imports)
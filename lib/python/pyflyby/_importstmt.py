@@ -8,6 +8,7 @@ from __future__ import annotations, print_function
 import ast
 from   collections              import namedtuple
 from   functools                import total_ordering
+import sys
 
 from   pyflyby._flags           import CompilerFlags
 from   pyflyby._format          import FormatParams, pyfill
@@ -126,9 +127,16 @@ class Import:
 
     """
 
+    # An interactive session holds one `Import` per entry in the import
+    # database, so keep them small: no instance ``__dict__``, and lazily
+    # computed attributes go in slots.
+    __slots__ = ("fullname", "import_as", "comment", "_split", "_flags")
+
     fullname:str
     import_as:str
-    comment: Optional[str] = None
+    comment: Optional[str]
+    _split: ImportSplit
+    _flags: CompilerFlags
 
     def __new__(cls, arg: Any) -> "Import":
         if isinstance(arg, cls):
@@ -187,7 +195,7 @@ class Import:
         else:
             return cls._from_statement(arg)
 
-    @cached_attribute
+    @property
     def split(self) -> "ImportSplit":
         """
         Split this `Import` into a ``ImportSplit`` which represents the
@@ -212,6 +220,14 @@ class Import:
         :rtype:
           `ImportSplit`
         """
+        try:
+            return self._split
+        except AttributeError:
+            pass
+        self._split = result = self._compute_split()
+        return result
+
+    def _compute_split(self) -> "ImportSplit":
         if self.import_as == self.fullname:
             return ImportSplit(None, self.fullname, None)
         level = 0
@@ -226,7 +242,8 @@ class Import:
         else:
             module_name = ''
             member_name = qname
-        module_name = prefix + module_name
+        # Imports from the same module share one module name string.
+        module_name = sys.intern(prefix + module_name)
         import_as: Optional[str] = self.import_as
         if import_as == member_name:
             import_as = None
@@ -304,16 +321,22 @@ class Import:
         return self.from_parts('.'.join(fullname_parts),
                                '.'.join(import_as_parts))
 
-    @cached_attribute
+    @property
     def flags(self) -> CompilerFlags:
         """
         If this is a __future__ import, then the compiler_flag associated with
         it.  Otherwise, 0.
         """
+        try:
+            return self._flags
+        except AttributeError:
+            pass
         if self.split.module_name == "__future__":
-            return CompilerFlags(self.split.member_name)
+            result = CompilerFlags(self.split.member_name)
         else:
-            return CompilerFlags.from_int(0)
+            result = CompilerFlags.from_int(0)
+        self._flags = result
+        return result
 
     @property
     def _data(self) -> Tuple[str, str]:
@@ -30,7 +30,11 @@ from   pyflyby._file            import Filename, atomic_write_file, read_file
 from   pyflyby._idents          import is_identifier
 from   pyflyby._importdb        import ImportDB
 from   pyflyby._log             import logger
-from   pyflyby._modules         import ModuleHandle
+from   pyflyby._modules         import (ModuleHandle, clear_import_profiles,
+                                        enable_import_profiling,
+                                        format_import_profiles,
+                                        import_profiles_to_json,
+                                        start_import_cache_warmer)
 from   pyflyby._parse           import PythonBlock
 from   pyflyby._util            import (AdviceCtx, Aspect, CwdCtx,
                                         FunctionWithGlobals, advise, indent)
@@ -633,30 +637,35 @@ def get_global_namespaces(ip):
 
 
 class NamespaceWithPotentialImports(dict):
-    def __init__(self, values, ip):
+    def __init__(self, values, ip, prefix=""):
         dict.__init__(values)
         self._ip = ip
+        self._prefix = prefix
 
     @property
     def _potential_imports_list(self):
         """Collect symbols that could be imported into the namespace.
 
+        Only names starting with ``prefix`` (as given to the constructor) are
+        collected.
+
         This needs to be executed each time because the context can change,
         e.g. when in pdb the frames and their namespaces will change."""
 
+        prefix = self._prefix
         db = None
         db = ImportDB.interpret_arg(db, target_filename=".")
-        known = db.known_imports
         # Check global names, including global-level known modules and
         # importable modules.
         results = set()
         namespaces = ScopeStack(get_global_namespaces(self._ip))
         for ns in namespaces:
             for name in ns:
-                if '.' not in name:
+                if '.' not in name and name.startswith(prefix):
                     results.add(name)
-        results.update(known.member_names.get("", []))
-        results.update([str(m) for m in ModuleHandle.list()])
+        results.update(n for n in db.get_member_names("")
+                       if n.startswith(prefix))
+        results.update(ModuleHandle.list_prefix(prefix))
         assert all('.' not in r for r in results)
         return sorted([r for r in results])
 
@@ -664,6 +673,46 @@ class NamespaceWithPotentialImports(dict):
         return list(self) + self._potential_imports_list
 
 
+def _autoimport_profile_magic(line):
+    """
+    Show the slowest imports done by the auto-importer.
+
+    Usage::
+
+      %autoimport_profile on        # start recording
+      %autoimport_profile [N]       # print the N (default 10) slowest imports
+      %autoimport_profile all       # print all imports, slowest first
+      %autoimport_profile json [F]  # write the imports as JSON to F or stdout
+      %autoimport_profile clear     # forget the imports recorded so far
+      %autoimport_profile off       # stop recording
+
+    Recording can also be enabled at startup with
+    ``PYFLYBY_PROFILE_IMPORTS=1``.
+    """
+    args = line.split()
+    command = args.pop(0) if args else "10"
+    if command == "on":
+        enable_import_profiling()
+    elif command == "off":
+        enable_import_profiling(False)
+    elif command == "clear":
+        clear_import_profiles()
+    elif command == "json":
+        text = import_profiles_to_json()
+        if args:
+            with open(args[0], "w") as f:
+                f.write(text + "\n")
+        else:
+            print(text)
+    elif command == "all":
+        print(format_import_profiles(None), end="")
+    elif command.isdigit():
+        print(format_import_profiles(int(command)), end="")
+    else:
+        raise ValueError("%%autoimport_profile: unexpected argument %r"
+                         % (command,))
+
+
 def _auto_import_hook(name: str):
     logger.debug("_auto_import_hook(%r)", name)
     ip = _get_ipython_app().shell
@@ -1268,6 +1317,7 @@ class AutoImporter:
         ok &= self._enable_run_hook(ip)
         ok &= self._enable_debugger_hook(ip)
         ok &= self._enable_ipython_shell_bugfixes(ip)
+        ok &= self._enable_profile_magic(ip)
         return ok
 
     def _enable_reset_hook(self, ip):
@@ -1537,9 +1587,14 @@ class AutoImporter:
         @self._advise(completer.global_matches)
         def global_matches_with_autoimport(name, *args, **kwargs):
             old_global_namespace = completer.global_namespace
+            # Only offer potential imports that can match ``name``.  IPython
+            # also matches snake_case abbreviations (e.g. "a_b" completes to
+            # "alpha_beta"), so only the part before the first "_" is a
+            # prefix of every match.
             completer.global_namespace = NamespaceWithPotentialImports(
                 old_global_namespace,
-                ip=self._ip
+                ip=self._ip,
+                prefix=name.split("_", 1)[0] or name,
             )
             try:
                 return self._safe_call(__original__, name, *args, **kwargs)
@@ -1556,13 +1611,12 @@ class AutoImporter:
             logger.debug("complete_object_hook(%r)", obj)
             # Get the database of known imports.
             db = ImportDB.interpret_arg(None, target_filename=".")
-            known = db.known_imports
             results = set(words)
             pname = obj.__name__
             # Is it a package/module?
             if sys.modules.get(pname, Ellipsis) is obj:
                 # Add known_imports entries from the database.
-                results.update(known.member_names.get(pname, []))
+                results.update(db.get_member_names(pname))
                 # Get the module handle.  Note that we use ModuleHandle() on the
                 # *name* of the module (``pname``) instead of the module instance
                 # (``obj``).  Using the module instance normally works, but
@@ -1680,6 +1734,21 @@ class AutoImporter:
         return ok
 
 
+    def _enable_profile_magic(self, ip):
+        """
+        Register the ``%autoimport_profile`` line magic.
+        """
+        if not hasattr(ip, "register_magic_function"):
+            logger.debug("Couldn't register %%autoimport_profile magic")
+            return False
+        ip.register_magic_function(_autoimport_profile_magic,
+                                   magic_kind="line",
+                                   magic_name="autoimport_profile")
+        def unregister_profile_magic():
+            ip.magics_manager.magics["line"].pop("autoimport_profile", None)
+        self._disablers.append(unregister_profile_magic)
+        return True
+
     def _enable_ipython_shell_bugfixes(self, ip):
         """
         Enable some advice that's actually just fixing bugs in IPython.
@@ -1887,6 +1956,9 @@ def load_ipython_extension(arg=Ellipsis):
     ImportDB.clear_default_cache()
     # Clear the set of errored imports.
     clear_failed_imports_cache()
+    # Start warming the module cache, if enabled, so that completion doesn't
+    # wait for it to be rebuilt.
+    start_import_cache_warmer()
     # Enable debugging tools.  These aren't IPython-specific, and are better
     # put in usercustomize.py.  But this is a convenient way for them to be
     # loaded.  They're fine to run again even if they've already been run via
@@ -5,19 +5,26 @@
 from __future__ import annotations, print_function
 
 import ast
+import atexit
+import bisect
+from   contextlib               import contextmanager
+import copy
+from   dataclasses              import asdict, dataclass, field
 from   functools                import cached_property, total_ordering
-import hashlib
 import importlib
 import itertools
 import json
+import marshal
 import os
 import pathlib
 import pkgutil
 import platformdirs
+import stat
 import textwrap
 
 from   pyflyby._fast_iter_modules \
-                                import _iter_file_finder_modules
+                                import (_iter_file_finder_modules,
+                                        _scan_directories)
 from   pyflyby._file            import FileText, Filename
 from   pyflyby._idents          import DottedIdentifier, is_identifier
 from   pyflyby._log             import logger
@@ -27,9 +34,12 @@ from   pyflyby._util            import (ExcludeImplicitCwdFromPathCtx, cmp,
 import re
 import shutil
 import sys
+import threading
+import time
 import types
-from   typing                   import (Any, Dict, Generator, List, Optional,
-                                        TYPE_CHECKING, Tuple, Union)
+from   typing                   import (Any, Dict, Generator, Iterable, List,
+                                        Optional, Sequence, Set, TYPE_CHECKING,
+                                        Tuple, Union)
 
 if TYPE_CHECKING:
     from   pyflyby._importclns   import ImportSet
@@ -46,7 +56,8 @@ class ErrorDuringImportError(ImportError):
 def rebuild_import_cache() -> None:
     """Force the import cache to be rebuilt.
 
-    The cache is deleted before calling _fast_iter_modules, which repopulates the cache.
+    The cache is deleted before calling _fast_iter_modules, which repopulates the cache
+    by scanning all the ``sys.path`` entries concurrently.
     """
     cache_dir = pathlib.Path(
         platformdirs.user_cache_dir(appname='pyflyby', appauthor=False)
@@ -54,23 +65,19 @@ def rebuild_import_cache() -> None:
     if cache_dir.is_dir():
         for path in cache_dir.iterdir():
             _remove_import_cache_entry(path)
-    _fast_iter_modules()
+    _module_indexes.clear()
+    list(_fast_iter_modules())
 
 
 def _remove_import_cache_entry(path: pathlib.Path) -> None:
     """Remove an entry from the pyflyby import cache.
 
-    The cache lives under ``<user cache dir>/pyflyby/`` and has two kinds of
-    entries:
-
-    - per-importer directories, named by the sha256 of the importer path, and
-    - the ``<mtime_ns>`` cache files inside them, each holding a JSON blob of
-      cached import names.
-
-    `rebuild_import_cache` removes whole per-importer directories, while
-    `_cached_module_finder` removes stale ``<mtime_ns>`` files before writing a
-    fresh one.  Either kind may be passed here, so a directory is removed
-    recursively and a file is unlinked directly.
+    The cache lives under ``<user cache dir>/pyflyby/``.  It holds the module
+    index ``modules.idx`` (see `_ModuleIndex`), the exports index
+    ``exports.idx`` (see `_ExportsIndex`), the compiled import databases under
+    ``importdb/``, and possibly per-importer directories
+    written by older versions of pyflyby.  A directory is removed recursively
+    and a file is unlinked directly.
 
     Parameters
     ----------
@@ -90,12 +97,127 @@ def _remove_import_cache_entry(path: pathlib.Path) -> None:
         )
 
 
+@dataclass
+class ImportProfile:
+    """
+    The cost of one import, as recorded by `profile_import`.
+
+    ``new_modules`` is the number of modules added to ``sys.modules`` by the
+    import (including the imported module itself), and ``memory_delta`` the
+    change in resident memory in bytes, or ``None`` if it can't be measured on
+    this platform.
+    """
+    statement: str
+    seconds: float
+    new_modules: int
+    memory_delta: Optional[int]
+    succeeded: bool
+
+
+_import_profiles: Optional[List[ImportProfile]] = (
+    [] if os.environ.get("PYFLYBY_PROFILE_IMPORTS", "0") == "1" else None)
+_import_profile_state = threading.local()
+
+
+def enable_import_profiling(enable: bool = True) -> None:
+    """
+    Start (or stop) recording the cost of the imports done by the
+    auto-importer; see `get_import_profiles`.  Profiling is also enabled at
+    startup if ``$PYFLYBY_PROFILE_IMPORTS`` is set to ``1``.
+    """
+    global _import_profiles
+    if not enable:
+        _import_profiles = None
+    elif _import_profiles is None:
+        _import_profiles = []
+
+
+def get_import_profiles() -> List[ImportProfile]:
+    """
+    Return the imports recorded since profiling was enabled, in order.
+    """
+    return list(_import_profiles or ())
+
+
+def clear_import_profiles() -> None:
+    """
+    Forget the imports recorded so far.
+    """
+    if _import_profiles is not None:
+        del _import_profiles[:]
+
+
+def format_import_profiles(count: Optional[int] = 10) -> str:
+    """
+    Format the ``count`` slowest recorded imports (all if ``None``) as a
+    table.
+    """
+    profiles = sorted(get_import_profiles(), key=lambda p: p.seconds,
+                      reverse=True)[:count]
+    lines = ["%9s %8s %10s  %s" % ("seconds", "modules", "memory MB",
+                                   "statement")]
+    for p in profiles:
+        memory = ("%10.1f" % (p.memory_delta / 2**20)
+                  if p.memory_delta is not None else "%10s" % "?")
+        lines.append("%9.3f %8d %s  %s%s" % (
+            p.seconds, p.new_modules, memory, p.statement,
+            "" if p.succeeded else " (failed)"))
+    return "\n".join(lines) + "\n"
+
+
+def import_profiles_to_json() -> str:
+    """
+    Return the recorded imports as a JSON list of objects, in order.
+    """
+    return json.dumps([asdict(p) for p in get_import_profiles()], indent=1)
+
+
+def _resident_memory() -> Optional[int]:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError, AttributeError):
+        return None
+
+
+@contextmanager
+def profile_import(statement: str) -> Generator[None, None, None]:
+    """
+    Context manager that records the cost of doing the import ``statement``
+    in its body, if import profiling is enabled (see
+    `enable_import_profiling`).  Imports nested in one that is being profiled
+    are accounted to the outer one.
+    """
+    profiles = _import_profiles
+    if profiles is None or getattr(_import_profile_state, "active", False):
+        yield
+        return
+    _import_profile_state.active = True
+    nmodules = len(sys.modules)
+    memory = _resident_memory()
+    start = time.perf_counter()
+    succeeded = False
+    try:
+        yield
+        succeeded = True
+    finally:
+        seconds = time.perf_counter() - start
+        _import_profile_state.active = False
+        new_memory = _resident_memory()
+        profiles.append(ImportProfile(
+            statement, seconds, len(sys.modules) - nmodules,
+            None if memory is None or new_memory is None
+            else new_memory - memory,
+            succeeded))
+
+
 @memoize
 def import_module(module_name: Any) -> types.ModuleType:
     module_name = str(module_name)
     logger.debug("Importing %r", module_name)
     try:
-        result = __import__(module_name, fromlist=['dummy'])
+        with profile_import("import %s" % (module_name,)):
+            result = __import__(module_name, fromlist=['dummy'])
         if result.__name__ != module_name:
             logger.debug("Note: import_module(%r).__name__ == %r",
                          module_name, result.__name__)
@@ -137,6 +259,100 @@ def import_module(module_name: Any) -> types.ModuleType:
             % (module_name, type(e).__name__, e)) from e
 
 
+_PREFETCH_MAX_WORKERS = 8
+
+
+def parallel_prefetch_enabled() -> bool:
+    """
+    Return whether the auto-importer should prefetch the modules it's about to
+    import in parallel (see `prefetch_modules`), i.e. whether
+    ``$PYFLYBY_PARALLEL_IMPORTS`` is set to ``1``.
+    """
+    return os.environ.get("PYFLYBY_PARALLEL_IMPORTS", "0") == "1"
+
+
+def _prefetch_module_group(names: List[str]) -> List[str]:
+    """
+    Find the specs of the modules ``names``, which must be in order of their
+    dotted names and share a top-level package, and read their source and
+    bytecode files.  Parent packages are located with
+    `importlib.machinery.PathFinder` rather than imported.
+
+    :return:
+      The names of the modules that were found.
+    """
+    found: List[str] = []
+    specs: Dict[str, Any] = {}
+    for name in names:
+        parent = name.rpartition(".")[0]
+        try:
+            if not parent:
+                spec = importlib.machinery.PathFinder.find_spec(name)
+            else:
+                module = sys.modules.get(parent)
+                if module is not None:
+                    path = getattr(module, "__path__", None)
+                else:
+                    pspec = specs.get(parent)
+                    path = pspec and pspec.submodule_search_locations
+                spec = (importlib.machinery.PathFinder.find_spec(name, list(path))
+                        if path else None)
+        except Exception:
+            spec = None
+        specs[name] = spec
+        if spec is None:
+            continue
+        found.append(name)
+        for filename in (spec.origin if spec.has_location else None,
+                         spec.cached):
+            if not filename:
+                continue
+            try:
+                with open(filename, "rb") as f:
+                    while f.read(1 << 20):
+                        pass
+            except OSError:
+                pass
+    return found
+
+
+def prefetch_modules(names: Iterable[str]) -> None:
+    """
+    Prepare to import the modules ``names``: locate them and read their files
+    into the operating system's cache, in a thread pool, with one task per
+    top-level package.  Nothing is imported, so the imports themselves can
+    then be done one at a time, in a deterministic order, without waiting for
+    each module's files in turn.
+
+    Parent packages of ``names`` are prefetched too.  Names that aren't
+    modules, or that are already imported, are skipped.  Modules that are
+    found are remembered as existing (see `ModuleHandle.exists`).
+    """
+    wanted: Set[str] = set()
+    for name in names:
+        wanted.update(str(p) for p in DottedIdentifier(name).prefixes)
+    groups: Dict[str, List[str]] = {}
+    for name in sorted(wanted):
+        if name in sys.modules:
+            continue
+        groups.setdefault(name.split(".", 1)[0], []).append(name)
+    if len(groups) < 2:
+        # Nothing to overlap.
+        return
+    from concurrent.futures import ThreadPoolExecutor
+    start = time.perf_counter()
+    with ThreadPoolExecutor(
+            max_workers=min(len(groups), _PREFETCH_MAX_WORKERS),
+            thread_name_prefix="pyflyby-prefetch") as pool:
+        results = list(pool.map(_prefetch_module_group, groups.values()))
+    for found in results:
+        for name in found:
+            ModuleHandle(name)._exists = True
+    logger.debug("Prefetched %d modules in %d packages in %.3fs",
+                 sum(map(len, results)), len(groups),
+                 time.perf_counter() - start)
+
+
 def _my_iter_modules(
     path: Optional[str], prefix: str = ''
 ) -> Generator[tuple[str, bool], None, None]:
@@ -180,6 +396,14 @@ def pyc_to_py(filename: str) -> str:
     return filename
 
 
+_module_list_generation = 0
+"""
+Incremented by `_module_list_changed` whenever the module index may list
+different modules, so that `ModuleHandle.list` results built from an older
+index are never reused.
+"""
+
+
 @total_ordering
 class ModuleHandle(object):
     """
@@ -256,30 +480,47 @@ class ModuleHandle(object):
         # Import.
         return import_module(self.name)
 
-    @cached_property
+    @property
     def exists(self) -> bool:
         """
         Return whether the module exists, according to pkgutil.
         Note that this doesn't work for things that are only known by using
         sys.meta_path.
+
+        Modules that are files on ``sys.path`` are found in the module index,
+        without importing their parent packages.  Once found, a module is
+        assumed to keep existing; modules that weren't found are remembered
+        until the directories they'd be found in change (see
+        `is_known_missing_module`).
         """
+        if self.__dict__.get("_exists"):
+            return True
         name = str(self.name)
         if name in sys.modules:
-            return True
-        if self.parent and not self.parent.exists:
+            result = True
+        elif self.parent and not self.parent.exists:
             return False
+        elif is_known_missing_module(name):
+            return False
+        elif _index_lookup(name) is not None:
+            result = True
+        else:
+            import importlib.util
+            find = importlib.util.find_spec
 
-        import importlib.util
-        find = importlib.util.find_spec
-
-        try:
-            pkg = find(name)
-        except Exception:
-            # Catch all exceptions, not just ImportError.  If the __init__.py
-            # for the parent package of the module raises an exception, it'll
-            # propagate to here.
-            pkg = None
-        return pkg is not None
+            try:
+                pkg = find(name)
+            except Exception:
+                # Catch all exceptions, not just ImportError.  If the __init__.py
+                # for the parent package of the module raises an exception, it'll
+                # propagate to here.
+                pkg = None
+            result = pkg is not None
+        if result:
+            self._exists = True
+        else:
+            record_missing_module(name)
+        return result
 
     @cached_property
     def filename(self) -> Optional[Filename]:
@@ -338,7 +579,6 @@ class ModuleHandle(object):
         return PythonBlock(self.text)
 
     @staticmethod
-    @memoize
     def list() -> list[str]:
         """Enumerate all top-level packages/modules.
 
@@ -351,9 +591,41 @@ class ModuleHandle(object):
 
         :return: A list of all importable module names
         """
+        return ModuleHandle._list(_module_list_generation)
+
+    @staticmethod
+    @memoize
+    def _list(generation: int) -> List[str]:
+        # ``generation`` is only part of the memoization key: if the warmer
+        # replaces the index while we're listing, the result is stored under
+        # the old generation and not looked up again.
         with ExcludeImplicitCwdFromPathCtx():
             return [mod.name for mod in _fast_iter_modules() if is_identifier(mod.name)]
 
+    @staticmethod
+    @memoize
+    def _sorted_list(generation: int) -> Tuple[str, ...]:
+        return tuple(sorted(set(ModuleHandle._list(generation))))
+
+    @staticmethod
+    def list_prefix(prefix: str) -> List[str]:
+        """Enumerate the top-level packages/modules whose names start with
+        ``prefix``.
+
+        This is the same as filtering `list`, but once the modules were
+        enumerated, it only costs a binary search and the number of matches.
+
+          >>> ModuleHandle.list_prefix("json")
+          ['json']
+
+        :return: A sorted list of importable module names
+        """
+        names = ModuleHandle._sorted_list(_module_list_generation)
+        start = end = bisect.bisect_left(names, prefix)
+        while end < len(names) and names[end].startswith(prefix):
+            end += 1
+        return list(names[start:end])
+
     @cached_property
     def submodules(self) -> Tuple["ModuleHandle", ...]:
         """
@@ -366,18 +638,29 @@ class ModuleHandle(object):
           ``tuple`` of `ModuleHandle` s
         """
         import pkgutil
-        module = self.module
-        try:
-            path = module.__path__
-        except AttributeError:
-            return ()
-        # Enumerate the modules at a given path.  Prefer to use ``pkgutil`` if
-        # we can.  However, if it fails due to OSError, use our own version
-        # which is robust to that.
-        try:
-            submodule_names = [t[1] for t in pkgutil.iter_modules(path)]
-        except OSError:
-            submodule_names = [t[0] for p in path for t in _my_iter_modules(p)]
+        name = str(self.name)
+        found = None if name in sys.modules else _index_lookup(name)
+        path: Sequence[str]
+        if found is not None:
+            # Found in the module index; no need to import the package.
+            if not found[1]:
+                return ()
+            path = [found[0]]
+        else:
+            module = self.module
+            try:
+                path = module.__path__
+            except AttributeError:
+                return ()
+        # Enumerate the modules at a given path.  Prefer to use the module
+        # index, then ``pkgutil`` if we can.  However, if it fails due to
+        # OSError, use our own version which is robust to that.
+        submodule_names = _indexed_submodule_names(path)
+        if submodule_names is None:
+            try:
+                submodule_names = [t[1] for t in pkgutil.iter_modules(path)]
+            except OSError:
+                submodule_names = [t[0] for p in path for t in _my_iter_modules(p)]
         return tuple(ModuleHandle("%s.%s" % (self.name,m))
                      for m in sorted(set(submodule_names)))
 
@@ -394,42 +677,26 @@ class ModuleHandle(object):
             return extractors[type(node)](node)
         return []
 
-    @cached_property
-    def exports(self) -> Optional["ImportSet"]:
+    @staticmethod
+    def _parse_exports(text: FileText, filename: Filename) -> "_ExportsSummary":
         """
-        Get symbols exported by this module.
-
-        Note that this will not recognize symbols that are dynamically
-        introduced to the module's namespace or __all__ list.
-
-        :rtype:
-          `ImportSet` or ``None``
-        :return:
-          Exports, or ``None`` if nothing exported.
+        Parse module source and extract what `exports` needs from it: the
+        top-level definitions, the value of ``__all__`` (or ``None`` if it
+        can't be determined statically), and the ``from`` imports as
+        ``(level, module, [(name, asname), ...])``.
         """
-        from pyflyby._importclns import ImportStatement, ImportSet
-
-        filename = getattr(self, 'filename', None)
-        if not filename or not filename.exists:
-            # Try to load the module to get the filename
-            filename = Filename(self.module.__file__)  # type: ignore[arg-type]
-        text = FileText(filename)
-
         ast_mod = ast.parse(str(text), str(filename)).body
 
-        # First, add members that are explicitly defined in the module
-        members = list(itertools.chain(*[self._member_from_node(n) \
+        members = list(itertools.chain(*[ModuleHandle._member_from_node(n) \
                                          for n in ast_mod]))
 
-        # If __all__ is defined, try to use it
+        # If __all__ is defined, try to reconstruct its value.
         all_is_good = False  # pun intended
-        all_members = []
+        all_members: List[Any] = []
         if "__all__" in members:
-            # Iterate through the nodes and reconstruct the
-            # value of __all__
             for n in ast_mod:
                 if isinstance(n, ast.Assign):
-                    if "__all__" in self._member_from_node(n):
+                    if "__all__" in ModuleHandle._member_from_node(n):
                         try:
                             all_members = list(ast.literal_eval(n.value))
                             all_is_good = True
@@ -442,34 +709,67 @@ class ModuleHandle(object):
                         all_members += list(ast.literal_eval(n.value))
                     except (ValueError, TypeError):
                         all_is_good = False
+
+        from_imports = [(n.level, n.module, [(a.name, a.asname) for a in n.names])
+                        for n in ast_mod if isinstance(n, ast.ImportFrom)]
+        return members, (all_members if all_is_good else None), from_imports
+
+    @cached_property
+    def exports(self) -> Optional["ImportSet"]:
+        """
+        Get symbols exported by this module.
+
+        Note that this will not recognize symbols that are dynamically
+        introduced to the module's namespace or __all__ list.
+
+        Unless ``$PYFLYBY_DISABLE_CACHE`` is set, the result of parsing the
+        module's source is kept in the exports index (see `_ExportsIndex`), so
+        the source is only parsed again once it changes.
+
+        :rtype:
+          `ImportSet` or ``None``
+        :return:
+          Exports, or ``None`` if nothing exported.
+        """
+        from pyflyby._importclns import ImportStatement, ImportSet
+
+        filename = getattr(self, 'filename', None)
+        if not filename or not filename.exists:
+            # Try to load the module to get the filename
+            filename = Filename(self.module.__file__)  # type: ignore[arg-type]
+
+        members, all_members, from_imports = _cached_exports_summary(filename)
+        # Copy, since the summary may be shared with the exports index.
+        members = list(members)
+
+        if "__all__" in members:
             if not all(type(s) == str for s in members):
                 raise Exception(
                     "Module %r contains non-string entries in __all__"
                     % (str(self.name),))
 
-        if all_is_good:
-            members = all_members
+        if all_members is not None:
+            members = list(all_members)
         else:
             # Add "from" imports that belong to submodules
             # (note: this will fail to recognize implicit relative imports)
-            imp_nodes = [n for n in ast_mod if isinstance(n, ast.ImportFrom)]
-            for imp_node in imp_nodes:
-                if imp_node.level == 0:
-                    from_mod = DottedIdentifier(imp_node.module)  # type: ignore[arg-type]
+            for level, module, names in from_imports:
+                if level == 0:
+                    from_mod = DottedIdentifier(module)  # type: ignore[arg-type]
                     if not from_mod.startswith(self.name):
                         continue
-                elif imp_node.level == 1 and \
+                elif level == 1 and \
                      filename.base == "__init__.py":
                     # Special case: a relative import can be from a submodule only if
                     # our module's filename is  __init__.py.
                     from_mod = self.name
-                    if imp_node.module:
-                        from_mod += imp_node.module
+                    if module:
+                        from_mod += module
                 else:
                     continue
-                for n in imp_node.names:  # type: ignore[assignment]
-                    m  = n.asname or n.name  # type: ignore[attr-defined]
-                    if n.name != "*" and not ModuleHandle(from_mod + m).exists:  # type: ignore[attr-defined]
+                for name, asname in names:
+                    m  = asname or name
+                    if name != "*" and not ModuleHandle(from_mod + m).exists:
                         members.append(m)
 
         # Filter by non-private.
@@ -587,14 +887,768 @@ def _format_path(path: Union[str, pathlib.Path]) -> str:
 SUFFIXES = sorted(importlib.machinery.all_suffixes())
 
 
+@dataclass
+class PathCacheStats:
+    """
+    Import cache statistics for one directory (a ``sys.path`` entry, or a
+    package directory under one).
+
+    ``hits`` counts the lookups served from the module index, and ``misses``
+    the times the directory had to be scanned.  ``trusted`` counts the times
+    its mtime was taken from the index instead of calling ``stat`` (see
+    `_directory_mtime_ns`).  ``scan_seconds`` only covers
+    the scans of this directory alone; directories rescanned together in one
+    concurrent batch are accounted in `ImportCacheStats.batch_scan_seconds`.
+    """
+    path: str
+    hits: int = 0
+    misses: int = 0
+    trusted: int = 0
+    entries: int = 0
+    scan_seconds: float = 0.0
+    stat_seconds: float = 0.0
+
+
+@dataclass
+class ImportCacheStats:
+    """
+    Statistics on the use of the import cache by this process, as returned by
+    `import_cache_stats`.
+    """
+    paths: Dict[str, PathCacheStats] = field(default_factory=dict)
+    index_reads: int = 0
+    index_bytes_read: int = 0
+    index_read_seconds: float = 0.0
+    batch_scans: int = 0
+    batch_scan_seconds: float = 0.0
+
+    def path(self, path: str) -> PathCacheStats:
+        try:
+            return self.paths[path]
+        except KeyError:
+            result = self.paths[path] = PathCacheStats(path)
+            return result
+
+    def format(self) -> str:
+        """
+        Format the statistics as a table, slowest directories first.
+        """
+        lines = ["%8s %8s %8s %8s %10s %10s  %s" % (
+            "hits", "misses", "trusted", "entries", "scan ms", "stat ms",
+            "path")]
+        for p in sorted(self.paths.values(),
+                        key=lambda p: p.scan_seconds + p.stat_seconds,
+                        reverse=True):
+            lines.append("%8d %8d %8d %8d %10.1f %10.1f  %s" % (
+                p.hits, p.misses, p.trusted, p.entries, p.scan_seconds * 1000,
+                p.stat_seconds * 1000, _format_path(p.path)))
+        lines.append("Read %d bytes of cache index in %d reads (%.1f ms)." % (
+            self.index_bytes_read, self.index_reads,
+            self.index_read_seconds * 1000))
+        lines.append("Scanned stale sys.path entries in %d batches (%.1f ms)." % (
+            self.batch_scans, self.batch_scan_seconds * 1000))
+        return "\n".join(lines) + "\n"
+
+
+_stats = ImportCacheStats()
+
+
+def import_cache_stats() -> ImportCacheStats:
+    """
+    Return a copy of the import cache statistics gathered by this process.
+
+    For each directory looked up in the module index, this counts the lookups
+    served from the index (hits) and the times it was scanned (misses), the
+    time spent scanning and stat-ing it, and the number of modules found.
+    Slow entries of ``sys.path`` are the ones with large scan or stat times.
+    """
+    return copy.deepcopy(_stats)
+
+
+def reset_import_cache_stats() -> None:
+    """
+    Reset the statistics returned by `import_cache_stats`.
+    """
+    global _stats
+    _stats = ImportCacheStats()
+
+
+def _timed_stat(path: str) -> os.stat_result:
+    """
+    ``os.stat(path)``, accounting the time taken in the import cache
+    statistics for ``path``.
+    """
+    start = time.perf_counter()
+    try:
+        return os.stat(path)
+    finally:
+        _stats.path(path).stat_seconds += time.perf_counter() - start
+
+
+_MODULE_INDEX_VERSION = 2
+"""
+Version of the on-disk format of the module index.  Bump this whenever the
+layout changes.
+"""
+
+
+class _ModuleIndex:
+    """
+    Cache of the modules found in directories on the import path, stored in a
+    single file under the user cache directory.
+
+    The file holds a ``marshal``-ed ``(version, rows, validated)``, where
+    ``rows`` maps each directory (a `importlib.machinery.FileFinder` path, or
+    a package directory under one) to the directory's ``st_mtime_ns`` at the
+    time it was scanned and the list of ``(module name, ispkg)`` found there,
+    and ``validated`` maps directories to the ``time.time()`` at which their
+    row was last known to be current (see `_directory_mtime_ns`).  The whole
+    index is read with a single read when opened, and written back (atomically)
+    by `flush`.
+    """
+
+    version = _MODULE_INDEX_VERSION
+
+    def __init__(self, filename: pathlib.Path) -> None:
+        self.filename = filename
+        self.rows, self.validated = self._read()
+        self._names: Dict[str, Dict[str, bool]] = {}
+        self._dirty: set[str] = set()
+        self._dirty_validated: set[str] = set()
+        # Held while writing, since the index may be shared with the
+        # background warmer (see `start_import_cache_warmer`).
+        self._lock = threading.RLock()
+
+    def _read(self) -> Tuple[Dict[str, Tuple[int, List[Tuple[str, bool]]]],
+                             Dict[str, float]]:
+        start = time.perf_counter()
+        try:
+            with open(self.filename, "rb") as fp:
+                raw = fp.read()
+            data = marshal.loads(raw)
+        except FileNotFoundError:
+            return {}, {}
+        except Exception as e:
+            logger.debug("Ignoring unreadable module index %s: %s: %s",
+                         self.filename, type(e).__name__, e)
+            return {}, {}
+        finally:
+            _stats.index_reads += 1
+            _stats.index_read_seconds += time.perf_counter() - start
+        _stats.index_bytes_read += len(raw)
+        if (isinstance(data, tuple) and len(data) == 3
+                and data[0] == self.version):
+            return data[1], data[2]
+        return {}, {}
+
+    def get(self, path: str, mtime_ns: int) -> Optional[List[Tuple[str, bool]]]:
+        """
+        Return the cached modules for ``path``, if it was scanned when its
+        mtime was ``mtime_ns``.
+        """
+        try:
+            cached_mtime_ns, modules = self.rows[path]
+        except KeyError:
+            return None
+        if cached_mtime_ns != mtime_ns:
+            return None
+        return modules
+
+    def get_names(self, path: str, mtime_ns: int) -> Optional[Dict[str, bool]]:
+        """
+        Like `get`, but return a dict mapping module names to ispkg.
+        """
+        modules = self.get(path, mtime_ns)
+        if modules is None:
+            return None
+        try:
+            return self._names[path]
+        except KeyError:
+            pass
+        names: Dict[str, bool] = {}
+        for module, ispkg in modules:
+            # A package shadows a module of the same name.
+            names[module] = names.get(module, False) or ispkg
+        self._names[path] = names
+        return names
+
+    def put(
+        self, path: str, mtime_ns: int, modules: List[Tuple[str, bool]]
+    ) -> None:
+        with self._lock:
+            self.rows[path] = (mtime_ns, [tuple(m) for m in modules]) # type: ignore[misc]
+            self._names.pop(path, None)
+            self._dirty.add(path)
+            self.validated[path] = time.time()
+            self._dirty_validated.add(path)
+
+    def validate(self, path: str, when: float) -> None:
+        """
+        Record that the row for ``path`` was found to be current at time
+        ``when`` (a ``time.time()``; ``0`` to forget).
+        """
+        with self._lock:
+            self.validated[path] = when
+            self._dirty_validated.add(path)
+
+    def flush(self) -> None:
+        """
+        Write the index back if it changed.
+
+        Rows written by other processes since the index was read are merged
+        in.  Concurrent writers may still overwrite each other's new rows; the
+        lost rows are simply rescanned next time.
+        """
+        with self._lock:
+            self._flush()
+
+    def _flush(self) -> None:
+        if not self._dirty and not self._dirty_validated:
+            return
+        rows, validated = self._read()
+        rows.update((path, self.rows[path]) for path in self._dirty)
+        validated.update((path, self.validated[path])
+                         for path in self._dirty_validated)
+        self.rows = rows
+        self.validated = validated
+        self._names.clear()
+        self._dirty.clear()
+        self._dirty_validated.clear()
+        tmp_filename = self.filename.with_name(
+            "%s.%d.tmp" % (self.filename.name, os.getpid()))
+        try:
+            self.filename.parent.mkdir(parents=True, exist_ok=True)
+            with open(tmp_filename, "wb") as fp:
+                marshal.dump((self.version, rows, validated), fp)
+            os.replace(tmp_filename, self.filename)
+        except OSError as e:
+            logger.debug("Failed to write module index %s: %s",
+                         self.filename, e)
+            try:
+                os.unlink(tmp_filename)
+            except OSError:
+                pass
+
+
+def _module_index_filename() -> pathlib.Path:
+    return pathlib.Path(
+        platformdirs.user_cache_dir(appname='pyflyby', appauthor=False)
+    ) / "modules.idx"
+
+
+_module_indexes: Dict[pathlib.Path, _ModuleIndex] = {}
+
+
+def _get_module_index() -> Optional[_ModuleIndex]:
+    """
+    Return the module index for this process, or ``None`` if
+    ``$PYFLYBY_DISABLE_CACHE`` is set.
+    """
+    if os.environ.get("PYFLYBY_DISABLE_CACHE", "0") == "1":
+        return None
+    filename = _module_index_filename()
+    try:
+        return _module_indexes[filename]
+    except KeyError:
+        pass
+    index = _module_indexes[filename] = _ModuleIndex(filename)
+    # Entries validated by `_directory_mtime_ns` are written back at exit.
+    atexit.register(index.flush)
+    return index
+
+
+_EXPORTS_INDEX_VERSION = 1
+"""
+Version of the on-disk format of the exports index.  Bump this whenever the
+layout, or the summary computed by `ModuleHandle._parse_exports`, changes.
+"""
+
+
+_ExportsSummary = Tuple[
+    List[str],
+    Optional[List[Any]],
+    List[Tuple[int, Optional[str], List[Tuple[str, Optional[str]]]]],
+]
+
+
+class _ExportsIndex(_ModuleIndex):
+    """
+    Cache of what `ModuleHandle.exports` extracts from module source files,
+    stored in a single file next to the module index.
+
+    ``rows`` maps each source filename to its ``(st_mtime_ns, st_size)`` at
+    the time it was parsed, and the summary returned by
+    `ModuleHandle._parse_exports`.  Since a run of ``collect-exports`` may
+    parse thousands of files, the index is not flushed on every `put`, but
+    when the process exits.
+    """
+
+    version = _EXPORTS_INDEX_VERSION
+
+    def get(  # type: ignore[override]
+        self, path: str, stamp: Tuple[int, int]
+    ) -> Optional[_ExportsSummary]:
+        try:
+            cached_stamp, summary = self.rows[path]
+        except KeyError:
+            return None
+        if tuple(cached_stamp) != stamp:  # type: ignore[arg-type]
+            return None
+        return summary  # type: ignore[return-value]
+
+    def put(  # type: ignore[override]
+        self, path: str, stamp: Tuple[int, int], summary: _ExportsSummary
+    ) -> None:
+        with self._lock:
+            self.rows[path] = (stamp, summary)  # type: ignore[assignment]
+            self._dirty.add(path)
+
+
+def _exports_index_filename() -> pathlib.Path:
+    return _module_index_filename().with_name("exports.idx")
+
+
+def _get_exports_index() -> Optional[_ExportsIndex]:
+    """
+    Return the exports index for this process, or ``None`` if
+    ``$PYFLYBY_DISABLE_CACHE`` is set.
+    """
+    if os.environ.get("PYFLYBY_DISABLE_CACHE", "0") == "1":
+        return None
+    filename = _exports_index_filename()
+    try:
+        return _module_indexes[filename]  # type: ignore[return-value]
+    except KeyError:
+        pass
+    index = _ExportsIndex(filename)
+    _module_indexes[filename] = index
+    atexit.register(index.flush)
+    return index
+
+
+def _cached_exports_summary(filename: Filename) -> _ExportsSummary:
+    """
+    Return `ModuleHandle._parse_exports` for ``filename``, from the exports
+    index if the file's mtime and size haven't changed since it was parsed.
+    """
+    index = _get_exports_index()
+    path = str(filename)
+    stamp = None
+    if index is not None:
+        try:
+            # Stat before reading, so that a concurrent edit leaves a stale
+            # entry rather than a wrong one.
+            st = os.stat(path)
+        except OSError:
+            pass
+        else:
+            stamp = (st.st_mtime_ns, st.st_size)
+            summary = index.get(path, stamp)
+            if summary is not None:
+                return summary
+    summary = ModuleHandle._parse_exports(FileText(filename), filename)
+    if index is not None and stamp is not None:
+        index.put(path, stamp, summary)
+    return summary
+
+
+def _get_import_cache_ttl() -> Optional[float]:
+    """
+    Return the value of ``$PYFLYBY_IMPORT_CACHE_TTL`` in seconds, or ``None``
+    if directories are re-stat'ed on every lookup.
+    """
+    value = os.environ.get("PYFLYBY_IMPORT_CACHE_TTL", "")
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        logger.warning("Ignoring invalid PYFLYBY_IMPORT_CACHE_TTL=%r", value)
+        return None
+
+
+def _trusted_mtime_ns(index: _ModuleIndex, path: str) -> Optional[int]:
+    """
+    Return the mtime recorded in the module index for directory ``path``, if
+    ``$PYFLYBY_IMPORT_CACHE_TTL`` is set and the entry was validated (by any
+    process) less than that many seconds ago.
+    """
+    ttl = _get_import_cache_ttl()
+    if ttl is None:
+        return None
+    row = index.rows.get(path)
+    if row is None or time.time() - index.validated.get(path, 0.0) >= ttl:
+        return None
+    _stats.path(path).trusted += 1
+    return row[0]
+
+
+def _directory_mtime_ns(index: _ModuleIndex, path: str) -> Optional[int]:
+    """
+    Return the ``st_mtime_ns`` of directory ``path``, or ``None`` if it's not
+    a directory.
+
+    If ``$PYFLYBY_IMPORT_CACHE_TTL`` is set, the mtime recorded in the module
+    index is trusted without calling ``stat`` for that many seconds after the
+    entry was last found to be current.  Use `invalidate_import_cache` after
+    installing packages to see them before then.
+    """
+    mtime_ns = _trusted_mtime_ns(index, path)
+    if mtime_ns is not None:
+        return mtime_ns
+    try:
+        st = _timed_stat(path)
+    except OSError:
+        return None
+    if not stat.S_ISDIR(st.st_mode):
+        return None
+    if (_get_import_cache_ttl() is not None
+            and index.get(path, st.st_mtime_ns) is not None):
+        # Let other processes trust this entry too.
+        index.validate(path, time.time())
+    return st.st_mtime_ns
+
+
+def invalidate_import_cache(paths: Optional[List[str]] = None) -> None:
+    """
+    Make the next lookups check the import cache against the filesystem.
+
+    With ``$PYFLYBY_IMPORT_CACHE_TTL`` set, directories aren't re-stat'ed
+    until their entries expire, so packages installed in the meantime (e.g. by
+    ``pip install``) aren't seen.  Call this (``py
+    pyflyby.invalidate_import_cache`` from a shell) to expire the entries for
+    all directories, or only for ``paths``, in all processes.  The memoized
+    `ModuleHandle.list` and the cache of missing modules are cleared as well.
+    """
+    index = _get_module_index()
+    if index is not None:
+        if paths is None:
+            paths = list(index.validated)
+        for path in paths:
+            index.validate(os.path.abspath(path), 0.0)
+        index.flush()
+    _module_list_changed()
+    clear_missing_modules_cache()
+
+
+def _module_list_changed() -> None:
+    """
+    Forget the memoized `ModuleHandle.list`, including any result that is
+    still being built from the old module index.
+    """
+    global _module_list_generation
+    _module_list_generation += 1
+    ModuleHandle._list.cache_clear()
+    ModuleHandle._sorted_list.cache_clear()
+
+
+def _indexed_names(
+    index: _ModuleIndex, path: str, package: bool
+) -> Optional[Dict[str, bool]]:
+    """
+    Return the modules in directory ``path``, as a dict mapping module names to
+    ispkg, from the module index.
+
+    If the index entry is missing or stale, only ``path`` itself is scanned
+    again; package directories under it are scanned when they're looked up.
+    New entries are written to the index file at exit, together with the
+    other changes made by this process (see `_get_module_index`).
+
+    :param package:
+      Whether ``path`` is a package directory rather than a ``sys.path``
+      entry.  While the background warmer runs, stale ``sys.path`` entries
+      are served from the last snapshot.
+    :return:
+      ``None`` if ``path`` is not a directory.
+    """
+    mtime_ns = _directory_mtime_ns(index, path)
+    if mtime_ns is None:
+        return None
+    path_stats = _stats.path(path)
+    names = index.get_names(path, mtime_ns)
+    if names is None and not package and path in index.rows and _warming():
+        # Serve the last snapshot while the warmer rescans.
+        names = index.get_names(path, index.rows[path][0])
+    if names is not None:
+        path_stats.hits += 1
+        path_stats.entries = len(names)
+        return names
+    path_stats.misses += 1
+    start = time.perf_counter()
+    [(scanned_mtime_ns, modules)] = _scan_directories([path], SUFFIXES, 1)
+    path_stats.scan_seconds += time.perf_counter() - start
+    if scanned_mtime_ns < 0:
+        return None
+    path_stats.entries = len(modules)
+    index.put(path, scanned_mtime_ns, modules)
+    return index.get_names(path, scanned_mtime_ns)
+
+
+def _index_lookup(name: str) -> Optional[Tuple[str, bool]]:
+    """
+    Find a module in the module index, without importing it or its parents.
+
+    The top-level module is looked up in the `importlib.machinery.FileFinder`
+    entries of ``sys.path``, in order, and submodules in the package
+    directories under it.  This only sees modules that are plain files and
+    directories on ``sys.path``; modules provided by ``sys.meta_path`` hooks,
+    or by packages that extend their ``__path__``, are not found.
+
+    :return:
+      ``(path, ispkg)``, where ``path`` is the package directory if ``ispkg``;
+      or ``None`` if the module wasn't found.
+    """
+    index = _get_module_index()
+    if index is None:
+        return None
+    parts = name.split(".")
+    top = parts[0]
+    for entry in list(sys.path):
+        importer = pkgutil.get_importer(entry)
+        if not isinstance(importer, importlib.machinery.FileFinder):
+            continue
+        names = _indexed_names(index, str(importer.path), package=False)
+        if names is not None and top in names:
+            path = os.path.join(importer.path, top)
+            ispkg = names[top]
+            break
+    else:
+        return None
+    module = sys.modules.get(top)
+    if module is not None:
+        # The top-level module was already imported.  Only trust the index if
+        # it was imported from the same place.
+        if not ispkg or path not in (getattr(module, "__path__", None) or ()):
+            return None
+    for part in parts[1:]:
+        if not ispkg:
+            return None
+        names = _indexed_names(index, path, package=True)
+        if names is None or part not in names:
+            return None
+        path = os.path.join(path, part)
+        ispkg = names[part]
+    return path, ispkg
+
+
+def _indexed_submodule_names(path: Sequence[str]) -> Optional[List[str]]:
+    """
+    Return the names of the modules in the package directories ``path`` (a
+    package's ``__path__``), from the module index.
+
+    :return:
+      ``None`` if the index is disabled, or some entry of ``path`` is not a
+      directory.
+    """
+    index = _get_module_index()
+    if index is None:
+        return None
+    result: List[str] = []
+    for p in path:
+        names = _indexed_names(index, p, package=True)
+        if names is None:
+            return None
+        result.extend(names)
+    return result
+
+
+def _refresh_module_index(index: _ModuleIndex) -> Dict[str, Optional[int]]:
+    """
+    Rescan the `importlib.machinery.FileFinder` paths of ``sys.path`` whose
+    entries in the module index are missing or stale.
+
+    The stale paths are scanned concurrently in one batch, so that rebuilding
+    the cache on a network filesystem doesn't pay the latency of each
+    directory in turn.
+
+    :return:
+      The mtime of each path, as `_directory_mtime_ns` would return it, so
+      that callers don't need to stat the paths again.
+    """
+    mtimes: Dict[str, Optional[int]] = {}
+    stale: List[str] = []
+    for entry in list(sys.path):
+        importer = pkgutil.get_importer(entry)
+        if not isinstance(importer, importlib.machinery.FileFinder):
+            continue
+        path = str(importer.path)
+        if path in mtimes:
+            continue
+        mtime_ns = mtimes[path] = _directory_mtime_ns(index, path)
+        if mtime_ns is None:
+            continue
+        if index.get(path, mtime_ns) is None:
+            stale.append(path)
+    if not stale:
+        return mtimes
+    if os.environ.get("PYFLYBY_SUPPRESS_CACHE_REBUILD_LOGS", "1") != "1":
+        for path in stale:
+            logger.info(f"Rebuilding cache for {_format_path(path)}...")
+    start = time.perf_counter()
+    scanned = _scan_directories(stale, SUFFIXES)
+    _stats.batch_scans += 1
+    _stats.batch_scan_seconds += time.perf_counter() - start
+    for path, (mtime_ns, modules) in zip(stale, scanned):
+        path_stats = _stats.path(path)
+        path_stats.misses += 1
+        if mtime_ns >= 0:
+            path_stats.entries = len(modules)
+            index.put(path, mtime_ns, modules)
+            mtimes[path] = mtime_ns
+        else:
+            mtimes[path] = None
+    return mtimes
+
+
+_MISSING_MODULES_SIZE = 1024
+"""
+Maximum number of entries in the cache of missing modules.
+"""
+
+_missing_modules: Dict[str, Tuple[Any, ...]] = {}
+
+
+def _missing_module_key(name: str) -> Optional[Tuple[Any, ...]]:
+    """
+    Return a key that changes whenever module ``name`` could have started to
+    exist: the directories it would be looked up in, with their mtimes, and
+    the ``sys.meta_path`` finders.
+
+    :return:
+      ``None`` if the directories aren't known without importing the parent
+      package.
+    """
+    parent = name.rpartition(".")[0]
+    if not parent:
+        entries = sys.path
+    else:
+        module = sys.modules.get(parent)
+        if module is not None:
+            entries = list(getattr(module, "__path__", None) or ())
+        else:
+            found = _index_lookup(parent)
+            if found is None:
+                return None
+            entries = [found[0]] if found[1] else []
+    index = _get_module_index()
+    key: List[Any] = [tuple(map(id, sys.meta_path))]
+    for entry in entries:
+        entry = entry or os.getcwd()
+        mtime_ns = None
+        if index is not None and isinstance(entry, str):
+            mtime_ns = _trusted_mtime_ns(index, entry)
+        if mtime_ns is None:
+            try:
+                mtime_ns = os.stat(entry).st_mtime_ns
+            except (OSError, TypeError, ValueError):
+                mtime_ns = -1
+        key.append((entry, mtime_ns))
+    return tuple(key)
+
+
+def is_known_missing_module(name: str) -> bool:
+    """
+    Return whether module ``name`` was recorded as missing by
+    `record_missing_module`, and none of the directories it would be found in
+    changed since.
+    """
+    try:
+        key = _missing_modules[name]
+    except KeyError:
+        return False
+    if _missing_module_key(name) == key:
+        return True
+    _missing_modules.pop(name, None)
+    return False
+
+
+def record_missing_module(name: str) -> None:
+    """
+    Record that module ``name`` doesn't exist.
+
+    At most ``_MISSING_MODULES_SIZE`` modules are remembered; the oldest
+    entries are dropped first.
+    """
+    key = _missing_module_key(name)
+    if key is None:
+        return
+    _missing_modules.pop(name, None)
+    _missing_modules[name] = key
+    while len(_missing_modules) > _MISSING_MODULES_SIZE:
+        del _missing_modules[next(iter(_missing_modules))]
+
+
+def clear_missing_modules_cache() -> None:
+    """
+    Forget all the modules recorded by `record_missing_module`.
+    """
+    _missing_modules.clear()
+
+
+_warmer: Optional[threading.Thread] = None
+
+
+def _warming() -> bool:
+    """
+    Return whether the background warmer is rescanning the module index.
+    """
+    return _warmer is not None and _warmer.is_alive()
+
+
+def _warm_import_cache(index: _ModuleIndex) -> None:
+    try:
+        _refresh_module_index(index)
+        changed = bool(index._dirty)
+        index.flush()
+    except Exception as e:
+        logger.debug("Failed to warm the import cache: %s: %s",
+                     type(e).__name__, e)
+        return
+    if changed:
+        # ModuleHandle.list() may have been computed from the old snapshot.
+        _module_list_changed()
+
+
+def start_import_cache_warmer() -> Optional[threading.Thread]:
+    """
+    If ``$PYFLYBY_WARM_IMPORT_CACHE`` is set to ``1``, start revalidating and
+    rebuilding the module cache in a background thread.
+
+    Until the thread is done, listing modules (e.g. for tab completion) is
+    served from the last snapshot of the cache instead of waiting for stale
+    directories to be scanned.  Directories that aren't in the snapshot at all
+    are still scanned on demand.
+
+    :return:
+      The warmer thread, or ``None`` if it's not enabled.
+    """
+    global _warmer
+    if os.environ.get("PYFLYBY_WARM_IMPORT_CACHE", "0") != "1":
+        return None
+    index = _get_module_index()
+    if index is None:
+        return None
+    if _warming():
+        return _warmer
+    _warmer = threading.Thread(target=_warm_import_cache, args=(index,),
+                               name="pyflyby-import-cache-warmer",
+                               daemon=True)
+    _warmer.start()
+    return _warmer
+
+
 def _cached_module_finder(
-    importer: importlib.machinery.FileFinder, prefix: str = ""
+    importer: importlib.machinery.FileFinder,
+    prefix: str = "",
+    index: Optional[_ModuleIndex] = None,
+    snapshot: bool = False,
+    mtimes: Optional[Dict[str, Optional[int]]] = None,
 ) -> Generator[tuple[str, bool], None, None]:
     """Yield the modules found by the importer.
 
-    The importer path's mtime is recorded; if the path and mtime have a corresponding
-    cache file, the modules recorded in the cache file are returned. Otherwise, the
-    cache is rebuilt.
+    The importer path's mtime is recorded; if the module index has an entry for
+    the path with the same mtime, the modules recorded there are returned.
+    Otherwise, the path is scanned again and the entry is replaced.
 
     Parameters
     ----------
@@ -602,6 +1656,15 @@ def _cached_module_finder(
         FileFinder importer that points to a path under which imports can be found
     prefix : str
         String to affix to the beginning of each module name
+    index : _ModuleIndex, optional
+        Module index to use, which the caller will flush.  If not given, the
+        process's index is used, and flushed if it changed.
+    snapshot : bool
+        If true, return the modules recorded in the index for the path, even if
+        they're stale.  The path is only scanned if it's not in the index.
+    mtimes : dict, optional
+        Mtimes of directories that were already stat'ed, as returned by
+        `_refresh_module_index`.  The path isn't stat'ed again if it's here.
 
     Returns
     -------
@@ -610,32 +1673,43 @@ def _cached_module_finder(
         package or not)
     """
     if os.environ.get("PYFLYBY_DISABLE_CACHE", "0") == "1":
-        modules = _iter_file_finder_modules(importer, SUFFIXES)
-        for module, ispkg in modules:
+        for module, ispkg in _iter_file_finder_modules(importer, SUFFIXES):
             yield prefix + module, ispkg
         return
 
-    cache_dir = pathlib.Path(
-        platformdirs.user_cache_dir(appname='pyflyby', appauthor=False)
-    ) / hashlib.sha256(str(importer.path).encode()).hexdigest()
-    cache_file = cache_dir / str(os.stat(importer.path).st_mtime_ns)
-
-    if cache_file.exists():
-        with open(cache_file) as fp:
-            modules = json.load(fp)
+    if index is None:
+        own_index = index = _get_module_index()
+        assert index is not None
     else:
-        # Generate the cache dir if it doesn't exist, and remove any existing cache
-        # files for the given import path
-        cache_dir.mkdir(parents=True, exist_ok=True)
-        for path in cache_dir.iterdir():
-            _remove_import_cache_entry(path)
-
-        if os.environ.get("PYFLYBY_SUPPRESS_CACHE_REBUILD_LOGS", "1") != "1":
-            logger.info(f"Rebuilding cache for {_format_path(importer.path)}...")
-
-        modules = _iter_file_finder_modules(importer, SUFFIXES)
-        with open(cache_file, 'w') as fp:
-            json.dump(modules, fp)
+        own_index = None
+    path = str(importer.path)
+    modules: Optional[List[Tuple[str, bool]]]
+    path_stats = _stats.path(path)
+    hit = True
+    if snapshot and path in index.rows:
+        modules = index.rows[path][1]
+    else:
+        if mtimes is not None and path in mtimes:
+            mtime_ns = mtimes[path]
+        else:
+            mtime_ns = _directory_mtime_ns(index, path)
+        if mtime_ns is None:
+            return
+        modules = index.get(path, mtime_ns)
+        if modules is None:
+            if os.environ.get("PYFLYBY_SUPPRESS_CACHE_REBUILD_LOGS", "1") != "1":
+                logger.info(f"Rebuilding cache for {_format_path(importer.path)}...")
+            hit = False
+            path_stats.misses += 1
+            start = time.perf_counter()
+            modules = list(_iter_file_finder_modules(importer, SUFFIXES))
+            path_stats.scan_seconds += time.perf_counter() - start
+            index.put(path, mtime_ns, modules)
+            if own_index is not None:
+                own_index.flush()
+    if hit:
+        path_stats.hits += 1
+    path_stats.entries = len(modules)
 
     for module, ispkg in modules:
         yield prefix + module, ispkg
@@ -647,15 +1721,36 @@ def _fast_iter_modules() -> Generator[pkgutil.ModuleInfo, None, None]:
     This function patches `pkgutil.iter_importer_modules` for
     `importlib.machinery.FileFinder` types, causing `pkgutil.iter_importer_modules` to
     call our own custom _iter_file_finder_modules instead of
-    pkgutil._iter_file_finder_modules.
+    pkgutil._iter_file_finder_modules.  Stale entries of the module index are
+    rescanned first, in one concurrent batch (see `_refresh_module_index`),
+    unless the background warmer is already doing so.
 
     :return: The modules that are importable by python
     """
+    # Write the module index back once at the end, rather than once per path.
+    index = _get_module_index()
+    # While the background warmer is rescanning, serve the last snapshot
+    # rather than waiting for the scan.
+    snapshot = _warming()
+    # Each path is stat'ed once, by the refresh pass.
+    mtimes: Optional[Dict[str, Optional[int]]] = None
+    if index is not None and not snapshot:
+        mtimes = _refresh_module_index(index)
+
+    def finder(
+        importer: importlib.machinery.FileFinder, prefix: str = ""
+    ) -> Generator[tuple[str, bool], None, None]:
+        return _cached_module_finder(importer, prefix, index, snapshot, mtimes)
+
     pkgutil.iter_importer_modules.register(  # type: ignore[attr-defined]
-        importlib.machinery.FileFinder, _cached_module_finder
-    )
-    yield from pkgutil.iter_modules()
-    pkgutil.iter_importer_modules.register(  # type: ignore[attr-defined]
-        importlib.machinery.FileFinder,
-        pkgutil._iter_file_finder_modules,  # type: ignore[attr-defined]
+        importlib.machinery.FileFinder, finder
     )
+    try:
+        yield from pkgutil.iter_modules()
+    finally:
+        pkgutil.iter_importer_modules.register(  # type: ignore[attr-defined]
+            importlib.machinery.FileFinder,
+            pkgutil._iter_file_finder_modules,  # type: ignore[attr-defined]
+        )
+        if index is not None:
+            index.flush()
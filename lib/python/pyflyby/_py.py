@@ -124,6 +124,10 @@ Options
       --version        Print pyflyby version or version of a module.
       --help, --h, --? Print this help or help for a function or module.
       --source, --??   Print source code for a function or module.
+      --import-cache-stats
+                       List all importable modules, then print how much the
+                       import cache was used for each sys.path entry and how
+                       long scanning and stat-ing each one took.
 
 
 Examples
@@ -310,7 +314,8 @@ from   pyflyby._interactive     import (get_ipython_terminal_app_with_autoimport
                                         run_ipython_line_magic,
                                         start_ipython_with_autoimporter)
 from   pyflyby._log             import logger
-from   pyflyby._modules         import ModuleHandle
+from   pyflyby._modules         import (ModuleHandle, import_cache_stats,
+                                        start_import_cache_warmer)
 from   pyflyby._parse           import PythonBlock
 from   pyflyby._util            import indent, prefixes
 
@@ -1647,6 +1652,10 @@ class _PyMain(object):
                 % (module.__name__,))
         print(version)
 
+    def print_import_cache_stats(self):
+        ModuleHandle.list()
+        sys.stdout.write(import_cache_stats().format())
+
     def print_help(self, objname, verbosity=1):
         objname = objname and objname.strip()
         if not objname:
@@ -1959,6 +1968,9 @@ class _PyMain(object):
             if equalsign:
                 args.insert(0, cmdarg)
             self.print_help(args[0] if args else None, verbosity=1)
+        elif action in ["import-cache-stats", "import_cache_stats"]:
+            nocmdarg()
+            self.print_import_cache_stats()
         elif action in ["pinfo"]:
             self.print_help(popcmdarg(), verbosity=1)
         elif action in ["source", "pinfo2", "??"]:
@@ -2062,6 +2074,7 @@ class _PyMain(object):
 def py_main(args=None):
     if args is None:
         args = sys.argv[1:]
+    start_import_cache_warmer()
     _PyMain(args).run()
 
 
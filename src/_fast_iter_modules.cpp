@@ -2,9 +2,15 @@
 #include "pybind11/pytypes.h"
 #include <pybind11/pybind11.h>
 #include <pybind11/stl.h>
+#include <sys/stat.h>
+#include <algorithm>
+#include <atomic>
+#include <cstdint>
 #include <filesystem>
 #include <string>
+#include <thread>
 #include <tuple>
+#include <utility>
 #include <vector>
 
 namespace py = pybind11;
@@ -31,41 +37,31 @@ std::string getmodulename(fs::path path, std::vector<std::string> suffixes) {
     return "";
 }
 
+using ModuleList = std::vector<std::tuple<std::string, bool>>;
+
 /**
- * @brief Get a list of importable python modules.
+ * @brief List the importable python modules in a directory.
  *
- *      See `pkgutil._iter_file_finder_modules` for the original python version.
+ *      This doesn't touch any python objects, so it may be called without holding
+ *      the GIL.
  *
- * @param importer Importer instance containing an import path. Typically this is an object of type
- *      `importlib.machinery.FileFinder`
- * @param suffixes Suffixes of valid python modules. Typically this is
- *      `importlib.machinery.all_suffixes()`
+ * @param path Directory to list
+ * @param suffixes Suffixes of valid python modules
  * @return A vector of tuples containing modules names, and a boolean indicating whether the module
  *      is a package or not
  */
-std::vector<std::tuple<std::string, bool>>
-_iter_file_finder_modules(
-    py::object importer,
-    std::vector<std::string> suffixes
-) {
-  std::vector<std::tuple<std::string, bool>> ret;
-
-  // The importer doesn't have a path
-  py::object path_obj = importer.attr("path");
-  if (path_obj.is_none()) {
-    return ret;
-  }
-
-  // The importer's path isn't an existing directory
-  fs::path path = fs::path(py::str(path_obj).cast<std::string>());
-  if (!fs::is_directory(path) || !fs::exists(path)) {
-    return ret;
-  }
+ModuleList scan_directory(const fs::path& path, const std::vector<std::string>& suffixes) {
+  ModuleList ret;
 
   // Attempt to iterate the directory. If the directory is unreadable for any reason
   // (e.g., permissions, non-existent, or other system errors), fs::directory_iterator
   // will throw a filesystem_error. We catch this and return an empty list for this path.
   try {
+    // The path isn't an existing directory
+    if (!fs::is_directory(path) || !fs::exists(path)) {
+      return ret;
+    }
+
     for (auto const &entry : fs::directory_iterator(path)) {
       fs::path entry_path = entry.path();
       fs::path filename = entry_path.filename();
@@ -96,6 +92,113 @@ _iter_file_finder_modules(
   return ret;
 }
 
+/**
+ * @brief Get a list of importable python modules.
+ *
+ *      See `pkgutil._iter_file_finder_modules` for the original python version.
+ *
+ * @param importer Importer instance containing an import path. Typically this is an object of type
+ *      `importlib.machinery.FileFinder`
+ * @param suffixes Suffixes of valid python modules. Typically this is
+ *      `importlib.machinery.all_suffixes()`
+ * @return A vector of tuples containing modules names, and a boolean indicating whether the module
+ *      is a package or not
+ */
+ModuleList
+_iter_file_finder_modules(
+    py::object importer,
+    std::vector<std::string> suffixes
+) {
+  // The importer doesn't have a path
+  py::object path_obj = importer.attr("path");
+  if (path_obj.is_none()) {
+    return ModuleList();
+  }
+
+  fs::path path = fs::path(py::str(path_obj).cast<std::string>());
+  return scan_directory(path, suffixes);
+}
+
+/**
+ * @brief Modification time of a path, in the same units as python's `os.stat().st_mtime_ns`.
+ *
+ * @return The mtime, or -1 if the path can't be stat'ed
+ */
+int64_t mtime_ns(const fs::path& path) {
+  struct stat st;
+  if (::stat(path.c_str(), &st) != 0) {
+    return -1;
+  }
+#ifdef __APPLE__
+  return int64_t(st.st_mtimespec.tv_sec) * 1000000000 + st.st_mtimespec.tv_nsec;
+#else
+  return int64_t(st.st_mtim.tv_sec) * 1000000000 + st.st_mtim.tv_nsec;
+#endif
+}
+
+/**
+ * @brief Number of threads to use for scanning.
+ *
+ * @param max_workers Requested maximum; 0 means the number of CPUs, up to 8
+ */
+unsigned worker_count(unsigned max_workers) {
+  if (max_workers == 0) {
+    max_workers = std::min(8u, std::max(1u, std::thread::hardware_concurrency()));
+  }
+  return max_workers;
+}
+
+using DirectoryEntry = std::tuple<int64_t, ModuleList>;
+
+/**
+ * @brief List the importable python modules in each of several directories.
+ *
+ *      The directories are scanned concurrently by a bounded pool of threads, without holding
+ *      the GIL, so that the time taken on a network filesystem is bound by how many requests
+ *      it serves in parallel rather than by the latency of each one.
+ *
+ * @param paths Directories to scan
+ * @param suffixes Suffixes of valid python modules
+ * @param max_workers Maximum number of threads; 0 means the number of CPUs, up to 8
+ * @return A vector with one tuple per entry of ``paths``, in the same order.  Each tuple contains
+ *      the mtime of the directory, taken before listing it, or -1 if it can't be stat'ed; and the
+ *      modules in the directory, as returned by `_iter_file_finder_modules`
+ */
+std::vector<DirectoryEntry>
+_scan_directories(
+    std::vector<std::string> paths,
+    std::vector<std::string> suffixes,
+    unsigned max_workers
+) {
+  std::vector<DirectoryEntry> result(paths.size());
+  max_workers = std::min<size_t>(worker_count(max_workers), std::max<size_t>(paths.size(), 1));
+  {
+    py::gil_scoped_release release;
+    std::atomic<size_t> next(0);
+    auto worker = [&]() {
+      for (size_t i = next++; i < paths.size(); i = next++) {
+        fs::path dir(paths[i]);
+        int64_t mtime = mtime_ns(dir);
+        ModuleList modules;
+        if (mtime >= 0) {
+          modules = scan_directory(dir, suffixes);
+        }
+        // Each thread only writes to its own elements.
+        result[i] = std::make_tuple(mtime, std::move(modules));
+      }
+    };
+    std::vector<std::thread> threads;
+    for (unsigned i = 1; i < max_workers; ++i) {
+      threads.emplace_back(worker);
+    }
+    worker();
+    for (auto& thread : threads) {
+      thread.join();
+    }
+  }
+  return result;
+}
+
 PYBIND11_MODULE(_fast_iter_modules, m, py::mod_gil_not_used()) {
     m.doc() = "A fast version of pkgutil._iter_file_finder_modules.";
     m.def(
@@ -106,4 +209,12 @@ PYBIND11_MODULE(_fast_iter_modules, m, py::mod_gil_not_used()) {
         py::arg("suffixes") = std::make_tuple(".py", ".pyc"),
         py::return_value_policy::take_ownership
     );
+    m.def(
+        "_scan_directories",
+        &_scan_directories,
+        "List the modules in each of several directories, concurrently",
+        py::arg("paths"),
+        py::arg("suffixes"),
+        py::arg("max_workers") = 0
+    );
 }
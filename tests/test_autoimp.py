@@ -6,6 +6,8 @@
 
 
 import ast
+import builtins
+import json
 import os
 import pytest
 from   shutil                   import rmtree
@@ -13,15 +15,26 @@ import sys
 from   tempfile                 import mkdtemp
 from   textwrap                 import dedent
 
-from   pyflyby                  import (Filename, ImportDB, auto_eval,
-                                        auto_import, find_missing_imports)
-from   pyflyby._autoimp         import (LoadSymbolError, load_symbol,
+from   pyflyby                  import (Filename, ImportDB, PythonBlock,
+                                        auto_eval, auto_import,
+                                        find_missing_imports)
+from   pyflyby._autoimp         import (LoadSymbolError, ScopeStack,
+                                        _try_import, load_symbol,
                                         scan_for_import_issues)
 from   pyflyby._flags           import CompilerFlags
 from   pyflyby._idents          import DottedIdentifier
 from   pyflyby._importstmt      import Import
+from   pyflyby._modules         import (ModuleHandle, clear_import_profiles,
+                                        enable_import_profiling,
+                                        format_import_profiles,
+                                        get_import_profiles,
+                                        import_profiles_to_json,
+                                        is_known_missing_module,
+                                        record_missing_module)
 from   pyflyby._util            import CwdCtx
 
+from   tests._test_utils        import EnvVarCtx
+
 
 @pytest.fixture
 def tpp(request):
@@ -1005,6 +1018,21 @@ def test_find_missing_imports_code_loop_1():
     assert expected == result
 
 
+def test_find_missing_imports_code_extended_arg_1():
+    # With more than 256 names, LOAD_ATTR needs an EXTENDED_ARG prefix.
+    code = "".join("n%d = 1\n" % i for i in range(300))
+    code += "os.path.join\n"
+    co = compile(code, "<test>", "exec")
+    result   = find_missing_imports(co, [{}])
+    result   = _dilist2strlist(result)
+    expected = ['os.path.join']
+    assert expected == result
+    # The second scan of an equal code object is served from the cache.
+    co2 = compile(code, "<test>", "exec")
+    assert co2 is not co
+    assert _dilist2strlist(find_missing_imports(co2, [{}])) == expected
+
+
 def test_find_missing_imports_positional_only_args_1():
     code = dedent("""
         def func(x, /, y):
@@ -1420,6 +1448,25 @@ def test_find_missing_imports_tuple_ellipsis_type_1():
     assert expected == result
 
 
+def test_find_missing_imports_cached_1():
+    from pyflyby._autoimp import _missing_imports_by_source
+    _missing_imports_by_source.clear()
+    code = dedent("""
+    del x
+    os.arange(x) + y
+    """)
+    node = ast.parse(code)
+    for arg in [code, PythonBlock(code), node]:
+        result = _dilist2strlist(find_missing_imports(arg, [{}]))
+        assert result == ['os.arange', 'x', 'y']
+        # Running the same code again with other names defined reuses the
+        # analysis but still checks the names against the new namespace.
+        result = _dilist2strlist(find_missing_imports(arg, [{"x": 1, "os": os}]))
+        assert result == ['os.arange', 'y']
+        assert find_missing_imports(arg, [{"*": None}]) == []
+    assert len(_missing_imports_by_source) == 3
+
+
 def test_scan_for_import_issues_type_comment_1():
     code = dedent("""
     from typing import Sequence
@@ -1910,6 +1957,65 @@ def test_scan_for_import_issues_class_in_type_annotation_before_definition():
     assert unused == []
 
 
+@pytest.mark.parametrize("edit", [
+    lambda code: code,
+    lambda code: "\n\n" + code,
+    lambda code: code.replace("return os.path.join(a, b)", "return join(a, b)"),
+    lambda code: code.replace("import os, re\n", "import os\n"),
+    lambda code: code.replace("class Foo:", "class Bar:"),
+    lambda code: code.replace("import os, re\n", "import os, re\nfrom sys import *\n"),
+])
+def test_scan_for_import_issues_incremental_1(edit):
+    code = dedent("""
+        import os, re
+        from typing import List
+
+        def f1(a, b):
+            return os.path.join(a, b)
+
+        class Foo:
+            def m1(self) -> List[int]:
+                return [Foo, f2(), np.x]
+
+        def f2():
+            import json
+            x = sys.argv
+            return y
+    """)
+    from pyflyby._autoimp import _statement_summaries
+    _statement_summaries.clear()
+    expected = scan_for_import_issues(code)
+    assert scan_for_import_issues(code, incremental=True) == expected
+    num_cached = len(_statement_summaries)
+    edited = edit(code)
+    expected = scan_for_import_issues(edited)
+    assert scan_for_import_issues(edited, incremental=True) == expected
+    # Only the statements that changed were visited again.
+    assert len(_statement_summaries) <= num_cached + 2
+
+
+def test_scopestack_new_scope_1():
+    user_ns = {"a": 1}
+    stack = ScopeStack([user_ns])
+    assert ScopeStack(stack)._tup is stack._tup
+    inner = stack._with_new_scope(include_class_scopes=False,
+                                  new_class_scope=False, unhide_classdef=False)
+    assert list(inner)[:-1] == list(stack)
+    assert inner[0] is builtins.__dict__ and inner[2] is user_ns
+    inner[-1]["b"] = None
+    assert "b" in inner and "b" not in stack
+    stack._class_delayed["C"] = None
+    method = inner._with_new_scope(include_class_scopes=False,
+                                   new_class_scope=False, unhide_classdef=True)
+    assert method[2] is stack._class_delayed
+    assert len(method) == len(inner) + 2
+    # A deferred lookup ignores what is stored in the top scope later.
+    deferred = inner._clone_top_after_miss()
+    inner[-1]["c"] = None
+    assert "c" in inner and "c" not in deferred
+    assert deferred[2] is user_ns
+
+
 def test_setattr_is_not_unused():
     code = dedent("""
         from a import b
@@ -2295,6 +2401,41 @@ def test_auto_import_forget_module_name_1(pyflyby_log):
     assert "os" not in ns
 
 
+def test_auto_import_forget_module_name_multi_1(pyflyby_log):
+    # Several missing names under the same forgotten module are resolved as
+    # one batch; the module is attempted (and refused) only once.
+    db = ImportDB('__forget_imports__ = ["import os"]')
+    ns = {}
+    autoimported = {}
+    result = auto_import("os.getpid(), os.sep, os.path.join", [ns], db=db,
+                         autoimported=autoimported)
+    assert result is False
+    assert pyflyby_log.messages == []
+    assert "os" not in ns
+    assert autoimported == {DottedIdentifier("os"): False}
+
+
+def test_auto_import_shared_ancestor_1(pyflyby_log):
+    ns = {}
+    result = auto_import("os.path.join, os.sep, sys.argv", [ns])
+    assert result is True
+    assert pyflyby_log.messages == ["import os.path", "import sys"]
+    assert ns["os"] is os
+
+
+def test_auto_import_parallel_prefetch_1(pyflyby_log):
+    # With parallel prefetching, imports are still done one at a time, in the
+    # same order as without.
+    ns = {}
+    with EnvVarCtx(PYFLYBY_PARALLEL_IMPORTS="1"):
+        result = auto_import("os.path.join, sys.argv, fractions.Fraction",
+                             [ns])
+    assert result is True
+    assert pyflyby_log.messages == [
+        "import fractions", "import os.path", "import sys"]
+    assert ns["sys"] is sys
+
+
 def test_auto_import_forget_aliased_import_1(pyflyby_log):
     # Forgetting an aliased import ("import numpy as np") suppresses the alias.
     db = ImportDB('import numpy as np\n'
@@ -2425,3 +2566,59 @@ def test_unsafe_filename_warning_II(tpp, pyflyby_log):
     with CwdCtx(filepath):
         auto_import("pyflyby", [{}])
     assert pyflyby_log.messages[0] == "import pyflyby"
+
+
+def test_try_import_known_missing_module_1(tpp, pyflyby_log):
+    # A failed import records the module as missing; a later attempt at a
+    # different import from it is skipped without trying again.
+    assert not _try_import("import pyflyby_missing_xyz", {})
+    assert is_known_missing_module("pyflyby_missing_xyz")
+    pyflyby_log.clear()
+    assert not _try_import("from pyflyby_missing_xyz import a", {})
+    assert pyflyby_log.messages == []
+    # Creating the module changes the mtime of its directory.
+    with open(str(tpp / "pyflyby_missing_xyz.py"), "w") as f:
+        f.write("a = 1\n")
+    os.utime(str(tpp), ns=(0, os.stat(str(tpp)).st_mtime_ns + 10**9))
+    assert not is_known_missing_module("pyflyby_missing_xyz")
+    namespace = {}
+    assert _try_import("from pyflyby_missing_xyz import a", namespace)
+    assert namespace["a"] == 1
+
+
+def test_try_import_profile_1(tpp):
+    # With profiling enabled, each auto-import is recorded once, including
+    # the modules it imported in turn.
+    with open(str(tpp / "pyflyby_prof_inner.py"), "w") as f:
+        f.write("x = 1\n")
+    with open(str(tpp / "pyflyby_prof_outer.py"), "w") as f:
+        f.write("import pyflyby_prof_inner\ny = 2\n")
+    enable_import_profiling()
+    try:
+        clear_import_profiles()
+        assert _try_import("from pyflyby_prof_outer import y", {})
+        assert not _try_import("import pyflyby_prof_missing", {})
+        profiles = get_import_profiles()
+        assert [(p.statement, p.new_modules, p.succeeded) for p in profiles] == [
+            ("from pyflyby_prof_outer import y", 2, True),
+            ("import pyflyby_prof_missing", 0, False),
+        ]
+        assert profiles[0].seconds > 0
+        assert "from pyflyby_prof_outer import y" in format_import_profiles()
+        assert json.loads(import_profiles_to_json())[0]["new_modules"] == 2
+    finally:
+        enable_import_profiling(False)
+    assert get_import_profiles() == []
+
+
+def test_ModuleHandle_exists_known_missing_1(tpp):
+    name = "pyflyby_missing_exists_1"
+    record_missing_module(name)
+    try:
+        assert not ModuleHandle(name).exists
+        with open(str(tpp / (name + ".py")), "w"):
+            pass
+        os.utime(str(tpp), ns=(0, os.stat(str(tpp)).st_mtime_ns + 10**9))
+        assert ModuleHandle(name).exists
+    finally:
+        del ModuleHandle._cls_cache[DottedIdentifier(name)]
@@ -6,17 +6,23 @@
 
 
 import os
+import pytest
 from   shutil                   import rmtree
 import sys
 from   tempfile                 import NamedTemporaryFile, mkdtemp
 from   textwrap                 import dedent
 
+from   pyflyby._dbimage         import ImportDBImage
+from   pyflyby._file            import Filename
 from   pyflyby._importclns      import ImportMap, ImportSet
 from   pyflyby._importdb        import ImportDB
 from   pyflyby._importstmt      import Import
+from   pyflyby._parse           import PythonBlock
 from   tests._test_utils        import EnvVarCtx
 
 from   contextlib               import contextmanager
+from   pathlib                  import Path
+from   unittest                 import mock
 
 
 if sys.version_info > (3, 11):
@@ -118,6 +124,107 @@ def test_ImportDB_by_fullname_or_import_as_forget_prefix_1():
     assert () not in result.values()
 
 
+def test_ImportDB_known_imports_trie_get_deepest_1():
+    db = ImportDB('''
+        from aa.bb.cc import dd as DD
+        import aa.bb.ee
+        __forget_imports__ = ['import aa.bb']
+    ''')
+    trie = db.known_imports_trie
+    assert trie.get_deepest("aa.bb.ee.ff") == (
+        "aa.bb.ee", (Import('import aa.bb.ee'),))
+    # 'aa.bb' is forgotten, so fall back to 'aa'.
+    assert trie.get_deepest("aa.bb.zz") == ("aa", (Import('import aa'),))
+    assert trie.get_deepest(("DD", "xx")) == (
+        "DD", (Import('from aa.bb.cc import dd as DD'),))
+    assert trie.get_deepest("zz.aa") is None
+    assert trie.get("aa.bb") is None
+    assert dict(trie.items()) == db.by_fullname_or_import_as
+
+
+def test_ImportDB_known_imports_trie_lazy_1():
+    # Looking up a name only indexes the imports under its top-level name.
+    db = ImportDB('''
+        from aa.bb import cc
+        from dd import ee as aa2
+        import ff
+        __forget_imports__ = ['import aa.bb']
+    ''')
+    trie = db.known_imports_trie
+    assert trie.get_deepest("aa.bb.xx") == ("aa", (Import('import aa'),))
+    assert set(trie._root.children) == {"aa"}
+    assert trie.get_deepest("aa2") == ("aa2", (Import('from dd import ee as aa2'),))
+    assert set(trie._root.children) == {"aa", "aa2"}
+    assert sorted(trie.iter_names()) == ["aa", "aa2", "cc", "dd", "ff"]
+
+
+def test_ImportDB_get_member_names_1():
+    db = ImportDB('''
+        import numpy.linalg.info
+        from sys import exit as EXIT
+        from os.path import join as pjoin
+    ''')
+    member_names = db.known_imports.member_names
+    for parent in ["", "numpy", "numpy.linalg", "sys", "os", "os.path"]:
+        assert db.get_member_names(parent) == member_names[parent]
+    assert db.get_member_names("numpy.linalg.info") == ()
+    assert db.get_member_names("xx") == ()
+
+
+def test_ImportDB_known_imports_trie_iter_names_1():
+    db = ImportDB('''
+        from aa.bb import cc
+        from aa.bx import dd
+        import ab
+    ''')
+    trie = db.known_imports_trie
+    assert sorted(trie.iter_names("aa.b")) == ["aa.bb", "aa.bx"]
+    assert sorted(trie.iter_names("a")) == ["aa", "aa.bb", "aa.bx", "ab"]
+    assert sorted(trie.iter_names("")) == ["aa", "aa.bb", "aa.bx", "ab", "cc", "dd"]
+    assert list(trie.iter_names("zz.")) == []
+
+
+def test_ImportDB_parse_fragment_file_1(tmp_path):
+    # The fast path for simple import lines gives the same result as the full
+    # parser, including for statements it hands off to the full parser.
+    dbfile = tmp_path / "f55031869.py"
+    dbfile.write_text(dedent("""
+        from m1 import f1, f2 as g2
+        import m2.a, m3 as g3
+        from m4 import (f3, f4,
+                        f5 as g5,
+        )
+        from m5 import f6 # comment
+        from m6 import (f7, # comment
+                        f8)
+        __mandatory_imports__ = [
+            'from __future__ import division',
+        ]
+        __forget_imports__ = ['from m1 import f2']
+        import m7
+        __canonical_imports__ = {
+            'm8.a': 'm8.b',
+        }
+    """))
+    filename = Filename(str(dbfile))
+    def data(fragment):
+        return [sorted((imp.fullname, imp.import_as, imp.comment)
+                       for imp in fragment.known_imports.imports)
+                ] + list(fragment[1:])
+    fast = ImportDB._parse_fragment_file(filename)
+    slow = ImportDB._parse_fragment(PythonBlock(filename))
+    assert data(fast) == data(slow)
+    assert len(fast.known_imports.imports) == 11
+
+
+def test_ImportDB_parse_fragment_file_error_1(tmp_path):
+    # Errors from the full parser still report the file.
+    dbfile = tmp_path / "f1776512.py"
+    dbfile.write_text("from m1 import f1\nfoo = 1\n")
+    with pytest.raises(ValueError, match="f1776512.py"):
+        ImportDB._parse_fragment_file(Filename(str(dbfile)))
+
+
 def test_ImportDB_get_default_1():
     db = ImportDB.get_default('.')
     assert isinstance(db, ImportDB)
@@ -252,3 +359,199 @@ def test_ImportDB_pyflyby_forget_1():
         """)
         assert result == expected
         rmtree(d)
+
+
+@mock.patch("platformdirs.user_cache_dir")
+def test_ImportDB_persistent_cache_1(mock_user_cache_dir, tmp_path):
+    # A second process (simulated by clearing the in-memory cache) should load
+    # the compiled database from disk instead of re-parsing, until one of the
+    # database files changes.
+    mock_user_cache_dir.return_value = str(tmp_path / "cache")
+    dbfile = tmp_path / "f41378623.py"
+    dbfile.write_text("from m12490531 import f3310583, f9842210\n")
+    with EnvVarCtx(PYFLYBY_PATH=str(dbfile)):
+        ImportDB.clear_default_cache()
+        db1 = ImportDB.get_default("/bin")
+        cache_dir = tmp_path / "cache" / "importdb"
+        assert len(list(cache_dir.glob("*.%s" % sys.implementation.cache_tag))) == 1
+        ImportDB.clear_default_cache()
+        with mock.patch.object(ImportDB, "_parse_fragment_file") as mock_parse:
+            db2 = ImportDB.get_default("/bin")
+        mock_parse.assert_not_called()
+        # The name index is built lazily, not loaded from the cache.
+        assert "known_imports_trie" not in db2.__dict__
+        assert db2 is not db1
+        assert db2.known_imports == db1.known_imports
+        assert db2.by_fullname_or_import_as == db1.by_fullname_or_import_as
+        dbfile.write_text("from m12490531 import f3310583, f60133528\n")
+        ImportDB.clear_default_cache()
+        db3 = ImportDB.get_default("/bin")
+        assert "f60133528" in db3.by_fullname_or_import_as
+        assert "f9842210" not in db3.by_fullname_or_import_as
+    ImportDB.clear_default_cache()
+
+
+@mock.patch("platformdirs.user_cache_dir")
+def test_ImportDB_persistent_cache_incremental_1(mock_user_cache_dir, tmp_path):
+    # When one of several database files changes, only that file is parsed
+    # again; the others come from the cache.
+    mock_user_cache_dir.return_value = str(tmp_path / "cache")
+    dbfile1 = tmp_path / "f20553114.py"
+    dbfile2 = tmp_path / "f75026683.py"
+    dbfile1.write_text("from m31337046 import f51009236\n")
+    dbfile2.write_text("__forget_imports__ = ['from m31337046 import f84012957']\n")
+    with EnvVarCtx(PYFLYBY_PATH="%s:%s" % (dbfile1, dbfile2)):
+        ImportDB.clear_default_cache()
+        ImportDB.get_default("/bin")
+        dbfile1.write_text("from m31337046 import f51009236, f84012957, f6605\n")
+        ImportDB.clear_default_cache()
+        parse_fragment_file = ImportDB._parse_fragment_file
+        with mock.patch.object(ImportDB, "_parse_fragment_file",
+                               side_effect=parse_fragment_file) as mock_parse:
+            db = ImportDB.get_default("/bin")
+        assert mock_parse.call_count == 1
+        assert mock_parse.call_args[0][0] == Filename(str(dbfile1))
+        assert "f6605" in db.by_fullname_or_import_as
+        # The forget list from the unchanged file still applies.
+        assert "f84012957" not in db.by_fullname_or_import_as
+    ImportDB.clear_default_cache()
+
+
+def test_ImportDB_parse_processes_1(tmp_path):
+    # Parsing database files in a process pool gives the same result as
+    # parsing them serially.
+    dbfiles = [tmp_path / ("f%d.py" % i) for i in range(3)]
+    dbfiles[0].write_text("from m29810377 import f7139202, f46121985\n")
+    dbfiles[1].write_text("import m60281746.a as f5133902\n")
+    dbfiles[2].write_text("__forget_imports__ = ['from m29810377 import f46121985']\n")
+    pyflyby_path = ":".join(str(f) for f in dbfiles)
+    with EnvVarCtx(PYFLYBY_PATH=pyflyby_path, PYFLYBY_DISABLE_CACHE="1"):
+        ImportDB.clear_default_cache()
+        db1 = ImportDB.get_default("/bin")
+        ImportDB.clear_default_cache()
+        with EnvVarCtx(PYFLYBY_IMPORTDB_PARSE_PROCESSES="2"):
+            db2 = ImportDB.get_default("/bin")
+    ImportDB.clear_default_cache()
+    assert db2 is not db1
+    assert db2.known_imports == db1.known_imports
+    assert db2.forget_imports == db1.forget_imports
+    assert db2.by_fullname_or_import_as == db1.by_fullname_or_import_as
+    assert "f5133902" in db2.by_fullname_or_import_as
+    assert "f46121985" not in db2.by_fullname_or_import_as
+
+
+@mock.patch("platformdirs.user_cache_dir")
+def test_ImportDB_get_default_resolution_cache_1(mock_user_cache_dir, tmp_path):
+    # A second process reuses the list of database files found for the same
+    # target and PYFLYBY_PATH, until a file is added to a watched directory.
+    mock_user_cache_dir.return_value = str(tmp_path / "cache")
+    dbdir = tmp_path / "db"
+    (dbdir / "sub").mkdir(parents=True)
+    (dbdir / "sub" / "f1.py").write_text("from m38116523 import f61307724\n")
+    target = tmp_path / "proj"
+    target.mkdir()
+    with EnvVarCtx(PYFLYBY_PATH=str(dbdir)):
+        ImportDB.clear_default_cache()
+        db1 = ImportDB.get_default(str(target))
+        assert "f61307724" in db1.by_fullname_or_import_as
+        ImportDB.clear_default_cache()
+        with mock.patch.object(Path, "resolve") as mock_resolve:
+            db2 = ImportDB.get_default(str(target))
+        mock_resolve.assert_not_called()
+        assert db2.known_imports == db1.known_imports
+        (dbdir / "sub" / "f2.py").write_text("from m38116523 import f9056731\n")
+        ImportDB.clear_default_cache()
+        db3 = ImportDB.get_default(str(target))
+        assert "f9056731" in db3.by_fullname_or_import_as
+    ImportDB.clear_default_cache()
+
+
+@mock.patch("platformdirs.user_cache_dir")
+def test_ImportDB_image_1(mock_user_cache_dir, tmp_path):
+    # With PYFLYBY_IMPORTDB_IMAGE=1, the first process publishes an image of
+    # the lookup index, and later processes map it instead of loading the
+    # database.
+    from pyflyby._autoimp import get_known_import
+    mock_user_cache_dir.return_value = str(tmp_path / "cache")
+    dbfile = tmp_path / "f6350915.py"
+    dbfile.write_text(dedent("""
+        from m71201366.a import f1943108, f8223615 as g8223615
+        import m40095321
+        __forget_imports__ = ['from m71201366.a import f1943108']
+    """))
+    with EnvVarCtx(PYFLYBY_PATH=str(dbfile), PYFLYBY_IMPORTDB_IMAGE="1"):
+        ImportDB.clear_default_cache()
+        db1 = ImportDB.get_default("/bin")
+        ImportDB.clear_default_cache()
+        with mock.patch.object(ImportDB, "_load_filenames") as mock_load:
+            db2 = ImportDB.get_default("/bin")
+            assert get_known_import("g8223615.x", db=db2) == (
+                Import("from m71201366.a import f8223615 as g8223615"),)
+            assert get_known_import("m71201366.a.b", db=db2) == (
+                Import("import m71201366.a"),)
+            assert get_known_import("f1943108", db=db2) is None
+            assert db2.forget_imports == db1.forget_imports
+            assert db2.by_fullname_or_import_as == db1.by_fullname_or_import_as
+            assert sorted(db2.known_imports_trie.iter_names("m")) == [
+                "m40095321", "m71201366", "m71201366.a"]
+        mock_load.assert_not_called()
+        assert db2.known_imports == db1.known_imports
+        dbfile.write_text("import m40095321\n")
+        ImportDB.clear_default_cache()
+        db3 = ImportDB.get_default("/bin")
+        assert get_known_import("g8223615", db=db3) is None
+    ImportDB.clear_default_cache()
+
+
+@mock.patch("platformdirs.user_cache_dir")
+def test_ImportDB_image_comments_1(mock_user_cache_dir, tmp_path):
+    # Imports looked up in an image keep their comments, as they do without
+    # an image.
+    from pyflyby._autoimp import get_known_import
+    mock_user_cache_dir.return_value = str(tmp_path / "cache")
+    dbfile = tmp_path / "f5260418.py"
+    dbfile.write_text(dedent("""
+        from m30871123 import f4424509 # noqa: F401
+        from m30871123 import f7712064 #\tcomment with a tab\x0c
+        import m58061927
+    """))
+    def comments(db):
+        return {k: [imp.comment for imp in v]
+                for k, v in db.by_fullname_or_import_as.items()}
+    with EnvVarCtx(PYFLYBY_PATH=str(dbfile), PYFLYBY_IMPORTDB_IMAGE="0"):
+        ImportDB.clear_default_cache()
+        expected = comments(ImportDB.get_default("/bin"))
+    assert expected["f4424509"] == [" noqa: F401"]
+    with EnvVarCtx(PYFLYBY_PATH=str(dbfile), PYFLYBY_IMPORTDB_IMAGE="1"):
+        ImportDB.clear_default_cache()
+        ImportDB.get_default("/bin")
+        ImportDB.clear_default_cache()
+        db = ImportDB.get_default("/bin")
+        assert isinstance(db.known_imports_trie, ImportDBImage)
+        assert comments(db) == expected
+        [imp] = get_known_import("f7712064", db=db)
+        assert imp.comment == expected["f7712064"][0]
+    ImportDB.clear_default_cache()
+
+
+def test_ImportDB_get_default_revalidate_1(tmp_path):
+    # With a revalidation interval, get_default() notices modified database
+    # files; without one, the memoized database is returned as-is.
+    dbfile = tmp_path / "f87312004.py"
+    dbfile.write_text("from m52398811 import f4470025\n")
+    with EnvVarCtx(PYFLYBY_PATH=str(dbfile)):
+        ImportDB.clear_default_cache()
+        db1 = ImportDB.get_default("/bin")
+        assert ImportDB.get_default("/bin") is db1
+        dbfile.write_text("from m52398811 import f4470025, f18206431\n")
+        assert ImportDB.get_default("/bin") is db1
+        with EnvVarCtx(PYFLYBY_IMPORTDB_REVALIDATE_INTERVAL="0"):
+            db2 = ImportDB.get_default("/bin")
+            assert db2 is not db1
+            assert "f18206431" in db2.by_fullname_or_import_as
+            # Unchanged files don't cause a reload.
+            assert ImportDB.get_default("/bin") is db2
+            # Entries for other target directories sharing the same files
+            # are refreshed too.
+            assert ImportDB.get_default("/bin/") is db2
+    ImportDB.clear_default_cache()
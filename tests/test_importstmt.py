@@ -30,6 +30,16 @@ def test_Import_from_split_1():
     assert str(imp)      == "from .foo import bar"
 
 
+def test_Import_compact_1():
+    # Imports are slotted, and imports from the same module share the module
+    # name.
+    imp1 = Import.from_parts("foo.bar.baz", "baz")
+    imp2 = Import("from foo.bar import quux")
+    assert not hasattr(imp1, "__dict__")
+    assert imp1.split is imp1.split
+    assert imp1.split.module_name is imp2.split.module_name
+
+
 def test_Import_from_Statement_1():
     imp = Import(ImportStatement("from foo import bar"))
     assert imp.fullname  == "foo.bar"
@@ -3,26 +3,43 @@
 # License for THIS FILE ONLY: CC0 Public Domain Dedication
 # http://creativecommons.org/publicdomain/zero/1.0/
 
-import hashlib
+import importlib.machinery
 import logging.handlers
 import os
 import pathlib
-from   pkgutil                  import iter_modules
+from   pkgutil                  import ModuleInfo, iter_modules
+from   pyflyby._fast_iter_modules \
+                                import _scan_directories
 from   pyflyby._file            import Filename
 from   pyflyby._idents          import DottedIdentifier
 from   pyflyby._log             import logger
-from   pyflyby._modules         import (ModuleHandle, _fast_iter_modules,
+from   pyflyby._modules         import (ModuleHandle, SUFFIXES, _ExportsIndex,
+                                        _ModuleIndex, _cached_module_finder,
+                                        _fast_iter_modules,
+                                        _get_exports_index, _index_lookup,
                                         _iter_file_finder_modules,
-                                        rebuild_import_cache)
+                                        _module_indexes, _module_list_changed,
+                                        clear_missing_modules_cache,
+                                        import_cache_stats,
+                                        invalidate_import_cache,
+                                        is_known_missing_module,
+                                        prefetch_modules,
+                                        record_missing_module,
+                                        rebuild_import_cache,
+                                        reset_import_cache_stats,
+                                        start_import_cache_warmer)
 import re
 import subprocess
 import sys
+import threading
 from   tempfile                 import TemporaryDirectory
 from   textwrap                 import dedent
 from   unittest                 import mock
 
 import pytest
 
+from   tests._test_utils        import EnvVarCtx
+
 def test_ModuleHandle_1():
     m = ModuleHandle("sys")
     assert m.name == DottedIdentifier("sys")
@@ -125,17 +142,24 @@ def test_fast_iter_modules():
 
     assert fast == slow
 
+@pytest.mark.parametrize("prefix", ["", "js", "json", "email", "x_no_such", "_"])
+def test_list_prefix(prefix):
+    expected = sorted(set(m for m in ModuleHandle.list() if m.startswith(prefix)))
+    assert ModuleHandle.list_prefix(prefix) == expected
+
+
 @mock.patch.dict(os.environ, {"PYFLYBY_SUPPRESS_CACHE_REBUILD_LOGS": "0"})
 @mock.patch("platformdirs.user_cache_dir")
 def test_import_cache(mock_user_cache_dir, tmp_path):
     """Test that the import cache is built when iterating modules.
 
     Also:
-    - Check that each path mentioned in the logs appears (sha256-encoded) in the cache
-    - The first time generating the import cache, _iter_file_finder_modules is called
+    - Check that each path mentioned in the logs has an entry in the module index
+    - The first time generating the import cache, all paths are scanned in a
+      single call to _scan_directories
     - Subsequent calls use the cached modules
     - If the mtime of one of the importer paths is updated, the corresponding
-      cache file gets regenerated
+      entry gets regenerated
     """
 
     mock_user_cache_dir.return_value = tmp_path
@@ -143,6 +167,10 @@ def test_import_cache(mock_user_cache_dir, tmp_path):
     assert len(list(tmp_path.iterdir())) == 0
     with (
         mock.patch("pyflyby._modules.logger", wraps=logger) as mock_logger,
+        mock.patch(
+            "pyflyby._modules._scan_directories",
+            wraps=_scan_directories,
+        ) as mock_scan,
         mock.patch(
             "pyflyby._modules._iter_file_finder_modules",
             wraps=_iter_file_finder_modules,
@@ -150,25 +178,33 @@ def test_import_cache(mock_user_cache_dir, tmp_path):
     ):
         list(_fast_iter_modules())
 
-    paths = [str(path.name) for path in tmp_path.iterdir()]
-    n_cached_paths = len(paths)
+    # All paths are stored in a single index file.
+    assert [p.name for p in tmp_path.iterdir()] == ["modules.idx"]
+    rows = _ModuleIndex(tmp_path / "modules.idx").rows
+    n_cached_paths = len(rows)
     n_log_messages = len(mock_logger.info.call_args_list)
 
     # On the first call, log messages should be generated for each import path. Check
-    # that _iter_file_finder_modules was called once for each cached path.
+    # that all the paths were scanned in one batch.
     assert (n_cached_paths == n_log_messages) and n_cached_paths > 0
-    assert len(mock_iffm.call_args_list) == n_cached_paths
+    mock_scan.assert_called_once()
+    assert sorted(mock_scan.call_args.args[0]) == sorted(rows)
+    mock_iffm.assert_not_called()
     assert "Rebuilding cache for " in mock_logger.info.call_args.args[0]
     for call_args in mock_logger.info.call_args_list:
-        # Grab the path names from the log messages; make sure the sha256 checksum
-        # can be found in the paths of the cache directory
+        # Grab the path names from the log messages; make sure they can be
+        # found in the index.
         path = pathlib.Path(
             call_args.args[0].lstrip("Rebuilding cache for ").rstrip("...")
         ).expanduser()
-        assert hashlib.sha256(str(path).encode()).hexdigest() in paths
+        assert str(path) in rows
 
     with (
         mock.patch("pyflyby._modules.logger", wraps=logger) as mock_logger,
+        mock.patch(
+            "pyflyby._modules._scan_directories",
+            wraps=_scan_directories,
+        ) as mock_scan,
         mock.patch(
             "pyflyby._modules._iter_file_finder_modules",
             wraps=_iter_file_finder_modules,
@@ -177,35 +213,353 @@ def test_import_cache(mock_user_cache_dir, tmp_path):
         list(_fast_iter_modules())
 
     # On the second call, no additional messages should be emitted because the cache has
-    # already been built. Check that _iter_file_finder_modules was never called.
+    # already been built. Check that nothing was scanned.
     n_log_messages = len(mock_logger.info.call_args_list)
     assert n_log_messages == 0
+    mock_scan.assert_not_called()
     mock_iffm.assert_not_called()
 
     # Update the mtime of one of the importer paths
+    old_mtime_ns = rows[str(path)][0]
     path.touch()
     with (
         mock.patch("pyflyby._modules.logger", wraps=logger) as mock_logger,
         mock.patch(
-            "pyflyby._modules._iter_file_finder_modules",
-            wraps=_iter_file_finder_modules,
-        ) as mock_iffm,
+            "pyflyby._modules._scan_directories",
+            wraps=_scan_directories,
+        ) as mock_scan,
     ):
         list(_fast_iter_modules())
 
-    # Only one path should have been updated and only 1 message logged. The number
-    # of cache directories should not change.
+    # Only one path should have been updated and only 1 message logged. The
+    # entry for that path is replaced rather than added.
     assert len(mock_logger.info.call_args_list) == 1
-    assert len(list(tmp_path.iterdir())) == n_cached_paths
-    mock_iffm.assert_called_once()
-
-    # Regression: when the importer's mtime changes, a new <mtime_ns> cache file
-    # is written and the stale one must be removed.  Otherwise stale cache files
-    # (which are files, not dirs, inside the per-importer cache directory)
-    # accumulate without bound.  `path` here is the importer whose mtime we just
-    # bumped; its cache directory should hold exactly the one current file.
-    touched_cache_dir = tmp_path / hashlib.sha256(str(path).encode()).hexdigest()
-    assert len(list(touched_cache_dir.iterdir())) == 1
+    mock_scan.assert_called_once()
+    assert mock_scan.call_args.args[0] == [str(path)]
+    rows = _ModuleIndex(tmp_path / "modules.idx").rows
+    assert len(rows) == n_cached_paths
+    assert rows[str(path)][0] == os.stat(path).st_mtime_ns != old_mtime_ns
+
+
+@mock.patch("platformdirs.user_cache_dir")
+def test_import_cache_stats(mock_user_cache_dir, tmp_path):
+    """Import cache lookups are counted per sys.path entry."""
+    mock_user_cache_dir.return_value = tmp_path
+    reset_import_cache_stats()
+    list(_fast_iter_modules())
+    cold = import_cache_stats()
+    assert cold.batch_scans == 1
+    assert any(p.misses and p.entries for p in cold.paths.values())
+
+    _module_indexes.clear()
+    reset_import_cache_stats()
+    list(_fast_iter_modules())
+    warm = import_cache_stats()
+    assert warm.batch_scans == 0
+    assert warm.index_reads == 1
+    assert warm.index_bytes_read == os.path.getsize(tmp_path / "modules.idx")
+    assert not any(p.misses for p in warm.paths.values())
+    assert any(p.hits for p in warm.paths.values())
+    assert "Read %d bytes" % (warm.index_bytes_read,) in warm.format()
+    # import_cache_stats returns a copy.
+    warm.paths.clear()
+    assert import_cache_stats().paths
+
+
+@mock.patch("platformdirs.user_cache_dir")
+def test_import_cache_stats_one_path(mock_user_cache_dir, tmp_path):
+    """A path's first scan is a miss, and later (snapshot) lookups are hits."""
+    mock_user_cache_dir.return_value = tmp_path / "cache"
+    moddir = tmp_path / "mods"
+    moddir.mkdir()
+    (moddir / "pyflyby_stats_a.py").write_text("")
+    (moddir / "pyflyby_stats_b.py").write_text("")
+    importer = importlib.machinery.FileFinder(str(moddir))
+    reset_import_cache_stats()
+    assert sorted(_cached_module_finder(importer)) == [
+        ("pyflyby_stats_a", False), ("pyflyby_stats_b", False)]
+    stats = import_cache_stats().paths[str(moddir)]
+    assert (stats.misses, stats.hits, stats.entries) == (1, 0, 2)
+    for snapshot in [False, True]:
+        assert len(list(_cached_module_finder(importer, snapshot=snapshot))) == 2
+    stats = import_cache_stats().paths[str(moddir)]
+    assert (stats.misses, stats.hits, stats.entries) == (1, 2, 2)
+
+
+@mock.patch("platformdirs.user_cache_dir")
+def test_fast_iter_modules_stats_once(mock_user_cache_dir, tmp_path):
+    """A warm listing stats each directory on the path only once."""
+    mock_user_cache_dir.return_value = tmp_path
+    list(_fast_iter_modules())
+    paths = set(_ModuleIndex(tmp_path / "modules.idx").rows)
+    assert paths
+    with mock.patch("os.stat", wraps=os.stat) as mock_stat:
+        list(_fast_iter_modules())
+    stat_counts = {}
+    for call in mock_stat.call_args_list:
+        path = str(call.args[0])
+        if path in paths:
+            stat_counts[path] = stat_counts.get(path, 0) + 1
+    assert stat_counts == dict.fromkeys(paths, 1)
+
+
+@mock.patch("platformdirs.user_cache_dir")
+def test_rebuild_import_cache_repopulates(mock_user_cache_dir, tmp_path):
+    """rebuild_import_cache() rescans every path, even if the index is current."""
+    mock_user_cache_dir.return_value = tmp_path
+    list(_fast_iter_modules())
+    rows = _ModuleIndex(tmp_path / "modules.idx").rows
+    with mock.patch(
+        "pyflyby._modules._scan_directories", wraps=_scan_directories,
+    ) as mock_scan:
+        rebuild_import_cache()
+    mock_scan.assert_called_once()
+    assert sorted(mock_scan.call_args.args[0]) == sorted(rows)
+    assert _ModuleIndex(tmp_path / "modules.idx").rows == rows
+
+
+@mock.patch("platformdirs.user_cache_dir")
+def test_import_cache_warmer(mock_user_cache_dir, tmp_path):
+    """While the warmer rescans, modules are listed from the last snapshot."""
+    mock_user_cache_dir.return_value = tmp_path / "cache"
+    moddir = tmp_path / "mods"
+    moddir.mkdir()
+    (moddir / "pyflyby_warm_old.py").write_text("")
+    sys.path.append(str(moddir))
+    release = threading.Event()
+
+    def slow_scan(*args):
+        release.wait(10)
+        return _scan_directories(*args)
+
+    try:
+        with EnvVarCtx(PYFLYBY_WARM_IMPORT_CACHE="0"):
+            assert start_import_cache_warmer() is None
+        names = {m.name for m in _fast_iter_modules()}
+        assert "pyflyby_warm_old" in names
+        (moddir / "pyflyby_warm_new.py").write_text("")
+        os.utime(moddir, ns=(0, os.stat(moddir).st_mtime_ns + 10**9))
+        with (
+            EnvVarCtx(PYFLYBY_WARM_IMPORT_CACHE="1"),
+            mock.patch("pyflyby._modules._scan_directories",
+                       side_effect=slow_scan),
+        ):
+            warmer = start_import_cache_warmer()
+            assert warmer is not None and warmer.is_alive()
+            assert start_import_cache_warmer() is warmer
+            names = {m.name for m in _fast_iter_modules()}
+            assert "pyflyby_warm_old" in names
+            assert "pyflyby_warm_new" not in names
+            release.set()
+            warmer.join(10)
+        assert not warmer.is_alive()
+        rows = _ModuleIndex(tmp_path / "cache" / "modules.idx").rows
+        assert ("pyflyby_warm_new", False) in rows[str(moddir)][1]
+        names = {m.name for m in _fast_iter_modules()}
+        assert "pyflyby_warm_new" in names
+    finally:
+        release.set()
+        sys.path.remove(str(moddir))
+        sys.path_importer_cache.pop(str(moddir), None)
+
+
+def test_module_list_not_memoized_across_warmer():
+    """A list built while the warmer replaced the index isn't reused."""
+    calls = []
+
+    def fake_iter_modules():
+        calls.append(None)
+        if len(calls) == 1:
+            # The warmer finishes while this listing is in progress.
+            _module_list_changed()
+        yield ModuleInfo(None, "pyflyby_gen_%d" % len(calls), False)
+
+    _module_list_changed()
+    try:
+        with mock.patch("pyflyby._modules._fast_iter_modules",
+                        fake_iter_modules):
+            assert ModuleHandle.list() == ["pyflyby_gen_1"]
+            assert ModuleHandle.list() == ["pyflyby_gen_2"]
+            assert ModuleHandle.list_prefix("pyflyby_gen") == ["pyflyby_gen_2"]
+            assert len(calls) == 2
+    finally:
+        _module_list_changed()
+
+
+@mock.patch("platformdirs.user_cache_dir")
+def test_exports_cache(mock_user_cache_dir, tmp_path):
+    """ModuleHandle.exports doesn't parse unchanged source files again."""
+    mock_user_cache_dir.return_value = tmp_path / "cache"
+    moddir = tmp_path / "mods"
+    moddir.mkdir()
+    source = moddir / "pyflyby_exports_mod.py"
+    source.write_text("__all__ = ['f']\ndef f(): pass\ndef g(): pass\n")
+    sys.path.insert(0, str(moddir))
+    handle = ModuleHandle("pyflyby_exports_mod")
+    try:
+        assert handle.exports.pretty_print() == (
+            "from pyflyby_exports_mod import f\n")
+        index = _ExportsIndex(tmp_path / "cache" / "exports.idx")
+        assert index.rows == {}  # not written until flushed
+        _get_exports_index().flush()
+        index = _ExportsIndex(tmp_path / "cache" / "exports.idx")
+        assert list(index.rows) == [str(source)]
+        # Served from the index after it's read again from disk.
+        _module_indexes.clear()
+        del handle.__dict__["exports"]
+        with mock.patch("ast.parse", side_effect=AssertionError) as mock_parse:
+            assert handle.exports.pretty_print() == (
+                "from pyflyby_exports_mod import f\n")
+        mock_parse.assert_not_called()
+        # Parsed again once the file changes.
+        source.write_text("def g(): pass\n")
+        del handle.__dict__["exports"]
+        assert handle.exports.pretty_print() == (
+            "from pyflyby_exports_mod import g\n")
+    finally:
+        sys.path.remove(str(moddir))
+        sys.path_importer_cache.pop(str(moddir), None)
+        ModuleHandle._cls_cache.pop(handle.name, None)
+
+
+@mock.patch("platformdirs.user_cache_dir")
+def test_import_cache_ttl(mock_user_cache_dir, tmp_path):
+    """With PYFLYBY_IMPORT_CACHE_TTL, fresh entries aren't stat'ed again."""
+    mock_user_cache_dir.return_value = tmp_path / "cache"
+    moddir = tmp_path / "mods"
+    moddir.mkdir()
+    (moddir / "pyflyby_ttl_old.py").write_text("")
+    sys.path.append(str(moddir))
+    try:
+        with EnvVarCtx(PYFLYBY_IMPORT_CACHE_TTL="3600"):
+            list(_fast_iter_modules())
+            (moddir / "pyflyby_ttl_new.py").write_text("")
+            os.utime(moddir, ns=(0, os.stat(moddir).st_mtime_ns + 10**9))
+            # Another process trusts the entries written by the first one.
+            _module_indexes.clear()
+            with mock.patch("pyflyby._modules._timed_stat",
+                            side_effect=os.stat) as mock_stat:
+                names = {m.name for m in _fast_iter_modules()}
+            assert "pyflyby_ttl_old" in names
+            assert "pyflyby_ttl_new" not in names
+            assert str(moddir) not in [c.args[0] for c in mock_stat.call_args_list]
+            # After invalidating, the new module is found.
+            invalidate_import_cache([str(moddir)])
+            _module_indexes.clear()
+            names = {m.name for m in _fast_iter_modules()}
+            assert "pyflyby_ttl_new" in names
+    finally:
+        sys.path.remove(str(moddir))
+        sys.path_importer_cache.pop(str(moddir), None)
+        _module_indexes.clear()
+
+
+def test_missing_modules_cache_bounded():
+    clear_missing_modules_cache()
+    with mock.patch("pyflyby._modules._MISSING_MODULES_SIZE", 2):
+        for name in ["pyflyby_missing_a", "pyflyby_missing_b",
+                     "pyflyby_missing_c"]:
+            record_missing_module(name)
+    assert not is_known_missing_module("pyflyby_missing_a")
+    assert is_known_missing_module("pyflyby_missing_b")
+    assert is_known_missing_module("pyflyby_missing_c")
+    with mock.patch("importlib.util.find_spec") as mock_find_spec:
+        assert not ModuleHandle("pyflyby_missing_c").exists
+    mock_find_spec.assert_not_called()
+    clear_missing_modules_cache()
+    assert not is_known_missing_module("pyflyby_missing_c")
+
+
+def test_scan_directories():
+    """_scan_directories lists each directory like _iter_file_finder_modules."""
+    paths = [p for p in sys.path if os.path.isdir(p)] + ["/nonexistent/pyflyby"]
+    result = _scan_directories(paths, SUFFIXES, 4)
+    assert len(result) == len(paths)
+    for path, (mtime_ns, modules) in zip(paths[:-1], result):
+        assert mtime_ns == os.stat(path).st_mtime_ns
+        importer = mock.Mock(path=path)
+        assert sorted(modules) == sorted(_iter_file_finder_modules(importer, SUFFIXES))
+    assert result[-1] == (-1, [])
+
+
+@mock.patch("platformdirs.user_cache_dir")
+def test_import_cache_corrupt_index(mock_user_cache_dir, tmp_path):
+    """A corrupt module index is ignored and rewritten."""
+    mock_user_cache_dir.return_value = tmp_path
+    (tmp_path / "modules.idx").write_bytes(b"not a marshal blob")
+    fast = sorted(_fast_iter_modules(), key=lambda x: x.name)
+    assert fast == sorted(iter_modules(), key=lambda x: x.name)
+    assert len(_ModuleIndex(tmp_path / "modules.idx").rows) > 0
+
+def _make_package_tree(root):
+    (root / "pyflyby_tree_pkg" / "sub").mkdir(parents=True)
+    (root / "pyflyby_tree_pkg" / "__init__.py").write_text("")
+    (root / "pyflyby_tree_pkg" / "mod.py").write_text("")
+    (root / "pyflyby_tree_pkg" / "sub" / "__init__.py").write_text("")
+    (root / "pyflyby_tree_pkg" / "sub" / "leaf.py").write_text("")
+    # Not a package: no __init__.py.
+    (root / "pyflyby_tree_pkg" / "data").mkdir()
+    (root / "pyflyby_tree_pkg" / "data" / "x.py").write_text("")
+
+
+@mock.patch("platformdirs.user_cache_dir")
+def test_index_lookup_no_import(mock_user_cache_dir, tmp_path):
+    """Submodules are found in the module index without importing parents."""
+    mock_user_cache_dir.return_value = tmp_path / "cache"
+    _make_package_tree(tmp_path)
+    sys.path.insert(0, str(tmp_path))
+    try:
+        assert _index_lookup("pyflyby_tree_pkg.sub.leaf") == (
+            str(tmp_path / "pyflyby_tree_pkg" / "sub" / "leaf"), False)
+        assert _index_lookup("pyflyby_tree_pkg.sub") == (
+            str(tmp_path / "pyflyby_tree_pkg" / "sub"), True)
+        assert _index_lookup("pyflyby_tree_pkg.data") is None
+        assert _index_lookup("pyflyby_tree_pkg.mod.x") is None
+        assert ModuleHandle("pyflyby_tree_pkg.sub.leaf").exists
+        assert [str(m.name) for m in ModuleHandle("pyflyby_tree_pkg").submodules] == [
+            "pyflyby_tree_pkg.mod", "pyflyby_tree_pkg.sub"]
+        assert "pyflyby_tree_pkg" not in sys.modules
+        # A new submodule is found once its directory's mtime changes.
+        (tmp_path / "pyflyby_tree_pkg" / "sub" / "new.py").write_text("")
+        os.utime(tmp_path / "pyflyby_tree_pkg" / "sub",
+                 ns=(0, os.stat(tmp_path / "pyflyby_tree_pkg" / "sub").st_mtime_ns + 10**9))
+        assert _index_lookup("pyflyby_tree_pkg.sub.new") is not None
+        # The package directories looked up were stored in the index, and are
+        # only written to the file at exit.
+        index_filename = tmp_path / "cache" / "modules.idx"
+        assert not index_filename.exists()
+        _module_indexes[index_filename].flush()
+        rows = _ModuleIndex(index_filename).rows
+        assert str(tmp_path / "pyflyby_tree_pkg" / "sub") in rows
+    finally:
+        sys.path.remove(str(tmp_path))
+        sys.path_importer_cache.pop(str(tmp_path), None)
+        for name in list(ModuleHandle._cls_cache):
+            if str(name).startswith("pyflyby_tree_pkg"):
+                del ModuleHandle._cls_cache[name]
+
+
+def test_prefetch_modules_no_import(tmp_path):
+    """Prefetching finds modules in several packages without importing them."""
+    _make_package_tree(tmp_path)
+    (tmp_path / "pyflyby_prefetch_other.py").write_text("")
+    sys.path.insert(0, str(tmp_path))
+    try:
+        prefetch_modules(["pyflyby_tree_pkg.sub.leaf.attr",
+                          "pyflyby_prefetch_other", "pyflyby_tree_pkg.nope"])
+        assert "pyflyby_tree_pkg" not in sys.modules
+        assert "pyflyby_prefetch_other" not in sys.modules
+        for name in ["pyflyby_tree_pkg", "pyflyby_tree_pkg.sub",
+                     "pyflyby_tree_pkg.sub.leaf", "pyflyby_prefetch_other"]:
+            assert ModuleHandle(name).__dict__.get("_exists"), name
+        assert not ModuleHandle("pyflyby_tree_pkg.nope").__dict__.get("_exists")
+    finally:
+        sys.path.remove(str(tmp_path))
+        sys.path_importer_cache.pop(str(tmp_path), None)
+        for name in list(ModuleHandle._cls_cache):
+            if str(name).startswith(("pyflyby_tree_pkg", "pyflyby_prefetch")):
+                del ModuleHandle._cls_cache[name]
+
 
 @mock.patch.dict(os.environ, {"PYFLYBY_DISABLE_CACHE": "1"})
 @mock.patch("platformdirs.user_cache_dir")
@@ -190,6 +190,20 @@ def test_print_version_module_1():
     assert result == json.__version__
 
 
+def test_import_cache_stats_1():
+    # 'py --import-cache-stats' lists modules, then prints a table of the
+    # sys.path entries it looked up.
+    result, retcode = py("--import-cache-stats")
+    assert retcode == 0
+    lines = result.splitlines()
+    assert lines[0].split() == ["hits", "misses", "trusted", "entries",
+                                "scan", "ms",
+                                "stat", "ms", "path"]
+    assert any(line.split()[-1].endswith("site-packages")
+               for line in lines[1:-2])
+    assert lines[-2].startswith("Read ")
+
+
 @pytest.mark.skipif(sys.version_info < (3, 12), reason="return 0 on older python")
 def test_print_version_module_no_version_attr_1():
     # A module without a __version__ attribute reports an informative error.